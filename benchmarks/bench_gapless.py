@@ -0,0 +1,133 @@
+"""
+Checks that PlaybackEngine switches tracks without a gap. Two tracks that
+continue one sine wave are played back to back (and one track on repeat)
+through an offline stream that pulls blocks from the engine callback; the
+rendered audio must equal the tracks concatenated, sample for sample. A
+third case continues the wave in a 48 kHz file, which the engine resamples
+to the 44.1 kHz stream: it must follow the wave within the resampler's
+error, with no missing frames.
+
+    python -m benchmarks.bench_gapless --block 512
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from utils.playback import PlaybackEngine
+
+SAMPLERATE = 44100
+
+
+class OfflineStream:
+    """
+    Stands in for sd.OutputStream: render() calls the engine callback like
+    PortAudio would, but waits for the decoder instead of running in real
+    time, so every missing sample is a real gap and not a slow machine.
+    """
+
+    def __init__(self, samplerate, channels, dtype, callback):
+        self.channels = channels
+        self.callback = callback
+        self.active = False
+        self.engine = None
+
+    def start(self):
+        self.active = True
+
+    def stop(self):
+        self.active = False
+
+    def close(self, ignore_errors=True):
+        pass
+
+    def render(self, frames, blocksize):
+        blocks = []
+        for _ in range(0, frames, blocksize):
+            deadline = time.monotonic() + 5
+            while (self.engine._ring.readable() < blocksize and self.engine._source is not None
+                   and time.monotonic() < deadline):
+                time.sleep(0.0005)
+            outdata = np.empty((blocksize, self.channels), dtype='float32')
+            self.callback(outdata, blocksize, None, None)
+            blocks.append(outdata)
+        return np.concatenate(blocks)[:frames]
+
+
+def _tone(start_seconds, frames, rate):
+    t = start_seconds + np.arange(frames) / rate
+    tone = (0.5 * np.sin(2 * np.pi * 440 * t)).astype('float32')
+    return np.column_stack((tone, tone))
+
+
+def _write_tone(path, start, frames, rate=SAMPLERATE):
+    tone = _tone(start / SAMPLERATE, frames, rate)
+    sf.write(path, tone, rate, subtype='FLOAT')
+    return tone
+
+
+def _gap_frames(rendered, expected, tolerance):
+    """Length of the longest run of frames where rendered deviates from expected."""
+    bad = np.any(np.abs(rendered - expected) > tolerance, axis=1)
+    longest = run = 0
+    for value in bad:
+        run = run + 1 if value else 0
+        longest = max(longest, run)
+    return longest
+
+
+def run_case(name, paths, tracks, blocksize, tolerance=1e-6):
+    streams = []
+    changes = []
+
+    def factory(**kwargs):
+        streams.append(OfflineStream(**kwargs))
+        return streams[-1]
+
+    engine = PlaybackEngine(on_track_changed=changes.append, stream_factory=factory, output_rate=SAMPLERATE)
+    engine.play(paths[0])
+    engine.queue_next(paths[1])
+    streams[-1].engine = engine
+    # Следующий трек открывается в потоке декодера
+    deadline = time.monotonic() + 5
+    while engine._queued is None and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+    expected = np.concatenate(tracks)
+    rendered = streams[-1].render(len(expected), blocksize)
+    engine.close()
+    gap = _gap_frames(rendered, expected, tolerance)
+    print(f"{name:>12}: {len(streams)} stream(s) opened, {engine.transitions} transition(s), "
+          f"gap {gap} frames, track_changed={len(changes)}, underruns {engine.underruns}")
+    return gap
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--block', type=int, default=512)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Длина первого трека не кратна блоку: переход внутри блока
+        first_frames = SAMPLERATE * 2 + 123
+        a_path, b_path = os.path.join(tmp, 'a.wav'), os.path.join(tmp, 'b.wav')
+        c_path = os.path.join(tmp, 'c_48k.wav')
+        a = _write_tone(a_path, 0, first_frames)
+        b = _write_tone(b_path, first_frames, SAMPLERATE)
+        _write_tone(c_path, first_frames, 48000, rate=48000)
+        # Так звучит 48-килогерцовое продолжение в потоке 44.1 кГц
+        c = _tone(first_frames / SAMPLERATE, SAMPLERATE, SAMPLERATE)
+        gaps = [
+            run_case('next track', [a_path, b_path], [a, b], args.block),
+            run_case('repeat one', [a_path, a_path], [a, a], args.block),
+            # Фильтр ресемплера начинается заново на новой частоте: первый кадр отличается на ~0.02
+            run_case('48k -> 44.1k', [a_path, c_path], [a, c], args.block, tolerance=0.05),
+        ]
+    print("OK: sample-exact transitions" if not any(gaps) else "FAIL: gap detected")
+
+
+if __name__ == '__main__':
+    main()
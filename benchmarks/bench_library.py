@@ -0,0 +1,270 @@
+"""
+Scan and browse paths on synthetic Songs folders of growing size, with
+storyboard trees, missing backgrounds, odd .osu encodings and tiny silent
+audio files (see synthetic_library). For each size it reports:
+
+    cold scan     scan_songs without a library cache; the better of two runs,
+                  so the OS file cache is warm in both the compared runs
+    parse         parse_osu_file per .osu file, on a sample of the library
+    cache load    opening the library cache and reading every folder record
+    warm scan     scan_songs with an up-to-date cache, i.e. a normal launch
+    populate      OsuPlayerApp.set_library() with the whole library, until
+                  the list has been laid out
+    filter        filter_song_list() per query, until the list is laid out
+    peak RSS      of the process of each phase
+
+Each phase runs in a fresh interpreter, so imports and peak memory are not
+shared between them. Results are saved as JSON (with the commit they were
+measured on) and can be compared with an earlier run:
+
+    python -m benchmarks.bench_library --sets 1000 10000 --output before.json
+    python -m benchmarks.bench_library --sets 1000 10000 --compare before.json
+
+--workdir keeps the generated libraries, so runs on different commits
+measure the same files. The browse phase needs PyQt6 and runs offscreen.
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_library import generate_library
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERIES = ['a', 'artist 1', 'song 12', 'ωmega', 'pokemon', 'xyzzy']
+PARSE_SAMPLE = 3000
+# (ключ в результатах, подпись, единица) для таблицы и сравнения
+METRICS = [
+    ('cold_scan_s', 'cold scan', 's'),
+    ('parse_us', 'parse per .osu', 'us'),
+    ('cache_load_s', 'cache load', 's'),
+    ('warm_scan_s', 'warm scan', 's'),
+    ('populate_ms', 'populate', 'ms'),
+    ('filter_max_ms', 'filter, slowest query', 'ms'),
+    ('cold_peak_mb', 'peak RSS, cold scan', 'MB'),
+    ('warm_peak_mb', 'peak RSS, warm scan', 'MB'),
+    ('browse_peak_mb', 'peak RSS, browse', 'MB'),
+]
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux считает в КБ, macOS в байтах
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def _phase_cold(songs_dir, cache_path, workers):
+    from utils.library_store import open_library_store
+    from utils.osu_parser import parse_osu_file
+    from utils.scanner import scan_songs
+
+    # Вместе с резервной копией: иначе кэш читается из неё
+    open_library_store(cache_path).remove()
+    start = time.perf_counter()
+    library = scan_songs(songs_dir, workers=workers, cache_path=cache_path)
+    cold = time.perf_counter() - start
+
+    sample = sorted(glob.glob(os.path.join(glob.escape(songs_dir), '*', '*.osu')))[:PARSE_SAMPLE]
+    start = time.perf_counter()
+    for path in sample:
+        parse_osu_file(path)
+    parse = (time.perf_counter() - start) / max(1, len(sample))
+    return {'songs': len(library), 'cold_scan_s': cold, 'parse_us': parse * 1e6, 'cold_peak_mb': _peak_rss_mb()}
+
+
+def _phase_warm(songs_dir, cache_path, workers):
+    from utils.library_store import open_library_store
+    from utils.scanner import _load_cache, scan_songs
+
+    start = time.perf_counter()
+    folders, _ = _load_cache(open_library_store(cache_path))
+    cache_load = time.perf_counter() - start
+    folder_count = len(folders)
+    # Пик памяти — от самого сканирования, а не от копии кэша, прочитанной для замера
+    del folders
+    start = time.perf_counter()
+    library = scan_songs(songs_dir, workers=workers, cache_path=cache_path)
+    warm = time.perf_counter() - start
+    return {'folders': folder_count, 'warm_songs': len(library), 'cache_load_s': cache_load, 'warm_scan_s': warm,
+            'warm_peak_mb': _peak_rss_mb()}
+
+
+def _phase_browse(songs_dir, cache_path, workers):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtWidgets import QApplication
+
+    import main
+    from utils.scanner import scan_songs
+
+    library = scan_songs(songs_dir, workers=workers, cache_path=cache_path)
+    app = QApplication([])
+    window = main.create_window({'engine_process': False})
+    # Замеряется список, а не звук: движок после первой отрисовки не создаётся
+    window._audio_scheduled = True
+    window.show()
+    app.processEvents()
+
+    start = time.perf_counter()
+    window.set_library(library)
+    app.processEvents()
+    populate = time.perf_counter() - start
+    # Фильтр работает по поисковому индексу, который строится в фоне
+    while window.index_workers:
+        app.processEvents()
+        time.sleep(0.005)
+    app.processEvents()
+
+    filter_ms = {}
+    filter_rows = {}
+    for query in QUERIES:
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            window.filter_song_list(query)
+            app.processEvents()
+            times.append((time.perf_counter() - start) * 1000)
+            filter_rows[query] = window.song_proxy_model.rowCount()
+            window.filter_song_list('')
+            app.processEvents()
+        filter_ms[query] = min(times)
+    window.close()
+    return {'populate_ms': populate * 1000, 'filter_ms': filter_ms, 'filter_rows': filter_rows,
+            'filter_max_ms': max(filter_ms.values()),
+            'browse_peak_mb': _peak_rss_mb()}
+
+
+PHASES = {'cold': _phase_cold, 'warm': _phase_warm, 'browse': _phase_browse}
+
+
+def _run_phase(phase, songs_dir, cache_path, workers):
+    out = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_library', '--phase', phase, '--songs-dir', songs_dir,
+         '--cache', cache_path, '--workers', str(workers)],
+        cwd=REPO_DIR, capture_output=True, text=True)
+    if out.returncode:
+        print(f"{phase} phase failed:\n{out.stderr.strip()}")
+        return {}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _library(workdir, sets, storyboard_files):
+    """Generated library for the size, reused from workdir when a complete one is there."""
+    songs_dir = os.path.join(workdir, f'Songs-{sets}-sb{storyboard_files}')
+    marker = os.path.join(songs_dir, '.complete')
+    if not os.path.exists(marker):
+        shutil.rmtree(songs_dir, ignore_errors=True)
+        start = time.perf_counter()
+        generate_library(songs_dir, sets, storyboard_files=storyboard_files, odd_encodings=True)
+        open(marker, 'w').close()
+        print(f"generated {sets} sets in {time.perf_counter() - start:.1f} s")
+    return songs_dir
+
+
+def _commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def _format(value, unit):
+    if value is None:
+        return '-'
+    return f"{value:.3f} {unit}" if unit == 's' else f"{value:.1f} {unit}"
+
+
+def _print_results(results, previous=None):
+    before = {result['sets']: result for result in previous['results']} if previous else {}
+    for result in results:
+        old = before.get(result['sets'], {})
+        print(f"\n{result['sets']} sets, {result.get('songs', '?')} songs")
+        for key, label, unit in METRICS:
+            line = f"  {label:<24} {_format(result.get(key), unit):>12}"
+            if old.get(key) and result.get(key) is not None:
+                line += f"   was {_format(old[key], unit):>12}  ({result[key] / old[key]:.2f}x)"
+            print(line)
+        filters = result.get('filter_ms') or {}
+        rows = result.get('filter_rows') or {}
+        if filters:
+            print('  filter per query, ms (rows)  ' + ', '.join(f"{query!r} {ms:.1f} ({rows.get(query, '?')})"
+                                                              for query, ms in filters.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sets', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--storyboard-files', type=int, default=100,
+                        help="sprites in the sb/ tree of every fourth set")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--workdir', help="keep generated libraries here and reuse them")
+    parser.add_argument('--output', help="JSON file for the results (default bench_library-<commit>.json)")
+    parser.add_argument('--compare', help="JSON file of an earlier run to compare with")
+    parser.add_argument('--phase', choices=sorted(PHASES), help=argparse.SUPPRESS)
+    parser.add_argument('--songs-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--cache', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        print(json.dumps(PHASES[args.phase](args.songs_dir, args.cache, args.workers)))
+        return
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    commit, dirty = _commit()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='osuradio-bench-')
+    results = []
+    try:
+        for sets in args.sets:
+            songs_dir = _library(workdir, sets, args.storyboard_files)
+            cache_path = os.path.join(workdir, f'cache-{sets}.db')
+            result = {'sets': sets}
+            # Первый холодный прогон после генерации платит за чтение каталогов с диска
+            colds = [_run_phase('cold', songs_dir, cache_path, args.workers) for _ in range(2)]
+            result.update(min(colds, key=lambda cold: cold.get('cold_scan_s', float('inf'))))
+            for phase in ('warm', 'browse'):
+                result.update(_run_phase(phase, songs_dir, cache_path, args.workers))
+            results.append(result)
+            print(f"{sets} sets done")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'workers': args.workers,
+        'storyboard_files': args.storyboard_files,
+        'results': results,
+    }
+    output = args.output or f"bench_library-{commit or 'unknown'}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    if previous:
+        print(f"\ncompared with {previous.get('commit')} ({previous.get('date')})")
+    _print_results(results, previous)
+    print(f"\nsaved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Compares the JSON and SQLite library stores: file size, full load time and
+a partial query on a synthetic cache with N folders.
+
+    python -m benchmarks.bench_library_store --folders 40000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from utils.library_store import JsonLibraryStore, SqliteLibraryStore
+from utils.scanner import CACHE_VERSION
+
+
+def make_cache_data(num_folders):
+    folders = {}
+    for i in range(num_folders):
+        root = os.path.join('D:/osu!/Songs', f"{100000 + i} Artist {i % 5000} - Song {i}")
+        artist, title = f"Artist {i % 5000}", f"Song {i}"
+        folders[root] = {
+            'osu_stat': [[f"{artist} - {title} (mapper) [{version}].osu", 1700000000.0 + i, 12000 + i]
+                         for version in ('Easy', 'Normal', 'Hard')],
+            'entries': [{
+                'audio_path': os.path.join(root, 'audio.mp3'),
+                'audio_stat': [1700000000.0 + i, 4000000 + i],
+                'hash': f"{i:032x}",
+                'full_hash': None,
+                'duplicate_of': None,
+                'deferred': None,
+                'song': {
+                    'artist': artist,
+                    'title': title,
+                    'audio_path': os.path.join(root, 'audio.mp3'),
+                    'background_path': os.path.join(root, 'bg.jpg') if i % 3 else None,
+                    'bpm': 120 + i % 120,
+                    'display_text': f"{artist} - {title}",
+                    'artist_unicode': '',
+                    'title_unicode': '',
+                    'creator': 'mapper',
+                    'source': '',
+                    'tags': f"tag{i % 100} pack",
+                    'duration': 180.0 + i % 60,
+                    'samplerate': 44100,
+                    'channels': 2,
+                    'codec': 'mp3',
+                    'file_size': 4000000 + i,
+                    **({'loudness': {'lufs': -9.5 - i % 5, 'peak': 0.98}} if i % 2 else {}),
+                },
+            }],
+            'error': None,
+        }
+    return {'version': CACHE_VERSION, 'songs_dir': 'D:/osu!/Songs', 'folders': folders}
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--folders', type=int, default=40000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_cache_data(args.folders)
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = [
+            ('json', JsonLibraryStore(os.path.join(tmp, 'song_cache.json'))),
+            ('sqlite', SqliteLibraryStore(os.path.join(tmp, 'song_cache.db'))),
+        ]
+        print(f"{'store':>7} {'size, MB':>9} {'save, s':>8} {'load, s':>8} {'query 50, ms':>13}")
+        for name, store in stores:
+            save_time = best_time(lambda: store.save(data), args.repeat)
+            assert store.load() == data, f"{name} store did not round-trip the cache"
+            load_time = best_time(store.load, args.repeat)
+            query_time = best_time(lambda: store.query_songs('artist 42', limit=50), args.repeat)
+            size_mb = os.path.getsize(store.path) / 1024 / 1024
+            print(f"{name:>7} {size_mb:>9.2f} {save_time:>8.3f} {load_time:>8.3f} {query_time * 1000:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Loudness analysis throughput: tracks per minute measured in one process
+and in a pool of background workers (as after a library scan), plus a
+check against the BS.1770 reference level (a full-scale 1 kHz sine in one
+channel reads -3.01 LUFS) and of the playback gain that brings tracks
+mastered at different levels to the target.
+
+    python -m benchmarks.bench_loudness --tracks 16 --seconds 120 --workers 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from utils.loudness import DEFAULT_TARGET_LUFS, measure_file, track_gain
+from utils.scanner import analyze_loudness
+
+SAMPLERATE = 44100
+
+
+def _write_track(path, seconds, level, seed):
+    rng = np.random.default_rng(seed)
+    with sf.SoundFile(path, 'w', SAMPLERATE, 2) as out:
+        # Vorbis-кодировщик libsndfile падает на больших буферах: пишем по секунде
+        for second in range(int(seconds)):
+            t = (second * SAMPLERATE + np.arange(SAMPLERATE)) / SAMPLERATE
+            tone = np.sin(2 * np.pi * (110 + 30 * seed) * t) * 0.5 + rng.standard_normal(SAMPLERATE) * 0.2
+            out.write((np.column_stack((tone, tone)) * level).astype('float32'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tracks', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=120.0)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reference = os.path.join(tmp, 'sine.wav')
+        t = np.arange(10 * SAMPLERATE) / SAMPLERATE
+        sf.write(reference, np.column_stack((np.sin(2 * np.pi * 1000 * t), np.zeros_like(t))), SAMPLERATE,
+                 subtype='FLOAT')
+        print(f"1 kHz full-scale sine, one channel: {measure_file(reference)['lufs']:.3f} LUFS (reference -3.01)")
+
+        levels = [10 ** (-db / 20) for db in np.linspace(0, 18, args.tracks)]
+        paths = []
+        for i, level in enumerate(levels):
+            path = os.path.join(tmp, f'track{i}.ogg')
+            _write_track(path, args.seconds, level, i)
+            paths.append(path)
+
+        start = time.perf_counter()
+        results = {path: measure_file(path) for path in paths}
+        serial = time.perf_counter() - start
+
+        songs = [{'audio_path': path} for path in paths]
+        start = time.perf_counter()
+        analyze_loudness(tmp, songs, workers=args.workers, cache_path=None)
+        pooled = time.perf_counter() - start
+
+    minutes = args.tracks * args.seconds / 60
+    print(f"{args.tracks} OGG tracks x {args.seconds:.0f} s")
+    print(f"{'':>12} {'s':>7} {'tracks/min':>11} {'audio x realtime':>17}")
+    for name, elapsed in (('1 process', serial), (f'{args.workers} workers', pooled)):
+        print(f"{name:>12} {elapsed:7.2f} {args.tracks / elapsed * 60:11.0f} {minutes * 60 / elapsed:17.0f}")
+
+    loudness = [results[path]['lufs'] for path in paths]
+    normalized = [lufs + 20 * np.log10(track_gain(results[path], DEFAULT_TARGET_LUFS))
+                  for path, lufs in zip(paths, loudness)]
+    print(f"measured {min(loudness):.1f} .. {max(loudness):.1f} LUFS, "
+          f"after gain {min(normalized):.1f} .. {max(normalized):.1f} LUFS (target {DEFAULT_TARGET_LUFS:.0f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+Library import from osu!.db against a full scan of the .osu files.
+
+First checks the reader on the fixtures in benchmarks/fixtures/: the
+databases in osu_db_records.txt, assembled by hand from the documented
+format, one per layout, and the osu-VERSION.db files synthetic_library
+writes, which must give back FIXTURE_BEATMAPS. Then generates a synthetic library with an osu!.db (by default 10000 sets
+of 5 difficulties, 50k maps; every OSU_DB_MISSING_EVERY-th set is left out
+of the database and goes through the parser) and reports, best of a few
+runs:
+
+    read osu!.db      iterating all beatmaps with read_osu_db
+    load osu!.db      the scanner's index of it (_load_osu_db)
+    scan, .osu        scan_songs without a library cache, parsing every .osu
+    scan, osu!.db     the same with use_osu_db: the library comes from the
+                      database alone, without backgrounds, durations and
+                      hashes
+    stale, osu!.db    use_osu_db with a cache of an older entry version, as
+                      after an update: every folder is parsed again, but the
+                      audio files keep their cached hashes and stream info
+
+plus the .osu files each scan opened, the audio files it hashed and probed,
+and, for the osu!.db scans, how long the background pass (complete_songs)
+took to fill in the rest. The library of the .osu scan is compared with
+the osu!.db one after that pass.
+By default the files are in the OS file cache, as in a rescan;
+--drop-caches empties it before every run (Linux, as root) to measure the
+first launch after a reboot, where opening every .osu file costs a disk read.
+
+    python -m benchmarks.bench_osu_db --sets 10000 --difficulties 5 [--drop-caches]
+    python -m benchmarks.bench_osu_db --write-fixtures
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.synthetic_library import generate_library, write_osu_db
+from utils import scan_profile
+from utils.library_store import open_library_store
+from utils.osu_db import FLOAT_DIFFICULTY_VERSION, FLOAT_STAR_RATING_VERSION, NO_ENTRY_SIZE_VERSION, read_osu_db
+from utils.scanner import ENTRY_VERSION, _load_osu_db, complete_songs, scan_songs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+RECORDS_PATH = os.path.join(FIXTURES_DIR, 'osu_db_records.txt')
+# Последняя версия каждой раскладки перед сменой и первая после
+FIXTURE_VERSIONS = (FLOAT_DIFFICULTY_VERSION - 1, FLOAT_DIFFICULTY_VERSION, NO_ENTRY_SIZE_VERSION - 1,
+                    NO_ENTRY_SIZE_VERSION, FLOAT_STAR_RATING_VERSION)
+FIXTURE_BEATMAPS = [
+    {'artist': 'YOASOBI', 'artist_unicode': 'YOASOBI', 'title': 'Yoru ni Kakeru', 'title_unicode': '夜に駆ける',
+     'creator': 'mapper', 'difficulty': 'Insane', 'audio_filename': 'audio.mp3',
+     'md5': '0123456789abcdef0123456789abcdef', 'osu_file': 'YOASOBI - Yoru ni Kakeru (mapper) [Insane].osu',
+     'source': '', 'tags': 'j-pop ' + ' '.join(f'tag{i}' for i in range(40)),
+     'folder': '1001 YOASOBI - Yoru ni Kakeru', 'ranked_status': 4, 'mode': 0, 'beatmap_id': 2001,
+     'beatmapset_id': 1001, 'modified': 1700000000.5, 'drain_time': 245, 'total_time': 258000,
+     'preview_time': 62000, 'beat_length': 461.53846153846155},
+    {'artist': 'Camellia', 'artist_unicode': None, 'title': 'Ωmega Rhythm', 'title_unicode': None,
+     'creator': 'someone', 'difficulty': 'Extra', 'audio_filename': 'Ωmega.ogg', 'md5': None,
+     'osu_file': 'Camellia - Omega Rhythm (someone) [Extra].osu', 'source': None, 'tags': None,
+     'folder': 'Packs\\1002 Camellia - Omega Rhythm', 'ranked_status': 2, 'mode': 3, 'beatmap_id': 0,
+     'beatmapset_id': -1, 'modified': 1300000000.0, 'drain_time': 0, 'total_time': 0, 'preview_time': -1,
+     'beat_length': None},
+    {'artist': '', 'artist_unicode': '', 'title': '', 'title_unicode': '', 'creator': '', 'difficulty': '',
+     'audio_filename': '', 'md5': 'ffffffffffffffffffffffffffffffff', 'osu_file': 'untitled.osu', 'source': 'é' * 200,
+     'tags': '', 'folder': 'untitled', 'ranked_status': 0, 'mode': 1, 'beatmap_id': 3, 'beatmapset_id': 3,
+     'modified': 0.0, 'drain_time': 1, 'total_time': 2, 'preview_time': 3, 'beat_length': 250.0},
+]
+
+
+def _fixture_path(version):
+    return os.path.join(FIXTURES_DIR, f'osu-{version}.db')
+
+
+def write_fixtures():
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for version in FIXTURE_VERSIONS:
+        write_osu_db(_fixture_path(version), FIXTURE_BEATMAPS, version)
+        print(f"wrote {_fixture_path(version)}")
+
+
+def read_record_dumps(path=RECORDS_PATH):
+    """The databases of an annotated hex dump (see osu_db_records.txt) as [(version, bytes, expected beatmaps)]."""
+    databases = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('@'):
+                databases.append((int(line.split()[1]), bytearray(), []))
+            elif line.startswith('='):
+                databases[-1][2].append(json.loads(line[1:]))
+            elif line.strip() and not line.startswith('#'):
+                databases[-1][1].extend(bytes.fromhex(line.split('|')[0]))
+    return databases
+
+
+def _matches(label, path, expected):
+    """Whether the osu!.db at path yields the expected beatmaps; prints what differs."""
+    try:
+        beatmaps = list(read_osu_db(path))
+    except (OSError, ValueError) as e:
+        print(f"  {label}: {e}")
+        return False
+    if beatmaps == expected:
+        return True
+    if len(beatmaps) != len(expected):
+        print(f"  {label}: {len(beatmaps)} beatmaps, expected {len(expected)}")
+    for got, want in zip(beatmaps, expected):
+        for key in want:
+            if got.get(key) != want[key]:
+                print(f"  {label}: {key} is {got.get(key)!r}, expected {want[key]!r}")
+    return False
+
+
+def check_fixtures():
+    """Reads every fixture database; returns the labels of those that do not give back what they should."""
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for version, data, expected in read_record_dumps():
+            path = os.path.join(tmp, f'osu-{version}.db')
+            with open(path, 'wb') as f:
+                f.write(data)
+            if not _matches(f'osu_db_records.txt {version}', path, expected):
+                failed.append(f'osu_db_records.txt {version}')
+    for version in FIXTURE_VERSIONS:
+        if not _matches(f'osu-{version}.db', _fixture_path(version), FIXTURE_BEATMAPS):
+            failed.append(f'osu-{version}.db')
+    return failed
+
+
+def _best(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _drop_caches():
+    os.sync()
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+
+def _profiled_scan(songs_dir, cache_path, use_osu_db, drop_caches=False, stale=False):
+    store = open_library_store(cache_path)
+    store.remove()
+    if stale:
+        scan_songs(songs_dir, cache_path=cache_path, use_osu_db=False)
+        # Кэш прежней версии записей: папки разбираются заново, аудиофайлы в нём уже есть
+        cache_data = store.load()
+        cache_data['entry_version'] = ENTRY_VERSION - 1
+        store.save(cache_data)
+    if drop_caches:
+        _drop_caches()
+    profile = scan_profile.ScanProfile(songs_dir)
+    start = time.perf_counter()
+    library = profile.run(lambda: scan_songs(songs_dir, cache_path=cache_path, use_osu_db=use_osu_db))
+    seconds = time.perf_counter() - start
+    counts = dict(profile.counts)
+    for name in ('parse/hash', 'parse/probe'):
+        counts[name] = profile.phases.get(name, (0, 0, 0))[2]
+    complete_time = None
+    if use_osu_db:
+        start = time.perf_counter()
+        complete_songs(songs_dir, cache_path=cache_path)
+        complete_time = time.perf_counter() - start
+        # Библиотека, какой она становится после фонового прохода; все папки уже в кэше
+        library = scan_songs(songs_dir, cache_path=cache_path)
+    return seconds, library, counts, complete_time
+
+
+def _best_scan(repeat, *args, **kwargs):
+    """
+    Best of repeat _profiled_scan runs: (seconds, library, counts, background
+    pass seconds); preparing the stale cache is not timed.
+    """
+    return min((_profiled_scan(*args, **kwargs) for _ in range(repeat)), key=lambda run: run[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sets', type=int, default=10000)
+    parser.add_argument('--difficulties', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--workdir', help="keep the generated library here and reuse it")
+    parser.add_argument('--drop-caches', action='store_true',
+                        help="empty the OS file cache before every run (Linux, needs root)")
+    parser.add_argument('--write-fixtures', action='store_true', help="rewrite the fixture databases and exit")
+    args = parser.parse_args()
+
+    if args.write_fixtures:
+        write_fixtures()
+        return
+    failed = check_fixtures()
+    if failed:
+        raise SystemExit(f"fixtures read wrong: {', '.join(failed)}")
+    dumped = ', '.join(str(version) for version, _, _ in read_record_dumps())
+    print(f"fixtures: hex dumps of versions {dumped} and written versions "
+          f"{', '.join(map(str, FIXTURE_VERSIONS))} read as expected")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='osuradio-bench-')
+    try:
+        root = os.path.join(workdir, f'osu-{args.sets}x{args.difficulties}')
+        songs_dir = os.path.join(root, 'Songs')
+        db_path = os.path.join(root, 'osu!.db')
+        if not os.path.exists(db_path):
+            shutil.rmtree(root, ignore_errors=True)
+            start = time.perf_counter()
+            # Строки нот парсер не читает: короткие .osu экономят место на диске
+            generate_library(songs_dir, args.sets, difficulties=args.difficulties, hit_objects=20,
+                             odd_encodings=True, osu_db_version=20240820)
+            print(f"generated {args.sets} sets in {time.perf_counter() - start:.1f} s")
+        cache_path = os.path.join(workdir, 'cache.db')
+        db_size = os.path.getsize(db_path)
+
+        def read():
+            if args.drop_caches:
+                _drop_caches()
+            return sum(1 for _ in read_osu_db(db_path))
+
+        read_time, maps = _best(read, args.repeat)
+        load_time, _ = _best(lambda: _load_osu_db(songs_dir), args.repeat)
+        if not args.drop_caches:
+            # Первый прогон прогревает файловый кэш ОС для обоих
+            _profiled_scan(songs_dir, cache_path, False)
+        scan_time, parsed_library, parsed_counts, _ = _best_scan(args.repeat, songs_dir, cache_path, False,
+                                                                args.drop_caches)
+        db_scan_time, db_library, db_counts, db_complete_time = _best_scan(args.repeat, songs_dir, cache_path, True,
+                                                                           args.drop_caches)
+        stale_scan_time, _, stale_counts, stale_complete_time = _best_scan(args.repeat, songs_dir, cache_path, True,
+                                                                           args.drop_caches, stale=True)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{maps} maps in osu!.db ({db_size / 1024 / 1024:.1f} MB), {args.sets} sets, best of {args.repeat}, "
+          + ("file cache dropped" if args.drop_caches else "files cached"))
+    print(f"  read osu!.db          {read_time:8.3f} s   {maps / read_time:9.0f} maps/s")
+    print(f"  load osu!.db          {load_time:8.3f} s")
+    for label, seconds, counts, complete_time in (('scan, .osu', scan_time, parsed_counts, None),
+                                                  ('scan, osu!.db', db_scan_time, db_counts, db_complete_time),
+                                                  ('stale, osu!.db', stale_scan_time, stale_counts,
+                                                   stale_complete_time)):
+        opened = sum(counts.get(name, 0) for name in ('.osu files parsed', '.osu files read for AudioFilename',
+                                                      '.osu files read for the background'))
+        print(f"  {label:<20} {seconds:8.3f} s   {opened:9} .osu files opened, "
+              f"{counts.get('beatmaps taken from osu!.db', 0)} songs from osu!.db, "
+              f"{counts['parse/hash']} audio files hashed, {counts['parse/probe']} probed")
+        if complete_time is not None:
+            print(f"  {'':<20} {complete_time:8.3f} s   background pass for "
+                  f"{counts.get('songs completed in the background', 0)} songs")
+    print(f"  osu!.db scan / .osu scan: {db_scan_time / scan_time:.2f}x, "
+          f"stale / .osu scan: {stale_scan_time / scan_time:.2f}x")
+
+    differing = {}
+    for parsed, imported in zip(parsed_library, db_library):
+        for key in parsed.keys() | imported.keys():
+            if parsed.get(key) != imported.get(key):
+                differing[key] = differing.get(key, 0) + 1
+    print(f"  songs: {len(parsed_library)} parsed, {len(db_library)} imported; fields that differ: "
+          + (', '.join(f"{key} ({count})" for key, count in sorted(differing.items())) or 'none'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Micro-benchmark of the .osu metadata parser against the original text parser.
+
+Point --songs-dir at a real osu! Songs folder to measure real-world maps;
+without it a synthetic library is generated. Reports files/second for both
+parsers and any file whose output differs on the fields both parsers read
+(files the text parser rejects are only counted).
+
+    python -m benchmarks.bench_osu_parser --songs-dir "D:/osu!/Songs" --limit 20000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_library import generate_library
+from utils.osu_parser import REQUIRED_KEYS, parse_osu_file
+
+
+def parse_osu_file_text(filepath):
+    """The original line-by-line text parser, kept as the reference for comparisons."""
+    metadata = {}
+    in_events_section = False
+    in_timing_section = False
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+
+                if line == '[Events]':
+                    in_events_section = True
+                    in_timing_section = False
+                    continue
+                if line == '[TimingPoints]':
+                    in_timing_section = True
+                    in_events_section = False
+                    continue
+                if line.startswith('['):
+                    in_events_section = False
+                    in_timing_section = False
+                    continue
+
+                if line.startswith('AudioFilename:'):
+                    metadata['AudioFilename'] = line.split(':', 1)[1].strip()
+                elif line.startswith('Title:'):
+                    metadata['Title'] = line.split(':', 1)[1].strip()
+                elif line.startswith('Artist:'):
+                    metadata['Artist'] = line.split(':', 1)[1].strip()
+                elif in_events_section and (line.startswith('0,0,') or line.startswith('Video,') or line.startswith('1,0,')):
+                    try:
+                        parts = line.split(',')
+                        filename = parts[2].strip('"')
+                        if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+                             metadata['Background'] = filename
+                    except IndexError:
+                        continue
+                elif in_timing_section and 'BPM' not in metadata:
+                    try:
+                        parts = line.split(',')
+                        if len(parts) >= 8:
+                            beat_length_str = parts[1]
+                            uninherited = parts[6]
+                            if uninherited == '1' and float(beat_length_str) > 0:
+                                bpm = 60000 / float(beat_length_str)
+                                metadata['BPM'] = round(bpm)
+                    except (ValueError, IndexError, ZeroDivisionError):
+                        continue
+
+                if 'AudioFilename' in metadata and 'Title' in metadata and 'Artist' in metadata and 'Background' in metadata and 'BPM' in metadata:
+                    break
+    except Exception as e:
+        print(f"Error parsing file {filepath}: {e}")
+        return None
+    return metadata
+
+
+def collect_osu_files(songs_dir, limit):
+    paths = []
+    for root, dirs, files in os.walk(songs_dir):
+        paths.extend(os.path.join(root, f) for f in files if f.endswith('.osu'))
+        if len(paths) >= limit:
+            break
+    return paths[:limit]
+
+
+def time_parser(parser, paths, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [parser(path) for path in paths]
+        best = min(best, time.perf_counter() - start)
+    return best, results
+
+
+def run(paths, repeat):
+    # Прогрев файлового кэша ОС, чтобы сравнивать разбор, а не диск
+    time_parser(parse_osu_file, paths, 1)
+
+    text_time, text_results = time_parser(parse_osu_file_text, paths, repeat)
+    fast_time, fast_results = time_parser(parse_osu_file, paths, repeat)
+
+    # Поля поиска (TitleUnicode, Tags, ...) есть только у нового парсера
+    def core_fields(metadata):
+        return {key: value for key, value in metadata.items() if key in REQUIRED_KEYS}
+
+    mismatches = [path for path, old, new in zip(paths, text_results, fast_results)
+                  if old is not None and (new is None or old != core_fields(new))]
+    rescued = sum(1 for old, new in zip(text_results, fast_results) if old is None and new is not None)
+
+    print(f"{len(paths)} files")
+    print(f"text parser:  {len(paths) / text_time:>10.0f} files/s")
+    print(f"bytes parser: {len(paths) / fast_time:>10.0f} files/s ({text_time / fast_time:.1f}x)")
+    print(f"rejected by the text parser, read by the bytes parser: {rescued}")
+    print(f"mismatches: {len(mismatches)}")
+    for path in mismatches[:10]:
+        print(f"  {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--songs-dir')
+    parser.add_argument('--limit', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.songs_dir:
+        run(collect_osu_files(args.songs_dir, args.limit), args.repeat)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        songs_dir = generate_library(os.path.join(tmp, 'Songs'), max(1, args.limit // 3))
+        run(collect_osu_files(songs_dir, args.limit), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Replays a synthetic listening session (new tracks mixed with replays,
+repeat-one and going back) against the PCM cache and reports the hit rate,
+memory use and evictions for a memory budget, plus how long starting a
+track and seeking in it take on a hit and on a miss.
+
+    python -m benchmarks.bench_pcm_cache --tracks 12 --seconds 60 --plays 60 --budget-mb 64
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from utils.pcm_cache import PcmCache
+from utils.playback import DECODE_FRAMES, _Source
+
+SAMPLERATE = 44100
+
+
+def _write_tracks(folder, count, seconds):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        t = np.arange(int(seconds * SAMPLERATE)) / SAMPLERATE
+        tone = 0.3 * np.sin(2 * np.pi * (220 + 20 * i) * t) + rng.standard_normal(len(t)) * 0.05
+        path = os.path.join(folder, f'track{i}.ogg')
+        # osu! хранит музыку в mp3/ogg: декодирование — заметная часть запуска трека
+        audio = np.column_stack((tone, tone)).astype('float32')
+        with sf.SoundFile(path, 'w', SAMPLERATE, 2) as out:
+            # Vorbis-кодировщик libsndfile падает на больших буферах за один вызов
+            for offset in range(0, len(audio), SAMPLERATE):
+                out.write(audio[offset:offset + SAMPLERATE])
+        paths.append(path)
+    return paths
+
+
+def _session(paths, plays, seed=0):
+    """Track order: mostly new tracks, with replays, repeat-one and 'previous' mixed in."""
+    rng = random.Random(seed)
+    history = []
+    for _ in range(plays):
+        roll = rng.random()
+        if history and roll < 0.15:
+            path = history[-1]                       # repeat-one
+        elif len(history) > 1 and roll < 0.3:
+            path = history[-2]                       # previous track
+        elif len(history) > 3 and roll < 0.45:
+            path = rng.choice(history[-8:])          # replay of a recent track
+        else:
+            path = rng.choice(paths)
+        history.append(path)
+    return history
+
+
+def _play(path, cache):
+    """Opens path and reads the first block (start latency), then seeks to the middle and reads (seek latency)."""
+    start = time.perf_counter()
+    source = _Source(path, cache=cache)
+    source.read(DECODE_FRAMES)
+    started = time.perf_counter()
+    source.seek(source.total_frames // 2)
+    source.read(DECODE_FRAMES)
+    seeked = time.perf_counter()
+    hit = source.cached
+    if not hit:
+        # Как при обычном прослушивании: трек дочитывается до конца и попадает в кэш
+        source.seek(0)
+        while len(source.read(DECODE_FRAMES)) == DECODE_FRAMES:
+            pass
+    source.close()
+    return hit, (started - start) * 1000, (seeked - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tracks', type=int, default=12)
+    parser.add_argument('--seconds', type=float, default=60.0)
+    parser.add_argument('--plays', type=int, default=60)
+    parser.add_argument('--budget-mb', type=float, default=64.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = _write_tracks(tmp, args.tracks, args.seconds)
+        cache = PcmCache(int(args.budget_mb * 1024 * 1024))
+        timings = {True: ([], []), False: ([], [])}
+        for path in _session(paths, args.plays):
+            hit, start_ms, seek_ms = _play(path, cache)
+            timings[hit][0].append(start_ms)
+            timings[hit][1].append(seek_ms)
+
+    stats = cache.stats()
+    track_mb = args.seconds * SAMPLERATE * 2 * 2 / 1024 / 1024
+    print(f"{args.plays} plays of {args.tracks} tracks x {args.seconds:.0f} s (~{track_mb:.1f} MB each as int16), "
+          f"budget {args.budget_mb:.0f} MB")
+    print(f"hit rate {stats['hit_rate']:.0%} ({stats['hits']} hits, {stats['misses']} misses), "
+          f"{stats['entries']} tracks in {stats['bytes_used'] / 1024 / 1024:.1f} MB, {stats['evictions']} evictions")
+    print(f"{'':>6} {'plays':>6} {'start, ms':>10} {'seek, ms':>9}")
+    for hit, name in ((False, 'miss'), (True, 'hit')):
+        starts, seeks = timings[hit]
+        if starts:
+            print(f"{name:>6} {len(starts):6} {statistics.median(starts):10.2f} {statistics.median(seeks):9.3f}")
+
+
+if __name__ == '__main__':
+    main()
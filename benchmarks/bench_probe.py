@@ -0,0 +1,116 @@
+"""
+Cost of probing audio headers at scan time: per-file probe time for each
+format next to what an exact length costs by decoding the whole file, the
+probed length against the one the decoder reports on open, and the share
+of the probe in a single-process scan of a synthetic library whose sets
+carry a real MP3.
+
+    python -m benchmarks.bench_probe --minutes 4 --sets 1000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.synthetic_library import generate_library
+from utils.audio_probe import probe_audio
+from utils.scanner import scan_songs
+from utils.seek_index import scan_mp3_frames
+
+SAMPLERATE = 44100
+FORMATS = [
+    ('mp3 cbr', 'cbr.mp3', {'format': 'MP3'}),
+    ('mp3 vbr', 'vbr.mp3', {'format': 'MP3', 'bitrate_mode': 'VARIABLE'}),
+    ('ogg', 'track.ogg', {'format': 'OGG'}),
+]
+
+
+def _write_track(path, minutes, options):
+    rng = np.random.default_rng(0)
+    with sf.SoundFile(path, 'w', SAMPLERATE, 2, **options) as out:
+        # Кодировщики libsndfile падают на больших буферах: пишем по секунде
+        for second in range(int(minutes * 60)):
+            t = np.arange(SAMPLERATE) / SAMPLERATE
+            # Тишина через секунду: VBR-кодировщику есть что менять в битрейте
+            tone = (0.3 * np.sin(2 * np.pi * (220 + second % 200) * t) + rng.standard_normal(SAMPLERATE) * 0.05
+                    if second % 2 else np.zeros(SAMPLERATE))
+            out.write(np.column_stack((tone, tone)).astype('float32'))
+
+
+def _strip_vbr_header(path, out_path):
+    """Copy of an MP3 without its Xing/Info frame, like files from encoders that never wrote one."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    offsets, _ = scan_mp3_frames(data)
+    with open(out_path, 'wb') as f:
+        f.write(data[offsets[1]:])
+
+
+def _decoded_seconds(path):
+    with sf.SoundFile(path) as f:
+        frames = 0
+        while True:
+            read = len(f.read(65536, dtype='float32'))
+            if not read:
+                return frames / f.samplerate
+            frames += read
+
+
+def _best_ms(function, path, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(path)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--minutes', type=float, default=4.0)
+    parser.add_argument('--sets', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tracks = []
+        for name, filename, options in FORMATS:
+            path = os.path.join(tmp, filename)
+            _write_track(path, args.minutes, options)
+            tracks.append((name, path))
+        headerless = os.path.join(tmp, 'vbr_no_header.mp3')
+        _strip_vbr_header(os.path.join(tmp, 'vbr.mp3'), headerless)
+        tracks.append(('mp3 vbr, no header', headerless))
+
+        print(f"{args.minutes:.0f}-minute tracks, median of {args.repeat}")
+        print(f"{'format':>18} {'probe, ms':>10} {'decode, ms':>11} {'probed, s':>10} {'on open, s':>11} {'decoded, s':>11}")
+        for name, path in tracks:
+            probe_ms = _best_ms(probe_audio, path, args.repeat)
+            start = time.perf_counter()
+            decoded = _decoded_seconds(path)
+            decode_ms = (time.perf_counter() - start) * 1000
+            # Длина, которую сообщает сам декодер при открытии файла
+            reported = sf.info(path).duration
+            print(f"{name:>18} {probe_ms:10.2f} {decode_ms:11.0f} {probe_audio(path)['duration']:10.1f} "
+                  f"{reported:11.1f} {decoded:11.1f}")
+
+        for name, path in (('mp3 cbr', tracks[0][1]), ('mp3 vbr, no header', headerless)):
+            with open(path, 'rb') as f:
+                audio_data = f.read()
+            songs_dir = generate_library(os.path.join(tmp, f'Songs {name}'), args.sets, audio_data=audio_data)
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                library = scan_songs(songs_dir, workers=1, cache_path=None)
+                best = min(best, time.perf_counter() - start)
+            probing = min(sum(_best_ms(probe_audio, song['audio_path'], 1) for song in library)
+                          for _ in range(args.repeat))
+            print(f"scan of {args.sets} sets, {name}: {best / args.sets * 1000:.2f} ms per set, "
+                  f"{probing / args.sets:.2f} ms of it probing")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Measures scan_songs on a synthetic library with 1..N worker processes.
+
+    python -m benchmarks.bench_scan_workers --sets 5000 --max-workers 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_library import generate_library
+from utils.scanner import scan_songs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sets', type=int, default=2000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        songs_dir = generate_library(os.path.join(tmp, 'Songs'), args.sets)
+        reference = scan_songs(songs_dir, workers=1, cache_path=None)
+
+        print(f"{'workers':>7} {'best, s':>9} {'speedup':>8}")
+        baseline = None
+        for workers in range(1, args.max_workers + 1):
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                library = scan_songs(songs_dir, workers=workers, cache_path=None)
+                best = min(best, time.perf_counter() - start)
+            assert library == reference, "parallel scan produced a different library"
+            baseline = baseline or best
+            print(f"{workers:>7} {best:>9.3f} {baseline / best:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
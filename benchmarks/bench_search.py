@@ -0,0 +1,81 @@
+"""
+Compares the old linear display-text filter with the SearchIndex on a
+synthetic library of N songs: index build time and ms per query.
+
+    python -m benchmarks.bench_search --songs 100000
+"""
+import argparse
+import random
+import time
+
+from utils.search import SearchIndex, linear_search, song_search_text
+
+SYLLABLES = ['ka', 'mi', 'ra', 'to', 'ne', 'su', 'ko', 'ri', 'an', 'el', 'yu', 'ha', 'no', 'chi', 'ze']
+QUERIES = ['k', 'ka', 'kami', 'kamira to', 'camellia', 'camelia', 'freedom dive', 'xyzzy']
+
+
+def _word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def make_songs(num_songs, seed=0):
+    rng = random.Random(seed)
+    artists = [' '.join(_word(rng) for _ in range(rng.randint(1, 2))) for _ in range(num_songs // 20)]
+    artists += ['Camellia', 'xi']
+    songs = []
+    for i in range(num_songs):
+        artist = rng.choice(artists)
+        title = 'Freedom Dive' if i % 5000 == 0 else ' '.join(_word(rng) for _ in range(rng.randint(1, 4)))
+        songs.append({
+            'artist': artist,
+            'title': title,
+            'artist_unicode': artist,
+            'title_unicode': title,
+            'creator': _word(rng),
+            'source': _word(rng) if i % 4 == 0 else '',
+            'tags': ' '.join(_word(rng) for _ in range(rng.randint(0, 8))),
+            'display_text': f"{artist} - {title}",
+        })
+    return songs
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--songs', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    songs = make_songs(args.songs)
+    start = time.perf_counter()
+    index = SearchIndex(songs)
+    print(f"index build: {time.perf_counter() - start:.2f} s, {len(index.vocabulary)} tokens")
+    search_texts = [song_search_text(song) for song in songs]
+
+    def old_filter(text):
+        # Прежний filter_song_list: lower() каждой строки на каждое нажатие
+        text = text.lower()
+        return [i for i, song in enumerate(songs) if text in song['display_text'].lower()]
+
+    print(f"{'query':>12} {'old, ms':>8} {'linear, ms':>11} {'index, ms':>10} {'fuzzy, ms':>10} {'hits':>7}")
+    for query in QUERIES:
+        old = best_time(lambda: old_filter(query), args.repeat)
+        linear = best_time(lambda: linear_search(search_texts, query), args.repeat)
+        # Первый запрос с коротким префиксом заполняет кэш, поэтому берётся лучшее время
+        indexed = best_time(lambda: index.search(query), args.repeat)
+        fuzzy = best_time(lambda: index.search(query, fuzzy=True), args.repeat)
+        hits = len(index.search(query, fuzzy=True))
+        print(f"{query:>12} {old * 1000:8.2f} {linear * 1000:11.2f} {indexed * 1000:10.2f} "
+              f"{fuzzy * 1000:10.2f} {hits:7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Seek latency on long compressed tracks, without and with a seek table:
+each seek opens the track fresh (as after play()), jumps to a random point
+and decodes the first block, like dragging the progress slider on a track
+that has just started. Also reports how long building a table takes and
+how big it is. Files stay in the page cache, so the numbers are decoder
+cost, not disk reads.
+
+    python -m benchmarks.bench_seek --minutes 10 --seeks 30
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from utils.playback import DECODE_FRAMES, _Source
+from utils.seek_index import SeekIndex
+
+SAMPLERATE = 44100
+FORMATS = [
+    ('mp3 cbr', 'cbr.mp3', {'format': 'MP3'}),
+    ('mp3 vbr', 'vbr.mp3', {'format': 'MP3', 'bitrate_mode': 'VARIABLE'}),
+    ('ogg', 'track.ogg', {'format': 'OGG'}),
+]
+
+
+def _write_track(path, minutes, options):
+    rng = np.random.default_rng(0)
+    with sf.SoundFile(path, 'w', SAMPLERATE, 2, **options) as out:
+        # Кодировщики libsndfile падают на больших буферах: пишем по секунде
+        for second in range(int(minutes * 60)):
+            t = np.arange(SAMPLERATE) / SAMPLERATE
+            tone = 0.3 * np.sin(2 * np.pi * (220 + second % 200) * t) + rng.standard_normal(SAMPLERATE) * 0.02
+            out.write(np.column_stack((tone, tone)).astype('float32'))
+
+
+def _seek_times(path, seeks, seek_index=None):
+    rng = random.Random(0)
+    times = []
+    for _ in range(seeks):
+        source = _Source(path, seek_index=seek_index)
+        target = rng.randrange(0, source.total_frames - DECODE_FRAMES)
+        start = time.perf_counter()
+        source.seek(target)
+        source.read(DECODE_FRAMES)
+        times.append((time.perf_counter() - start) * 1000)
+        source.close()
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--minutes', type=float, default=10.0)
+    parser.add_argument('--seeks', type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SeekIndex(os.path.join(tmp, 'seek_index.db'))
+        print(f"{args.minutes:.0f}-minute tracks, {args.seeks} seeks each, ms (median / max)")
+        print(f"{'format':>8} {'no table':>16} {'with table':>16} {'build, ms':>10} {'table, KB':>10}")
+        for name, filename, options in FORMATS:
+            path = os.path.join(tmp, filename)
+            _write_track(path, args.minutes, options)
+            before = _seek_times(path, args.seeks)
+
+            start = time.perf_counter()
+            index.ensure(path)
+            index.wait()
+            build_ms = (time.perf_counter() - start) * 1000
+            table = index.get(path)
+            if table is None:
+                print(f"{name:>8} {statistics.median(before):7.2f} / {max(before):6.2f} {'not indexed':>16}")
+                continue
+            after = _seek_times(path, args.seeks, index)
+            print(f"{name:>8} {statistics.median(before):7.2f} / {max(before):6.2f} "
+                  f"{statistics.median(after):7.2f} / {max(after):6.2f} {build_ms:10.0f} {table.offsets.nbytes / 1024:10.1f}")
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Cold start of the player: each run starts a fresh interpreter that imports
+main, creates the main window the way main() does and plays a short WAV.
+Reported per run and as medians:
+
+    import     time spent importing main and the window module
+    window     from process start to the first paint of the main window
+    playable   from process start to the first decoded audio of a track,
+               i.e. the engine process connected (or the audio stack
+               loaded in-process with --in-process) and play() answered
+               by the decoder
+
+Process start is taken in the parent right before spawning, so both include
+interpreter startup. Like main() the child starts the Songs scan right after
+show(), on a synthetic library of --sets beatmapsets whose library cache the
+parent builds first, as every launch but the first finds it: the cached songs
+reach the window around its first paint. A run fails if the audio engine
+existed before that paint.
+
+    python -m benchmarks.bench_startup --runs 5 [--sets 500] [--in-process]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLERATE = 44100
+METRICS = ('import', 'window', 'playable')
+
+
+def _write_track(path, seconds=2):
+    # WAV без numpy и libsndfile: родительский процесс не должен грузить то, что измеряет
+    with wave.open(path, 'wb') as out:
+        out.setnchannels(2)
+        out.setsampwidth(2)
+        out.setframerate(SAMPLERATE)
+        out.writeframes(b'\0' * 4 * SAMPLERATE * seconds)
+
+
+def _child(track, spawned_at, config, songs_dir, cache_path):
+    started = time.perf_counter()
+    import main
+    import ui.main_window  # create_window() импортирует его лениво
+    imported = time.perf_counter()
+
+    from PyQt6.QtCore import QEvent, QObject, QTimer
+    from PyQt6.QtWidgets import QApplication, QWidget
+
+    result = {'import': (imported - started) * 1000}
+    app = QApplication([])
+
+    def since_spawn():
+        return (time.time() - spawned_at) * 1000
+
+    def playable():
+        if window.engine is None:
+            # Движок ещё подключается: окно не ждёт его, ждёт только замер
+            QTimer.singleShot(1, playable)
+            return
+        window.engine.play(track)
+        # Трек готов к выводу, когда декодер положил в буфер первые кадры
+        while window.engine.buffered_frames() == 0:
+            time.sleep(0.0005)
+        result['playable'] = since_spawn()
+        window.close()
+        app.quit()
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if (event.type() == QEvent.Type.Paint and 'window' not in result
+                    and isinstance(obj, QWidget) and obj.window() is window):
+                result['window'] = since_spawn()
+                result['engine_before_paint'] = window._engine is not None
+                # Следующий оборот цикла событий — уже после того, как кадр отрисован
+                QTimer.singleShot(0, playable)
+            return False
+
+    first_paint = FirstPaint()
+    app.installEventFilter(first_paint)
+    window = main.create_window(config)
+    window.show()
+    window.start_scan(songs_dir, watch=False, cache_path=cache_path)
+    app.exec()
+    print(json.dumps(result))
+
+
+def _run_once(track, config, songs_dir, cache_path):
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    spawned_at = time.time()
+    out = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_startup', '--child', track, '--spawned-at', repr(spawned_at),
+         '--config', json.dumps(config), '--songs-dir', songs_dir, '--cache', cache_path],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    run = json.loads(out.stdout.strip().splitlines()[-1])
+    if run['engine_before_paint']:
+        raise SystemExit("the audio engine was created before the first paint of the window")
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--sets', type=int, default=500, help="beatmapsets in the library the window scans")
+    parser.add_argument('--child', metavar='TRACK', help=argparse.SUPPRESS)
+    parser.add_argument('--spawned-at', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--config', default='{}', help=argparse.SUPPRESS)
+    parser.add_argument('--songs-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--cache', help=argparse.SUPPRESS)
+    parser.add_argument('--in-process', action='store_true', help="play in the GUI process, without the engine process")
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child, args.spawned_at, json.loads(args.config), args.songs_dir, args.cache)
+        return
+    # Дочерний процесс запускает этот же модуль: то, что он измеряет, импортируется только здесь
+    from benchmarks.synthetic_library import generate_library
+    from utils.scanner import scan_songs
+
+    config = {'engine_process': False} if args.in_process else {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        track = os.path.join(tmp, 'track.wav')
+        _write_track(track)
+        songs_dir = generate_library(os.path.join(tmp, 'Songs'), args.sets)
+        cache_path = os.path.join(tmp, 'cache.db')
+        scan_songs(songs_dir, cache_path=cache_path)
+        # Первый запуск прогревает файловый кэш ОС и не учитывается
+        _run_once(track, config, songs_dir, cache_path)
+        runs = [_run_once(track, config, songs_dir, cache_path) for _ in range(args.runs)]
+
+    print(f"{'run':>6} " + ' '.join(f"{name + ', ms':>13}" for name in METRICS))
+    for i, run in enumerate(runs, 1):
+        print(f"{i:>6} " + ' '.join(f"{run[name]:13.1f}" for name in METRICS))
+    print(f"{'median':>6} " + ' '.join(f"{statistics.median(run[name] for run in runs):13.1f}" for name in METRICS))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Measures how much faster than real time TimeStretcher runs on one core:
+N seconds of synthetic stereo audio fed in decoder-sized blocks at DT, HT
+and other speeds.
+
+    python -m benchmarks.bench_time_stretch --seconds 60
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils.playback import DECODE_FRAMES
+from utils.time_stretch import TimeStretcher
+
+SAMPLERATE = 44100
+SPEEDS = [0.75, 1.25, 1.5, 2.0]
+
+
+def make_audio(seconds, seed=0):
+    # Аккорд с меняющимися нотами и шумовыми "ударными" — ближе к музыке, чем чистый тон
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLERATE)) / SAMPLERATE
+    notes = 220 * 2 ** (rng.integers(0, 12, size=int(seconds * 2) + 1) / 12)
+    freq = notes[(t * 2).astype(int)]
+    tone = 0.3 * np.sin(2 * np.pi * np.cumsum(freq) / SAMPLERATE)
+    beats = (rng.standard_normal(len(t)) * np.exp(-((t * 4) % 1) * 30)) * 0.2
+    left = tone + beats
+    right = 0.8 * tone + beats
+    return np.column_stack((left, right)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=60.0)
+    args = parser.parse_args()
+
+    audio = make_audio(args.seconds)
+    print(f"{'speed':>6} {'time, s':>8} {'x real time':>12} {'ms per s of input':>18} {'length error':>13}")
+    for speed in SPEEDS:
+        stretcher = TimeStretcher(SAMPLERATE, 2, speed)
+        start = time.perf_counter()
+        produced = 0
+        for offset in range(0, len(audio), DECODE_FRAMES):
+            produced += len(stretcher.process(audio[offset:offset + DECODE_FRAMES]))
+        produced += len(stretcher.drain())
+        elapsed = time.perf_counter() - start
+        error = produced - len(audio) / speed
+        print(f"{speed:6.2f} {elapsed:8.3f} {args.seconds / elapsed:12.0f} "
+              f"{elapsed / args.seconds * 1000:18.2f} {error / SAMPLERATE * 1000:10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Counts audio underruns under synthetic I/O stalls: the old design (file read
+inside the callback under playback_lock) against PlaybackEngine (decoder
+thread + ring buffer). Blocks are pulled in real time at the stream's block
+rate; a callback that misses its block's deadline or returns silence
+mid-track counts as an underrun.
+
+    python -m benchmarks.bench_underruns --seconds 10 --stall-ms 60 --stall-every 0.5
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import soundfile as sf
+
+import utils.playback as playback
+
+SAMPLERATE = 44100
+
+
+class StallingSoundFile(sf.SoundFile):
+    """SoundFile whose reads block for stall_ms every stall_every seconds (a slow disk)."""
+    stall_ms = 0
+    stall_every = 1.0
+    last_stall = 0.0
+
+    def read(self, *args, **kwargs):
+        now = time.monotonic()
+        if now - StallingSoundFile.last_stall >= self.stall_every:
+            StallingSoundFile.last_stall = now
+            time.sleep(self.stall_ms / 1000)
+        return super().read(*args, **kwargs)
+
+
+class _NullStream:
+    """The engine under test is driven by run_realtime instead of a device."""
+    active = True
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self, ignore_errors=True):
+        pass
+
+
+class LegacyPlayer:
+    """The callback from before the engine: reads the file under playback_lock."""
+
+    def __init__(self, path):
+        self.audio_file = StallingSoundFile(path)
+        self.playback_lock = threading.Lock()
+        self.volume = 1.0
+
+    def callback(self, outdata, frames):
+        with self.playback_lock:
+            chunk = self.audio_file.read(frames, dtype='float32', always_2d=True)
+            chunk *= self.volume
+            outdata[:len(chunk)] = chunk
+            outdata[len(chunk):].fill(0)
+
+
+def run_realtime(callback, seconds, blocksize, gui_lock=None, gui_hold_ms=0):
+    """Calls callback once per block period; returns the number of missed deadlines."""
+    budget = blocksize / SAMPLERATE
+    outdata = np.zeros((blocksize, 2), dtype='float32')
+    stop = threading.Event()
+
+    def gui():
+        # GUI-поток периодически держит блокировку (перемотка, обновление ползунка)
+        while not stop.is_set():
+            time.sleep(0.1)
+            if gui_lock is not None:
+                with gui_lock:
+                    time.sleep(gui_hold_ms / 1000)
+
+    gui_thread = threading.Thread(target=gui, daemon=True)
+    gui_thread.start()
+    missed = 0
+    deadline = time.monotonic() + budget
+    for _ in range(int(seconds / budget)):
+        callback(outdata, blocksize)
+        now = time.monotonic()
+        if now > deadline:
+            missed += 1
+            deadline = now
+        time.sleep(max(0.0, deadline - time.monotonic()))
+        deadline += budget
+    stop.set()
+    gui_thread.join()
+    return missed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--block', type=int, default=512)
+    parser.add_argument('--stall-ms', type=float, default=60.0)
+    parser.add_argument('--stall-every', type=float, default=0.5)
+    parser.add_argument('--gui-hold-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    StallingSoundFile.stall_ms = args.stall_ms
+    StallingSoundFile.stall_every = args.stall_every
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'track.flac')
+        rng = np.random.default_rng(0)
+        frames = int(SAMPLERATE * (args.seconds + 5))
+        sf.write(path, (rng.standard_normal((frames, 2)) * 0.1).astype('float32'), SAMPLERATE)
+
+        legacy = LegacyPlayer(path)
+        legacy_missed = run_realtime(legacy.callback, args.seconds, args.block,
+                                     legacy.playback_lock, args.gui_hold_ms)
+
+        original_soundfile = playback.sf.SoundFile
+        playback.sf.SoundFile = StallingSoundFile
+        try:
+            holder = {}
+
+            def factory(callback, **kwargs):
+                holder['callback'] = callback
+                return _NullStream()
+
+            engine = playback.PlaybackEngine(stream_factory=factory, output_rate=SAMPLERATE)
+            engine.play(path)
+            # Буфер успевает заполниться, пока интерфейс показывает трек
+            time.sleep(0.2)
+            engine_missed = run_realtime(lambda out, n: holder['callback'](out, n, None, None),
+                                         args.seconds, args.block)
+            engine_underruns = engine.underruns
+            engine.close()
+        finally:
+            playback.sf.SoundFile = original_soundfile
+
+    blocks = int(args.seconds * SAMPLERATE / args.block)
+    print(f"{args.seconds:.0f} s, {blocks} blocks of {args.block} frames, "
+          f"{args.stall_ms:.0f} ms stall every {args.stall_every} s, GUI holds the lock {args.gui_hold_ms:.0f} ms every 0.1 s")
+    print(f"{'design':>22} {'late callbacks':>15} {'ring underruns':>15}")
+    print(f"{'callback reads file':>22} {legacy_missed:15} {'-':>15}")
+    print(f"{'decoder + ring buffer':>22} {engine_missed:15} {engine_underruns:15}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Finding and validating beatmapset folders on a storyboard-heavy library:
+the old walk (os.walk into every subfolder, stat of each .osu and audio
+file by path) against the set walker of the scanner (one listing per set,
+.osu signatures from the directory entries, referenced files resolved
+against the listing). This is the part of a warm scan that runs for every
+folder, whether or not anything changed.
+
+For each it reports the best time of a few runs and the calls that cost a
+syscall: directory listings, entries read from them and stat calls.
+
+    python -m benchmarks.bench_walk --sets 2000 --storyboard-files 500
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_library import generate_library
+from utils import scan_profile
+from utils.library_store import open_library_store
+from utils.scanner import _is_record_valid, _load_cache, _walk_sets, scan_songs
+
+
+class _Counts:
+    def __init__(self):
+        self.listings = 0
+        self.entries = 0
+        self.stats = 0
+
+
+class _Listing:
+    """An os.scandir() result read in advance, for counting its entries."""
+
+    def __init__(self, entries):
+        self._entries = iter(entries)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def close(self):
+        pass
+
+
+def legacy_warm_walk(songs_dir, folders, counts=None):
+    """The scanner's loop before the set walker: returns the number of valid cached folders."""
+    real_scandir = os.scandir
+
+    def counting_scandir(path):
+        # os.walk берёт scandir из модуля os: подмена видна ему
+        counts.listings += 1
+        entries = list(real_scandir(path))
+        counts.entries += len(entries)
+        return _Listing(entries)
+
+    def signature(path):
+        if counts is not None:
+            counts.stats += 1
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_mtime, st.st_size]
+
+    if counts is not None:
+        os.scandir = counting_scandir
+    try:
+        valid = 0
+        for root, dirs, files in os.walk(songs_dir):
+            osu_files = [f for f in files if f.endswith('.osu')]
+            if not osu_files:
+                continue
+            record = folders.get(root)
+            osu_stat = [[f] + (signature(os.path.join(root, f)) or []) for f in sorted(osu_files)]
+            if (record and osu_stat == record['osu_stat']
+                    and all(signature(entry['audio_path']) == entry['audio_stat'] for entry in record['entries'])):
+                valid += 1
+        return valid
+    finally:
+        os.scandir = real_scandir
+
+
+def set_walker_warm_walk(songs_dir, folders):
+    valid = 0
+    for root, osu_stat, files in _walk_sets(songs_dir, descend_top=True):
+        if _is_record_valid(root, osu_stat, files, folders.get(root)):
+            valid += 1
+    return valid
+
+
+def _best(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sets', type=int, default=2000)
+    parser.add_argument('--storyboard-files', type=int, default=500,
+                        help="sprites in the sb/ tree of every fourth set")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        songs_dir = os.path.join(tmp, 'Songs')
+        start = time.perf_counter()
+        generate_library(songs_dir, args.sets, storyboard_files=args.storyboard_files, odd_encodings=True)
+        print(f"generated {args.sets} sets in {time.perf_counter() - start:.1f} s")
+        cache_path = os.path.join(tmp, 'cache.db')
+        scan_songs(songs_dir, cache_path=cache_path)
+        folders, _ = _load_cache(open_library_store(cache_path))
+
+        legacy_time, legacy_valid = _best(lambda: legacy_warm_walk(songs_dir, folders), args.repeat)
+        legacy = _Counts()
+        legacy_warm_walk(songs_dir, folders, legacy)
+
+        walker_time, walker_valid = _best(lambda: set_walker_warm_walk(songs_dir, folders), args.repeat)
+        profile = scan_profile.ScanProfile(songs_dir)
+        profile.run(lambda: [set_walker_warm_walk(songs_dir, folders)])
+        walker = _Counts()
+        walker.listings = profile.counts.get('dirs visited', 0)
+        walker.entries = profile.counts.get('directory entries', 0)
+        walker.stats = profile.counts.get("files stat'ed", 0)
+
+    print(f"{args.sets} sets, {args.storyboard_files} storyboard sprites in every fourth, best of {args.repeat}")
+    print(f"{'walk':>12} {'time, ms':>9} {'valid':>6} {'listings':>9} {'entries':>9} {'stats':>7}")
+    for name, seconds, valid, counts in (('os.walk', legacy_time, legacy_valid, legacy),
+                                         ('set walker', walker_time, walker_valid, walker)):
+        print(f"{name:>12} {seconds * 1000:9.1f} {valid:6} {counts.listings:9} {counts.entries:9} {counts.stats:7}")
+
+
+if __name__ == '__main__':
+    main()
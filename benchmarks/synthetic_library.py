@@ -0,0 +1,253 @@
+import hashlib
+import os
+import random
+import struct
+import time
+
+from utils.osu_db import (FLOAT_DIFFICULTY_VERSION, FLOAT_STAR_RATING_VERSION, NO_ENTRY_SIZE_VERSION, OSU_DB_FILE,
+                          UNIX_EPOCH_TICKS)
+
+OSU_TEMPLATE = """osu file format v14
+
+[General]
+AudioFilename: {audio}
+AudioLeadIn: 0
+PreviewTime: 40000
+Mode: 0
+
+[Metadata]
+Title:{title}
+TitleUnicode:{title}
+Artist:{artist}
+ArtistUnicode:{artist}
+Creator:{creator}
+Version:{version}
+Source:
+Tags:{tags}
+
+[Difficulty]
+HPDrainRate:5
+CircleSize:4
+OverallDifficulty:8
+ApproachRate:9
+
+[Events]
+//Background and Video events
+0,0,"{background}",0,0
+//Break Periods
+
+[TimingPoints]
+{offset},{beat_length},4,2,1,60,1,0
+
+[HitObjects]
+"""
+
+HIT_OBJECT = "256,192,{time},1,0,0:0:0:0:\n"
+# Названия не из ASCII, как у японских и корейских карт
+UNICODE_TITLES = ['夜に駆ける', 'ロストワンの号哭', '오늘도 빛나는 너에게', 'Ωmega Rhythm']
+# Каждый STORYBOARD_EVERY-й сет со сторибордом, каждый NO_BACKGROUND_EVERY-й без фона в [Events]
+STORYBOARD_EVERY = 4
+NO_BACKGROUND_EVERY = 10
+SILENT_FRAMES = 64
+# Каждый OSU_DB_MISSING_EVERY-й сет не попадает в osu!.db, как скачанные после последнего запуска osu!
+OSU_DB_MISSING_EVERY = 50
+# Версия osu!.db по умолчанию: без размера записей, звёзды в double
+OSU_DB_VERSION = 20240820
+
+
+def silent_wav(tag):
+    """
+    A tiny silent 44.1 kHz stereo WAV. tag goes into an INFO comment, so
+    files of different sets differ in content and are not taken for
+    duplicates of each other.
+    """
+    comment = tag.encode() + b'\0'
+    if len(comment) % 2:
+        comment += b'\0'
+    info = b'INFO' + b'ICMT' + struct.pack('<I', len(comment)) + comment
+    fmt = struct.pack('<HHIIHH', 1, 2, 44100, 44100 * 4, 4, 16)
+    data = bytes(SILENT_FRAMES * 4)
+    body = (b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+            + b'LIST' + struct.pack('<I', len(info)) + info
+            + b'data' + struct.pack('<I', len(data)) + data)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def _write_storyboard(set_dir, files):
+    """sb/ tree with files sprites split over a few subfolders, as storyboarded sets have."""
+    for i in range(files):
+        folder = os.path.join(set_dir, 'sb', f'layer{i % 4}', f'part{i // 200}')
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f'sprite{i}.png'), 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n' + bytes(32))
+    with open(os.path.join(set_dir, 'storyboard.osb'), 'w', encoding='utf-8') as f:
+        f.write('[Events]\n' + ''.join(f'Sprite,Foreground,Centre,"sb/layer{i % 4}/part{i // 200}/sprite{i}.png",'
+                                       f'320,240\n' for i in range(files)))
+
+
+def _encode_osu(text, variant):
+    """The .osu text as bytes in one of the shapes found in real Songs folders."""
+    if variant == 1:
+        # Блокнот Windows: BOM и CRLF
+        return b'\xef\xbb\xbf' + text.replace('\n', '\r\n').encode('utf-8')
+    if variant == 2:
+        # Старые карты, сохранённые в cp1252: такие байты не являются UTF-8
+        return text.encode('cp1252', errors='replace')
+    return text.encode('utf-8')
+
+
+def _db_string(value):
+    if value is None:
+        return b'\x00'
+    data = value.encode('utf-8')
+    length = len(data)
+    uleb = bytearray()
+    while True:
+        byte = length & 0x7f
+        length >>= 7
+        uleb.append(byte | (0x80 if length else 0))
+        if not length:
+            break
+    return b'\x0b' + bytes(uleb) + data
+
+
+def _db_beatmap(beatmap, version):
+    """One beatmap record of osu!.db in the layout of version; beatmap has the keys OsuDbReader yields."""
+    s = _db_string
+    out = bytearray()
+    for key in ('artist', 'artist_unicode', 'title', 'title_unicode', 'creator', 'difficulty', 'audio_filename',
+                'md5', 'osu_file'):
+        out += s(beatmap[key])
+    modified = int(beatmap['modified'] * 1e7) + UNIX_EPOCH_TICKS
+    if version >= FLOAT_DIFFICULTY_VERSION:
+        out += struct.pack('<Bhhhqffffd', beatmap['ranked_status'], 400, 20, 1, modified, 9.0, 4.0, 5.0, 8.0, 1.4)
+        # Несколько сочетаний модов в каждом из четырёх режимов, как у настоящих записей
+        for mode in range(4):
+            mods = (0, 64, 256) if mode == beatmap['mode'] else ()
+            out += struct.pack('<i', len(mods))
+            for mod in mods:
+                if version >= FLOAT_STAR_RATING_VERSION:
+                    out += struct.pack('<BiBf', 0x08, mod, 0x0c, 4.5)
+                else:
+                    out += struct.pack('<BiBd', 0x08, mod, 0x0d, 4.5)
+    else:
+        out += struct.pack('<BhhhqBBBBd', beatmap['ranked_status'], 400, 20, 1, modified, 9, 4, 5, 8, 1.4)
+    out += struct.pack('<iii', beatmap['drain_time'], beatmap['total_time'], beatmap['preview_time'])
+    # Унаследованная точка перед неунаследованной: BPM берётся не из первой точки подряд
+    points = []
+    if beatmap['beat_length'] is not None:
+        points = [(-100.0, 0.0, False), (beatmap['beat_length'], 0.0, True), (-50.0, 5000.0, False)]
+    out += struct.pack('<i', len(points)) + b''.join(struct.pack('<dd?', *point) for point in points)
+    out += struct.pack('<iiiBBBBhfB', beatmap['beatmap_id'], beatmap['beatmapset_id'], 0, 9, 9, 9, 9, 0, 0.7,
+                       beatmap['mode'])
+    out += s(beatmap['source']) + s(beatmap['tags'])
+    out += struct.pack('<h', 0) + s('') + struct.pack('<?q?', True, 0, False)
+    out += s(beatmap['folder'])
+    out += struct.pack('<q?????', 0, False, False, False, False, False)
+    if version < FLOAT_DIFFICULTY_VERSION:
+        out += struct.pack('<h', 0)
+    out += struct.pack('<iB', 0, 0)
+    if version < NO_ENTRY_SIZE_VERSION:
+        out[:0] = struct.pack('<i', len(out))
+    return bytes(out)
+
+
+def write_osu_db(path, beatmaps, version=OSU_DB_VERSION, folder_count=None, player='player'):
+    """Writes an osu!.db file in the layout of version with the given beatmaps (dicts as OsuDbReader yields)."""
+    beatmaps = list(beatmaps)
+    if folder_count is None:
+        folder_count = len({beatmap['folder'] for beatmap in beatmaps})
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<ii?q', version, folder_count, True, 0) + _db_string(player)
+                + struct.pack('<i', len(beatmaps)))
+        for beatmap in beatmaps:
+            f.write(_db_beatmap(beatmap, version))
+        # Права пользователя
+        f.write(struct.pack('<i', 0))
+    return path
+
+
+def generate_library(songs_dir, num_sets, difficulties=3, hit_objects=400, seed=0, audio_data=None,
+                     storyboard_files=0, odd_encodings=False, osu_db_version=None):
+    """
+    Writes a fake osu! Songs directory with num_sets beatmapsets and returns
+    its path. Each set has a few .osu difficulties, an audio file (a tiny
+    silent WAV of its own, or a copy of audio_data, the bytes of a real MP3)
+    and, for two thirds of the sets, a background image; the rest reference
+    a background that is missing.
+
+    With storyboard_files, every STORYBOARD_EVERY-th set also gets an sb/
+    folder tree with that many sprites and an .osb. odd_encodings mixes in
+    what real libraries contain: .osu files with a BOM and CRLF, in cp1252,
+    without a background event, and Japanese and Korean titles, also in
+    folder names.
+
+    With osu_db_version, an osu!.db in that layout is written next to
+    songs_dir, holding every set but each OSU_DB_MISSING_EVERY-th.
+    """
+    rng = random.Random(seed)
+    os.makedirs(songs_dir, exist_ok=True)
+    hit_objects_text = ''.join(HIT_OBJECT.format(time=1000 + i * 250) for i in range(hit_objects))
+    beatmaps = []
+
+    for set_id in range(num_sets):
+        artist = f"Artist {rng.randrange(num_sets // 4 + 1)}"
+        title = f"Song {set_id}"
+        if odd_encodings and set_id % 20 == 7:
+            title = f"{UNICODE_TITLES[set_id % len(UNICODE_TITLES)]} {set_id}"
+        set_dir = os.path.join(songs_dir, f"{100000 + set_id} {artist} - {title}")
+        os.makedirs(set_dir, exist_ok=True)
+
+        background = 'bg.jpg'
+        if set_id % 3:
+            with open(os.path.join(set_dir, background), 'wb') as f:
+                f.write(b'\xff\xd8\xff\xe0' + bytes(64))
+        audio = 'audio.mp3' if audio_data is not None else 'audio.wav'
+        with open(os.path.join(set_dir, audio), 'wb') as f:
+            f.write(audio_data if audio_data is not None else silent_wav(f'set {set_id}'))
+        if storyboard_files and set_id % STORYBOARD_EVERY == 0:
+            _write_storyboard(set_dir, storyboard_files)
+
+        for diff in range(difficulties):
+            version = f"Diff {diff}"
+            fields = dict(
+                audio=audio,
+                title=title,
+                artist=artist,
+                creator=f"mapper{rng.randrange(100)}",
+                version=version,
+                tags=f"tag{set_id % 50} synthetic",
+                background=background,
+                offset=rng.randrange(2000),
+                beat_length=60000 / rng.randrange(90, 240),
+            )
+            text = OSU_TEMPLATE.format(**fields)
+            variant = 0
+            if odd_encodings:
+                if set_id % NO_BACKGROUND_EVERY == 5:
+                    text = text.replace(f'0,0,"{background}",0,0\n', '')
+                # Один .osu из десяти с BOM и CRLF, ещё один в cp1252 с не-ASCII символом
+                variant = {1: 1, 2: 2}.get((set_id + diff) % 10, 0)
+                if variant == 2:
+                    text = text.replace('Source:\n', 'Source:Pokémon\n')
+            osu_name = f"{artist} - {title} (mapper) [{version}].osu"
+            data = _encode_osu(text + hit_objects_text, variant)
+            with open(os.path.join(set_dir, osu_name), 'wb') as f:
+                f.write(data)
+            if osu_db_version is not None and set_id % OSU_DB_MISSING_EVERY != OSU_DB_MISSING_EVERY - 1:
+                beatmaps.append({
+                    'artist': artist, 'artist_unicode': artist, 'title': title, 'title_unicode': title,
+                    'creator': fields['creator'], 'difficulty': version, 'audio_filename': audio,
+                    'md5': hashlib.md5(data).hexdigest(), 'osu_file': osu_name,
+                    'folder': os.path.basename(set_dir),
+                    # osu! читает cp1252 как положено, в отличие от разбора по UTF-8
+                    'source': 'Pokémon' if variant == 2 else '', 'tags': fields['tags'],
+                    'ranked_status': 4, 'mode': 0, 'beatmap_id': set_id * 10 + diff, 'beatmapset_id': set_id,
+                    'modified': time.time(), 'drain_time': hit_objects // 4, 'total_time': 1000 + hit_objects * 250,
+                    'preview_time': 40000, 'beat_length': fields['beat_length'],
+                })
+
+    if osu_db_version is not None:
+        write_osu_db(os.path.join(os.path.dirname(os.path.abspath(songs_dir)), OSU_DB_FILE), beatmaps,
+                     osu_db_version)
+    return songs_dir
@@ -2,13 +2,10 @@ import os
 import sys
 import json
 import ctypes
-from PyQt6.QtWidgets import QApplication, QMessageBox
-from PyQt6.QtGui import QIcon
-import qtawesome as qta
+import argparse
+import multiprocessing
 
-from ui.main_window import OsuPlayerApp
-from utils.config import get_songs_directory
-from utils.scanner import scan_songs
+from utils.config import get_songs_directory, load_config
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -19,58 +16,136 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-def main():
+def load_icons():
+    """Icon set of the main window; each icon is parsed from its SVG on first use."""
+    from ui.icons import LazyIcons
+
+    return LazyIcons({
+        'prev': resource_path("icons/previous.svg"),
+        'play': resource_path("icons/play.svg"),
+        'pause': resource_path("icons/pause.svg"),
+        'next': resource_path("icons/next.svg"),
+        'dt_off': resource_path("icons/dt_off.svg"),
+        'dt_on': resource_path("icons/dt_on.svg"),
+        'ht_off': resource_path("icons/ht_off.svg"),
+        'ht_on': resource_path("icons/ht_on.svg"),
+        'volume': {
+            'mute': resource_path("icons/volume_mute.svg"),
+            'low': resource_path("icons/volume_low.svg"),
+            'med': resource_path("icons/volume_medium.svg"),
+            'high': resource_path("icons/volume_high.svg"),
+        },
+        'shuffle_off': resource_path("icons/shuffle_off.svg"),
+        'shuffle_on': resource_path("icons/shuffle_on.svg"),
+        'repeat_off': resource_path("icons/repeat_off.svg"),
+        'repeat_one': resource_path("icons/repeat_one.svg"),
+    })
+
+def create_window(config):
+    """
+    Main window with an empty library. The audio stack (sounddevice,
+    libsndfile, numpy) is loaded by the window after its first paint.
+    """
+    from PyQt6.QtGui import QIcon
+    from ui.main_window import OsuPlayerApp
+
+    main_win = OsuPlayerApp([], load_icons(), config)
+
+    # --- Установка иконки приложения ---
+    app_icon_path = resource_path("icons/app_icon.ico")
+    if os.path.exists(app_icon_path):
+        main_win.setWindowIcon(QIcon(app_icon_path))
+    return main_win
+
+def run_gui():
+    from PyQt6.QtWidgets import QApplication
+
     app = QApplication(sys.argv)
     
     # --- Windows-specific taskbar icon fix ---
     if sys.platform == 'win32':
         myappid = 'mycompany.osuradio.1.0.0' # Arbitrary unique string
         ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
-    
-    qta.set_defaults(color_disabled='#555555')
-
-    # --- Create Icons ---
-    icons = {
-        'prev': QIcon(resource_path("icons/previous.svg")),
-        'play': QIcon(resource_path("icons/play.svg")),
-        'pause': QIcon(resource_path("icons/pause.svg")),
-        'next': QIcon(resource_path("icons/next.svg")),
-        'dt_off': QIcon(resource_path("icons/dt_off.svg")),
-        'dt_on': QIcon(resource_path("icons/dt_on.svg")),
-        'volume': {
-            'mute': QIcon(resource_path("icons/volume_mute.svg")),
-            'low': QIcon(resource_path("icons/volume_low.svg")),
-            'med': QIcon(resource_path("icons/volume_medium.svg")),
-            'high': QIcon(resource_path("icons/volume_high.svg")),
-        },
-        'shuffle_off': QIcon(resource_path("icons/shuffle_off.svg")),
-        'shuffle_on': QIcon(resource_path("icons/shuffle_on.svg")),
-        'repeat_off': QIcon(resource_path("icons/repeat_off.svg")),
-        'repeat_one': QIcon(resource_path("icons/repeat_one.svg")),
-    }
 
     songs_dir = get_songs_directory()
     if not songs_dir:
         sys.exit(0)
         
-    song_library = scan_songs(songs_dir)
-    if not song_library:
-        msg_box = QMessageBox()
-        msg_box.setIcon(QMessageBox.Icon.Warning)
-        msg_box.setText("No songs found in the selected directory.")
-        msg_box.setWindowTitle("Empty Library")
-        msg_box.exec()
-
-    main_win = OsuPlayerApp(song_library, icons)
-    
-    # --- Установка иконки приложения ---
-    app_icon_path = resource_path("icons/app_icon.ico")
-    if os.path.exists(app_icon_path):
-        main_win.setWindowIcon(QIcon(app_icon_path))
+    config = load_config()
 
+    # Окно показывается сразу, библиотека подгружается в фоне
+    main_win = create_window(config)
     main_win.show()
+
+    # Количество процессов для разбора .osu (по умолчанию — все ядра)
+    scan_workers = config.get('scan_workers') or os.cpu_count() or 1
+    # Анализ громкости идёт в фоне на половине ядер, чтобы не мешать интерфейсу
+    loudness_workers = config.get('loudness_workers') or max(1, (os.cpu_count() or 1) // 2)
+    main_win.start_scan(songs_dir, workers=scan_workers, watch=config.get('watch_songs_dir', True),
+                        loudness_workers=loudness_workers, use_osu_db=config.get('use_osu_db', True))
     sys.exit(app.exec())
 
+def run_daemon(socket_path):
+    """Headless player: the audio engine alone, controlled over its socket. Qt is never imported."""
+    from utils.engine_service import available, serve
+
+    if not available():
+        sys.exit("--daemon needs Unix domain sockets, which this platform does not provide")
+    print(f"osu!radio engine starting on {socket_path}", flush=True)
+    try:
+        serve(socket_path, load_config())
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+def run_profile_scan(songs_dir, cold, top, output):
+    """Profiles one scan of the Songs folder and prints the summary; Qt is never imported."""
+    from utils.scan_profile import format_report, profile_scan
+    from utils.scanner import CACHE_PATH
+
+    songs_dir = songs_dir or load_config().get('songs_directory')
+    if not songs_dir or not os.path.isdir(songs_dir):
+        sys.exit("Give the Songs folder to profile: python main.py --profile-scan PATH")
+    report = profile_scan(os.path.abspath(songs_dir), CACHE_PATH, cold=cold, top=top)
+    print()
+    print(format_report(report))
+    output = output or f"scan_profile-{report['date'].replace(':', '')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nReport saved to {output}")
+
+def main():
+    from utils.engine_service import default_socket_path
+
+    parser = argparse.ArgumentParser(description="osu!radio music player")
+    parser.add_argument('--daemon', action='store_true',
+                        help="run only the audio engine, without a window; control it with python -m utils.engine_service")
+    parser.add_argument('--socket', default=default_socket_path(), help="socket of the --daemon engine")
+    parser.add_argument('--profile-scan', nargs='?', const='', metavar='SONGS_DIR',
+                        help="scan the Songs folder (from config.json by default) without a window and "
+                             "report where the time goes")
+    parser.add_argument('--profile-cold', action='store_true',
+                        help="profile a scan without the library cache; the cache file is left as it is")
+    parser.add_argument('--profile-top', type=int, default=10, metavar='N', help="list the N slowest folders")
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help="JSON report (default scan_profile-<time>.json)")
+    # Процесс движка, который запускает окно (utils.engine_service.start_engine_process)
+    parser.add_argument('--engine', metavar='SOCKET', help=argparse.SUPPRESS)
+    parser.add_argument('--engine-config', default='{}', help=argparse.SUPPRESS)
+    # Qt разбирает свои аргументы сам (-platform и т.п.)
+    args, _ = parser.parse_known_args()
+
+    if args.engine:
+        from utils.engine_service import serve
+        serve(args.engine, json.loads(args.engine_config), exit_when_orphaned=True)
+    elif args.daemon:
+        run_daemon(args.socket)
+    elif args.profile_scan is not None:
+        run_profile_scan(args.profile_scan, args.profile_cold, args.profile_top, args.profile_output)
+    else:
+        run_gui()
+
 
 if __name__ == '__main__':
+    # Нужно для пула процессов сканера в сборке PyInstaller
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+import copy
+import os
+
+import pytest
+
+from benchmarks.bench_library_store import make_cache_data
+from benchmarks.synthetic_library import generate_library
+from utils.library_store import JsonLibraryStore, SqliteLibraryStore, open_library_store
+from utils.osu_parser import PARSER_VERSION
+from utils.scanner import ENTRY_VERSION, _is_record_valid, _load_cache, _walk_sets, scan_songs
+
+
+def _cache_data():
+    data = make_cache_data(6)
+    folders = list(data['folders'].values())
+    # Песня старого сканера с лишним полем хранится в SQLite целиком, как JSON
+    folders[0]['entries'][0]['song']['legacy_field'] = [1, 2]
+    folders[1]['entries'][0]['deferred'] = 'osu_db'
+    folders[2]['entries'][0].update(song=None, hash=None, audio_stat=None)
+    folders[2]['error'] = 'no_audio_filename'
+    return data
+
+
+def _songs(data):
+    return {entry['audio_path']: entry['song'] for record in data['folders'].values()
+            for entry in record['entries'] if entry['song']}
+
+
+@pytest.fixture(params=['library.db', 'library.json'])
+def store(request, tmp_path):
+    return open_library_store(str(tmp_path / request.param))
+
+
+def test_open_library_store_picks_by_extension(tmp_path):
+    assert isinstance(open_library_store(str(tmp_path / 'a.json')), JsonLibraryStore)
+    assert isinstance(open_library_store(str(tmp_path / 'a.db')), SqliteLibraryStore)
+
+
+def test_round_trip(store):
+    data = _cache_data()
+    assert not store.exists() and store.load() == {}
+    store.save(data)
+    assert store.load() == data
+    # Второе сохранение переносит первое в .bak, временных файлов не остаётся
+    store.save(data)
+    assert sorted(os.listdir(os.path.dirname(store.path))) == sorted(
+        [os.path.basename(store.path), os.path.basename(store.path) + '.bak'])
+
+
+def test_update_songs_and_entries(store):
+    data = _cache_data()
+    store.save(data)
+    songs = list(_songs(data))
+    fields = {
+        songs[0]: {'loudness': {'lufs': -7.0, 'peak': 1.0}},
+        songs[1]: {'duration': 1.5, 'background_path': None},
+        songs[4]: {'loudness': {'lufs': -8.0, 'peak': 0.5}},
+    }
+    store.update_songs(fields)
+    record = data['folders'][os.path.dirname(songs[2])]
+    entry = record['entries'][0]
+    entry.update(full_hash='f' * 32, duplicate_of=songs[3], deferred=None)
+    store.update_entries([copy.deepcopy(entry)])
+
+    expected = copy.deepcopy(data)
+    for audio_path, song_fields in fields.items():
+        expected['folders'][os.path.dirname(audio_path)]['entries'][0]['song'].update(song_fields)
+    assert store.load() == expected
+
+
+def test_corrupt_main_file_falls_back_to_backup(store):
+    data = _cache_data()
+    store.save(data)
+    store.save(data)
+    with open(store.path, 'wb') as f:
+        f.write(b'not a cache')
+    store = open_library_store(store.path)
+    assert store.load() == data
+    # Нечитаемый основной файл не вытесняет рабочую копию из .bak
+    data['songs_dir'] = 'E:/Songs'
+    store.save(data)
+    assert store.load() == data
+    os.remove(store.path)
+    assert open_library_store(store.path).load()['folders'] == data['folders']
+
+
+def test_query_songs(tmp_path):
+    store = SqliteLibraryStore(str(tmp_path / 'library.db'))
+    data = _cache_data()
+    store.save(data)
+    everything = store.query_songs()
+    assert [song['display_text'] for song in everything] == sorted(
+        song['display_text'] for song in _songs(data).values())
+    assert [song['title'] for song in store.query_songs('Song 3')] == ['Song 3']
+    assert store.query_songs('100%') == []
+    assert len(store.query_songs(limit=2, offset=4)) == 1
+
+
+def test_changed_folders_are_invalidated(tmp_path):
+    songs_dir = generate_library(str(tmp_path / 'Songs'), 3, difficulties=2)
+    cache_path = str(tmp_path / 'library.db')
+    assert len(scan_songs(songs_dir, cache_path=cache_path)) == 3
+    folders, stale = _load_cache(open_library_store(cache_path))
+    assert not stale and len(folders) == 3
+
+    sets = {root: (osu_stat, files) for root, osu_stat, files in _walk_sets(songs_dir, descend_top=True)}
+    assert all(_is_record_valid(root, *sets[root], folders[root]) for root in sets)
+    changed, audio_changed = sorted(sets)[:2]
+    osu_file = next(name for name in os.listdir(changed) if name.endswith('.osu'))
+    with open(os.path.join(changed, osu_file), 'a', encoding='utf-8') as f:
+        f.write('\n')
+    audio_path = folders[audio_changed]['entries'][0]['audio_path']
+    stat = os.stat(audio_path)
+    os.utime(audio_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    sets = {root: (osu_stat, files) for root, osu_stat, files in _walk_sets(songs_dir, descend_top=True)}
+    assert [root for root in sorted(sets) if not _is_record_valid(root, *sets[root], folders[root])] == [
+        changed, audio_changed]
+
+
+def test_older_entry_version_is_stale(tmp_path):
+    store = SqliteLibraryStore(str(tmp_path / 'library.db'))
+    data = dict(_cache_data(), parser_version=PARSER_VERSION, entry_version=ENTRY_VERSION - 1)
+    store.save(data)
+    folders, stale = _load_cache(store)
+    assert stale and set(folders) == set(data['folders'])
+    store.save(dict(data, version=0))
+    assert _load_cache(store) == ({}, False)
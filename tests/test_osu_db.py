@@ -0,0 +1,16 @@
+from benchmarks.bench_osu_db import check_fixtures, read_record_dumps
+from utils.osu_db import FLOAT_DIFFICULTY_VERSION, FLOAT_STAR_RATING_VERSION, NO_ENTRY_SIZE_VERSION
+
+
+def test_record_dumps_cover_every_layout():
+    boundaries = (FLOAT_DIFFICULTY_VERSION, NO_ENTRY_SIZE_VERSION, FLOAT_STAR_RATING_VERSION)
+    layouts = set()
+    for version, data, expected in read_record_dumps():
+        assert data and expected, version
+        layouts.add(sum(version >= boundary for boundary in boundaries))
+    assert layouts == set(range(len(boundaries) + 1))
+
+
+def test_fixtures_read_back():
+    # Дампы из osu_db_records.txt и osu-VERSION.db от synthetic_library
+    assert check_fixtures() == []
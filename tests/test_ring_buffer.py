@@ -0,0 +1,47 @@
+import numpy as np
+
+from utils.ring_buffer import RingBuffer
+
+
+def _frames(start, count, channels=2):
+    return np.arange(start * channels, (start + count) * channels, dtype=np.float32).reshape(count, channels)
+
+
+def test_write_and_read_wrap_around():
+    ring = RingBuffer(8, 2)
+    out = np.empty((8, 2), dtype=np.float32)
+    ring.write(_frames(0, 6))
+    assert ring.read_into(out[:5]) == 5
+    # Запись с позиции 6 переходит через конец хранилища
+    ring.write(_frames(6, 7))
+    assert ring.readable() == 8 and ring.writable() == 0
+    assert ring.read_into(out) == 8
+    np.testing.assert_array_equal(out, _frames(5, 8))
+    assert ring.write_pos == 13 and ring.read_pos == 13
+
+
+def test_read_applies_gain_and_stops_at_readable():
+    ring = RingBuffer(4, 1)
+    out = np.full((4, 1), -1.0, dtype=np.float32)
+    ring.write(_frames(0, 3, channels=1))
+    ring.read_into(out[:2])
+    ring.write(_frames(3, 3, channels=1))
+    assert ring.read_into(out, gain=0.5) == 4
+    np.testing.assert_array_equal(out[:, 0], [1.0, 1.5, 2.0, 2.5])
+    assert ring.read_into(out) == 0
+
+
+def test_skip_to_stays_within_written_frames():
+    ring = RingBuffer(4, 1)
+    ring.write(_frames(0, 3, channels=1))
+    ring.skip_to(10)
+    assert ring.read_pos == 3
+    ring.skip_to(1)
+    assert ring.read_pos == 3
+
+
+def test_shared_buffer_is_used_as_storage():
+    memory = bytearray(4 * 2 * 4)
+    ring = RingBuffer(4, 2, memory)
+    ring.write(_frames(0, 1))
+    assert np.frombuffer(memory, dtype=np.float32)[:2].tolist() == [0.0, 1.0]
@@ -0,0 +1,120 @@
+import os
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt6.QtCore import QObject, QSize, Qt, pyqtSignal
+from PyQt6.QtGui import QImage, QImageIOHandler, QImageReader, QPixmap
+
+from utils.scanner import CACHE_PATH
+
+THUMBNAIL_DIR = os.path.join(os.path.dirname(CACHE_PATH), 'thumbnail_cache')
+COVER_SIZE = 280
+# Готовые QPixmap для последних обложек; ~0.5 МБ каждая при 16:9
+MEMORY_CACHE_SIZE = 32
+DECODE_WORKERS = 2
+
+
+def _thumbnail_key(path, st):
+    raw = f"{path}|{st.st_mtime_ns}|{st.st_size}|{COVER_SIZE}"
+    return hashlib.sha1(raw.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+
+def _load_thumbnail(path, key, thumbnail_dir):
+    """
+    Returns the cover thumbnail for path as a QImage, from the disk cache
+    when possible. Runs on a pool thread: QImage, unlike QPixmap, is safe to
+    use outside the GUI thread.
+    """
+    thumbnail_path = os.path.join(thumbnail_dir, key + '.jpg')
+    if os.path.exists(thumbnail_path):
+        image = QImage(thumbnail_path)
+        if not image.isNull():
+            return image
+
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if size.isValid() and reader.supportsOption(QImageIOHandler.ImageOption.ScaledSize):
+        # JPEG декодируется сразу в уменьшенном виде (с запасом для сглаживания)
+        scale = max(COVER_SIZE * 2 / size.width(), COVER_SIZE * 2 / size.height())
+        if scale < 1:
+            reader.setScaledSize(QSize(round(size.width() * scale), round(size.height() * scale)))
+    image = reader.read()
+    if image.isNull():
+        print(f"Error loading cover {path}: {reader.errorString()}")
+        return None
+    image = image.scaled(
+        COVER_SIZE, COVER_SIZE,
+        Qt.AspectRatioMode.KeepAspectRatioByExpanding,
+        Qt.TransformationMode.SmoothTransformation
+    )
+    try:
+        os.makedirs(thumbnail_dir, exist_ok=True)
+        tmp_path = thumbnail_path + '.tmp'
+        if image.save(tmp_path, 'JPG', 90):
+            os.replace(tmp_path, thumbnail_path)
+    except OSError as e:
+        print(f"Error saving cover thumbnail: {e}")
+    return image
+
+
+class CoverCache(QObject):
+    """
+    Cover art thumbnails for the player panel. Backgrounds are decoded and
+    scaled on a thread pool, stored on disk keyed by path, mtime and size,
+    and the most recent ones are kept in memory as ready QPixmaps.
+    cover_ready(path) fires on the GUI thread when a requested cover arrives.
+    """
+    cover_ready = pyqtSignal(str)
+    _image_loaded = pyqtSignal(str, str, QImage)
+
+    def __init__(self, thumbnail_dir=THUMBNAIL_DIR, parent=None):
+        super().__init__(parent)
+        self.thumbnail_dir = thumbnail_dir
+        self._pixmaps = OrderedDict()
+        self._pending = set()
+        self._failed = set()
+        self._executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="CoverDecoder")
+        self._image_loaded.connect(self._store_image)
+
+    def get(self, path):
+        """Returns the cached QPixmap for path, or None and starts loading it."""
+        try:
+            key = _thumbnail_key(path, os.stat(path))
+        except OSError:
+            return None
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+            return pixmap
+        if key not in self._pending and key not in self._failed:
+            self._pending.add(key)
+            self._executor.submit(self._load, path, key)
+        return None
+
+    def prefetch(self, paths):
+        for path in paths:
+            if path:
+                self.get(path)
+
+    def _load(self, path, key):
+        try:
+            image = _load_thumbnail(path, key, self.thumbnail_dir)
+        except Exception as e:
+            print(f"Error loading cover {path}: {e}")
+            image = None
+        self._image_loaded.emit(path, key, image if image is not None else QImage())
+
+    def _store_image(self, path, key, image):
+        self._pending.discard(key)
+        if image.isNull():
+            self._failed.add(key)
+            return
+        self._pixmaps[key] = QPixmap.fromImage(image)
+        while len(self._pixmaps) > MEMORY_CACHE_SIZE:
+            self._pixmaps.popitem(last=False)
+        self.cover_ready.emit(path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,29 @@
+from collections.abc import Mapping
+
+from PyQt6.QtGui import QIcon
+
+
+class LazyIcons(Mapping):
+    """
+    Icon set built from {key: svg path or nested dict}. Each QIcon is
+    created on first lookup, so icons of states the window does not start
+    in are parsed only when they are first shown.
+    """
+
+    def __init__(self, paths):
+        self._paths = paths
+        self._icons = {}
+
+    def __getitem__(self, key):
+        icon = self._icons.get(key)
+        if icon is None:
+            path = self._paths[key]
+            icon = LazyIcons(path) if isinstance(path, dict) else QIcon(path)
+            self._icons[key] = icon
+        return icon
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self):
+        return len(self._paths)
@@ -1,28 +1,53 @@
-import sys
-import threading
+import json
+import os
+import random
 import time
-
-import sounddevice as sd
-import soundfile as sf
+from bisect import bisect_right
+from collections import deque
 
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QLabel, QListWidget, QSlider,
+    QPushButton, QLabel, QTableView, QHeaderView, QAbstractItemView, QSlider,
     QMessageBox, QStackedWidget, QLineEdit, QSpacerItem, QSizePolicy, QScrollBar, QSplitter
 )
-from PyQt6.QtGui import QPixmap, QFont, QIcon
+from PyQt6.QtGui import QFont, QIcon, QKeySequence, QShortcut
 from PyQt6.QtCore import Qt, QSize, QTimer, pyqtSignal
 
-from ui.widgets import VolumePopupWidget
-from utils.scanner import format_time
+from ui.cover_cache import CoverCache
+from ui.scan_worker import LibraryWatcher, LoudnessWorker, ScanWorker, SearchIndexWorker
+from ui.song_model import SongFilterProxyModel, SongListModel
+from ui.widgets import AudioHealthOverlay, VolumePopupWidget
+from utils.audio_stats import Histogram, attribute_gui_stalls
+from utils.scanner import CACHE_PATH, format_time
+
+SEARCH_DEBOUNCE_MS = 150
+# Сколько следующих треков очереди получают обложку заранее
+COVER_PREFETCH_COUNT = 3
+# Как часто окно проверяет, начал ли процесс движка слушать сокет
+ENGINE_POLL_MS = 20
+# Как часто проверяется, не занят ли цикл событий, и какая задержка считается зависанием GUI
+GUI_PROBE_MS = 100
+GUI_STALL_MS = 50
+GUI_STALL_HISTORY = 64
+GUI_LAG_EDGES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
 
 
 class OsuPlayerApp(QMainWindow):
     playback_finished = pyqtSignal()
-
-    def __init__(self, song_library, icons):
+    track_advanced = pyqtSignal(str)
+    engine_error = pyqtSignal(str, str)
+
+    def __init__(self, song_library, icons, config=None):
+        """
+        config holds the audio settings from config.json (resample_quality,
+        pcm_cache_mb, normalize_loudness, loudness_target, engine_process).
+        With engine_process (the default where Unix sockets exist) playback
+        runs in a separate engine process, started once the window has been
+        drawn.
+        """
         super().__init__()
         self.song_library = song_library
+        self.config = config or {}
         
         # --- Player State ---
         self.current_song_index = -1
@@ -31,22 +56,38 @@ class OsuPlayerApp(QMainWindow):
         self.volume = 0.75 # 0.0 to 1.0
         self.user_is_seeking = False
         self.is_dt_enabled = False
+        self.is_ht_enabled = False
         self.shuffle_enabled = False
         self.repeat_mode = 0  # 0: No Repeat, 2: Repeat One
         self.shuffled_indices = []
         self.history = []
-
-        self.playback_thread = None
-        self.stop_playback_event = threading.Event()
-        self.playback_lock = threading.Lock()
-
-        # --- Audio Stream State ---
-        self.stream = None
-        self.audio_file = None
-        self.samplerate = 0  # Native sample rate of the file
-        self.current_playback_rate = 0 # Effective sample rate for playback
-        self.current_frame = 0
-        self.total_frames = 0
+        self.scan_worker = None
+        self.scan_started_at = None
+        self.songs_dir = None
+        self.cache_path = CACHE_PATH
+        self.watch_songs_dir = True
+        self.library_watcher = None
+        self.pending_removals = set()
+        self.index_workers = []
+        self.displayed_cover_path = None
+        # Целевая громкость нормализации (LUFS); None — треки играют как есть. Задаётся в init_audio
+        self.loudness_target = None
+        self.loudness_workers = 1
+        self.loudness_worker = None
+        self.loudness_rerun = False
+
+        # --- Audio Engine ---
+        # Создаётся после первой отрисовки окна (start_audio): numpy, libsndfile и PortAudio не нужны для первого кадра
+        self._engine = None
+        self._audio_scheduled = False
+        self.seek_index = None
+        # (процесс, сокет) запущенного движка, пока окно к нему не подключилось
+        self._engine_process = None
+        self._engine_process_started = False
+        self._engine_process_started_at = None
+        self._engine_in_process = False
+        # Песня, выбранная до появления движка: (индекс, позиция в мс); играет, как только он готов
+        self._pending_play = None
         self.last_volume = self.volume
         
         self.setWindowTitle("osu!radio")
@@ -56,23 +97,178 @@ class OsuPlayerApp(QMainWindow):
         self.playback_timer = QTimer(self)
         self.playback_timer.timeout.connect(self.update_progress_bar)
         self.playback_finished.connect(self.handle_playback_finished)
+        self.track_advanced.connect(self.handle_track_advanced)
+        self.engine_error.connect(self.handle_engine_error)
+
+        self.cover_cache = CoverCache(parent=self)
+        self.cover_cache.cover_ready.connect(self.show_loaded_cover)
+
+        # Поиск запускается после паузы в наборе, а не на каждое нажатие
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.apply_search)
+
+        # Задержки цикла событий: по ним сбои звука в процессе окна относятся к зависаниям GUI
+        self.gui_lag = Histogram(GUI_LAG_EDGES_MS)
+        self.gui_stalls = deque(maxlen=GUI_STALL_HISTORY)
+        self._gui_probe_at = time.perf_counter()
+        self.gui_probe_timer = QTimer(self)
+        self.gui_probe_timer.setInterval(GUI_PROBE_MS)
+        self.gui_probe_timer.timeout.connect(self._probe_gui_lag)
+        self.gui_probe_timer.start()
         
         # --- Icons ---
-        self.prev_icon = icons['prev']
-        self.play_icon = icons['play']
-        self.pause_icon = icons['pause']
-        self.next_icon = icons['next']
-        self.dt_icon = icons['dt_off']
-        self.dt_icon_on = icons['dt_on']
-        self.volume_icons = icons['volume']
-        self.shuffle_icon = icons['shuffle_off']
-        self.shuffle_icon_on = icons['shuffle_on']
-        self.repeat_icon = icons['repeat_off']
-        self.repeat_icon_one = icons['repeat_one']
+        # Иконки берутся из набора при использовании: нерабочие состояния кнопок не грузятся при старте
+        self.icons = icons
 
         self.init_ui()
         self.apply_stylesheet()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._audio_scheduled:
+            self._audio_scheduled = True
+            # Дочерние виджеты рисуются в том же проходе: нулевой таймер сработает после первого кадра
+            QTimer.singleShot(0, self.start_audio)
+
+    def start_audio(self):
+        """
+        Starts the engine process and polls until it listens, then connects:
+        the GUI thread never waits for the process. Without one, the engine
+        is created in this process.
+        """
+        if self._engine is not None:
+            return
+        if not self._engine_process_started:
+            self._start_engine_process()
+        if self._engine_process is not None and not self._connect_engine_process():
+            QTimer.singleShot(ENGINE_POLL_MS, self.start_audio)
+            return
+        self.init_audio()
+
+    def _start_engine_process(self):
+        self._engine_process_started = True
+        if not self.config.get('engine_process', True):
+            return
+        from utils import engine_service
+        if not engine_service.available():
+            return
+        try:
+            self._engine_process = engine_service.start_engine_process(self.config)
+            self._engine_process_started_at = time.monotonic()
+        except Exception as e:
+            print(f"Could not start the engine process: {e}")
+
+    def _connect_engine_process(self):
+        """
+        One attempt to connect to the engine process. False while it is still
+        starting; True once connected or given up on (the process is killed).
+        """
+        from utils.engine_service import SPAWN_TIMEOUT, EngineClient
+
+        process, socket_path = self._engine_process
+        if process.poll() is not None:
+            error = f"it exited with code {process.returncode}"
+        elif time.monotonic() - self._engine_process_started_at > SPAWN_TIMEOUT:
+            error = f"it did not start listening on {socket_path}"
+        elif not os.path.exists(socket_path):
+            return False
+        else:
+            # Сокет появляется, когда движок в процессе уже создан: hello отвечается сразу
+            # Уведомления приходят из потока чтения сокета и идут в GUI сигналами
+            try:
+                self._engine = EngineClient(socket_path, on_track_changed=self.track_advanced.emit,
+                                            on_finished=self.playback_finished.emit, process=process,
+                                            on_error=self.engine_error.emit)
+                self._engine_process = None
+                return True
+            except (FileNotFoundError, ConnectionRefusedError):
+                # Файл сокета создан, но listen() ещё не вызван
+                return False
+            except Exception as e:
+                error = e
+        print(f"Engine process is unavailable, playing in this process: {error}")
+        process.kill()
+        self._engine_process = None
+        return True
+
+    def init_audio(self):
+        """
+        Finishes the audio setup once start_audio has connected to the engine
+        process, creating the engine in this process if there is none.
+        """
+        from utils.engine_service import create_engine
+        from utils.loudness import DEFAULT_TARGET_LUFS
+
+        if self.config.get('normalize_loudness', True):
+            self.loudness_target = self.config.get('loudness_target', DEFAULT_TARGET_LUFS)
+        if self._engine is None:
+            # Один поток вывода на всё время работы
+            self._engine = create_engine(self.config, self.track_advanced.emit, self.playback_finished.emit)
+            self._engine_in_process = True
+            self.seek_index = self._engine.seek_index
+        self._engine.volume = 0.0 if self.is_muted else self.volume
+        if self.playback_speed() != 1.0:
+            self._engine.set_speed(self.playback_speed())
+        if self.scan_worker is None:
+            self.start_loudness_analysis()
+        if self._pending_play is not None:
+            song_index, start_pos_ms = self._pending_play
+            self._pending_play = None
+            self.play_song(song_index, start_pos_ms)
+
+    @property
+    def engine(self):
+        """The playback engine, or None until start_audio has it after the first paint."""
+        return self._engine
         
+    def _probe_gui_lag(self):
+        now = time.perf_counter()
+        lag_ms = max(0.0, (now - self._gui_probe_at) * 1000 - GUI_PROBE_MS)
+        self._gui_probe_at = now
+        self.gui_lag.add(lag_ms)
+        if lag_ms >= GUI_STALL_MS:
+            self.gui_stalls.append((time.time(), lag_ms / 1000))
+
+    def audio_health(self):
+        """
+        The engine's AudioStats snapshot with the GUI event loop lag. With the
+        engine in this process, dropouts during a GUI stall are put down to it.
+        """
+        engine, error = None, None
+        if self._engine is not None:
+            try:
+                engine = self._engine.audio_stats()
+            except (ConnectionError, TimeoutError, RuntimeError) as e:
+                error = str(e)
+        stalls = list(self.gui_stalls)
+        if engine is not None and self._engine_in_process:
+            attribute_gui_stalls(engine, stalls)
+        track = self._engine.track_path() if self._engine_in_process else None
+        if track is None and 0 <= self.current_song_index < len(self.song_library):
+            track = self.song_library[self.current_song_index]['audio_path']
+        return {
+            'engine': engine,
+            'error': error,
+            'engine_process': self._engine is not None and not self._engine_in_process,
+            'track': track,
+            'gui': {
+                'probe_ms': GUI_PROBE_MS,
+                'lag_ms': self.gui_lag.to_dict(),
+                'stalls': [{'time': end, 'ms': duration * 1000} for end, duration in stalls],
+            },
+        }
+
+    def dump_audio_health(self):
+        path = os.path.abspath(time.strftime('audio_health-%Y%m%d-%H%M%S.json'))
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.audio_health(), f, indent=2, ensure_ascii=False)
+            print(f"Audio health saved to {path}")
+        except OSError as e:
+            print(f"Could not save the audio health dump: {e}")
+
     def init_ui(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -133,25 +329,25 @@ class OsuPlayerApp(QMainWindow):
         controls_widget = QWidget()
         controls_widget.setLayout(controls_layout)
         self.shuffle_button = QPushButton()
-        self.shuffle_button.setIcon(self.shuffle_icon)
+        self.shuffle_button.setIcon(self.icons['shuffle_off'])
         self.shuffle_button.setCheckable(True)
         self.shuffle_button.setObjectName("shuffleButton")
         self.prev_button = QPushButton()
-        self.prev_button.setIcon(self.prev_icon)
+        self.prev_button.setIcon(self.icons['prev'])
         self.prev_button.setIconSize(QSize(32, 32))
         self.play_pause_button = QPushButton()
-        self.play_pause_button.setIcon(self.play_icon)
+        self.play_pause_button.setIcon(self.icons['play'])
         self.play_pause_button.setIconSize(QSize(36, 36))
         self.next_button = QPushButton()
-        self.next_button.setIcon(self.next_icon)
+        self.next_button.setIcon(self.icons['next'])
         self.next_button.setIconSize(QSize(32, 32))
         self.repeat_button = QPushButton()
-        self.repeat_button.setIcon(self.repeat_icon)
+        self.repeat_button.setIcon(self.icons['repeat_off'])
         self.repeat_button.setObjectName("repeatButton")
         self.prev_button.setObjectName("prevButton")
         self.play_pause_button.setObjectName("playPauseButton")
         self.next_button.setObjectName("nextButton")
-        self.volume_popup = VolumePopupWidget(self.volume_icons)
+        self.volume_popup = VolumePopupWidget(self.icons['volume'])
         controls_layout.addStretch(1)
         controls_layout.addWidget(self.shuffle_button)
         controls_layout.addWidget(self.prev_button)
@@ -179,12 +375,39 @@ class OsuPlayerApp(QMainWindow):
         self.search_bar = QLineEdit()
         self.search_bar.setPlaceholderText("Search songs...")
         self.search_bar.setObjectName("searchBar")
-        self.song_list_widget = QListWidget()
-        self.song_list_widget.setObjectName("songListWidget")
-        self.song_list_widget.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        self.song_list_widget.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        for song in self.song_library:
-            self.song_list_widget.addItem(song['display_text'])
+        # --- Модель/представление: отрисовываются только видимые строки ---
+        # QTableView с фиксированной высотой строк не обходит всю модель при
+        # раскладке (в отличие от QListView), поэтому используется как список
+        self.song_model = SongListModel(self.song_library, self)
+        self.song_proxy_model = SongFilterProxyModel(self)
+        self.song_proxy_model.setSourceModel(self.song_model)
+        self.song_list_view = QTableView()
+        self.song_list_view.setObjectName("songListWidget")
+        self.song_list_view.setModel(self.song_proxy_model)
+        self.song_list_view.horizontalHeader().hide()
+        self.song_list_view.horizontalHeader().setStretchLastSection(True)
+        self.song_list_view.verticalHeader().hide()
+        self.song_list_view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.song_list_view.verticalHeader().setDefaultSectionSize(34)
+        self.song_list_view.setShowGrid(False)
+        self.song_list_view.setWordWrap(False)
+        self.song_list_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.song_list_view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.song_list_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.song_list_view.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.song_list_view.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+
+        # --- Строка состояния сканирования ---
+        self.scan_status_widget = QWidget()
+        scan_status_layout = QHBoxLayout(self.scan_status_widget)
+        scan_status_layout.setContentsMargins(0, 0, 0, 0)
+        self.scan_status_label = QLabel()
+        self.scan_status_label.setObjectName("scanStatusLabel")
+        self.scan_cancel_button = QPushButton("Cancel")
+        self.scan_cancel_button.setObjectName("scanCancelButton")
+        scan_status_layout.addWidget(self.scan_status_label, 1)
+        scan_status_layout.addWidget(self.scan_cancel_button)
+        self.scan_status_widget.hide()
 
         # --- Контейнер для скроллбара ---
         self.scrollbar_container = QWidget()
@@ -202,11 +425,11 @@ class OsuPlayerApp(QMainWindow):
         list_and_scroll_layout = QHBoxLayout(list_and_scroll_container)
         list_and_scroll_layout.setContentsMargins(0, 0, 0, 0)
         list_and_scroll_layout.setSpacing(10) # Отступ между списком и скроллбаром
-        list_and_scroll_layout.addWidget(self.song_list_widget, 1)
+        list_and_scroll_layout.addWidget(self.song_list_view, 1)
         list_and_scroll_layout.addWidget(self.scrollbar_container)
         
         # Синхронизация скроллбаров
-        sbar = self.song_list_widget.verticalScrollBar()
+        sbar = self.song_list_view.verticalScrollBar()
         if sbar is not None:
             self.song_list_scrollbar.setMinimum(sbar.minimum())
             self.song_list_scrollbar.setMaximum(sbar.maximum())
@@ -217,6 +440,7 @@ class OsuPlayerApp(QMainWindow):
             sbar.rangeChanged.connect(lambda minv, maxv: self.song_list_scrollbar.setRange(minv, maxv))
         
         right_panel_layout.addWidget(self.search_bar)
+        right_panel_layout.addWidget(self.scan_status_widget)
         right_panel_layout.addWidget(list_and_scroll_container)
         
         # --- Splitter, который разделяет левую и правую панели ---
@@ -259,12 +483,19 @@ class OsuPlayerApp(QMainWindow):
         right_controls_layout.setSpacing(15)
 
         self.dt_button = QPushButton()
-        self.dt_button.setIcon(self.dt_icon)
+        self.dt_button.setIcon(self.icons['dt_off'])
         self.dt_button.setIconSize(QSize(24, 24))
         self.dt_button.setCheckable(True)
         self.dt_button.setObjectName("dtButton")
+
+        self.ht_button = QPushButton()
+        self.ht_button.setIcon(self.icons['ht_off'])
+        self.ht_button.setIconSize(QSize(24, 24))
+        self.ht_button.setCheckable(True)
+        self.ht_button.setObjectName("htButton")
         
         right_controls_layout.addWidget(self.volume_popup)
+        right_controls_layout.addWidget(self.ht_button)
         right_controls_layout.addWidget(self.dt_button)
 
         bottom_bar_layout.addSpacerItem(QSpacerItem(20, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum))
@@ -275,19 +506,26 @@ class OsuPlayerApp(QMainWindow):
         main_layout.addWidget(main_splitter, 1)
         main_layout.addWidget(bottom_bar_widget)
         # --- Подключения сигналов ---
-        self.search_bar.textChanged.connect(self.filter_song_list)
+        self.search_bar.textChanged.connect(self.search_timer.start)
+        self.search_bar.returnPressed.connect(self.apply_search)
         self.play_pause_button.clicked.connect(self.toggle_play_pause)
         self.next_button.clicked.connect(self.next_song)
         self.prev_button.clicked.connect(self.previous_song)
         self.shuffle_button.clicked.connect(self.toggle_shuffle)
         self.repeat_button.clicked.connect(self.toggle_repeat)
-        self.song_list_widget.itemDoubleClicked.connect(self.play_selected_song_from_item)
+        self.song_list_view.doubleClicked.connect(self.play_selected_song)
         self.dt_button.clicked.connect(self.toggle_dt)
+        self.ht_button.clicked.connect(self.toggle_ht)
         self.progress_slider.sliderPressed.connect(self.slider_pressed)
         self.progress_slider.sliderReleased.connect(self.slider_released)
         self.progress_slider.sliderMoved.connect(self.update_time_label_on_drag)
         self.volume_popup.mute_toggled.connect(self.toggle_mute)
         self.volume_popup.volume_changed.connect(self.set_volume)
+        self.scan_cancel_button.clicked.connect(self.cancel_scan)
+        # --- Отладка звука: F12 показывает счётчики поверх окна, Ctrl+F12 сохраняет их в JSON ---
+        self.audio_overlay = AudioHealthOverlay(self.audio_health, central_widget)
+        QShortcut(QKeySequence("F12"), self).activated.connect(self.audio_overlay.toggle)
+        QShortcut(QKeySequence("Ctrl+F12"), self).activated.connect(self.dump_audio_health)
         # --- Initial State ---
         self.set_volume(int(self.volume * 100))
         self.set_controls_enabled(False)
@@ -297,6 +535,7 @@ class OsuPlayerApp(QMainWindow):
         self.play_pause_button.setEnabled(enabled)
         self.next_button.setEnabled(enabled)
         self.dt_button.setEnabled(enabled)
+        self.ht_button.setEnabled(enabled)
         self.progress_slider.setEnabled(enabled)
         self.volume_popup.setEnabled(enabled)
         self.shuffle_button.setEnabled(enabled)
@@ -305,19 +544,246 @@ class OsuPlayerApp(QMainWindow):
         if not enabled:
             # Сброс состояния, когда нет активного трека
             self.shuffle_button.setChecked(False)
-            self.shuffle_button.setIcon(self.shuffle_icon)
+            self.shuffle_button.setIcon(self.icons['shuffle_off'])
             self.repeat_mode = 0
-            self.repeat_button.setIcon(self.repeat_icon)
+            self.repeat_button.setIcon(self.icons['repeat_off'])
             self.repeat_button.setProperty("class", "")
             style = self.repeat_button.style()
             if style:
                 style.polish(self.repeat_button)
 
+    def start_scan(self, songs_dir, workers=1, watch=True, loudness_workers=1, use_osu_db=True, cache_path=CACHE_PATH):
+        """
+        Scans the library in the background; songs show up as they are found.
+        With watch=True the Songs directory is watched for changes afterwards.
+        Once the scan is done, tracks without a loudness measurement are
+        analyzed in loudness_workers background processes. use_osu_db lets
+        the scan take beatmap metadata from osu!.db (see scan_songs); the
+        library cache is kept at cache_path.
+        """
+        self.songs_dir = songs_dir
+        self.cache_path = cache_path
+        self.watch_songs_dir = watch
+        self.loudness_workers = loudness_workers
+        self.scan_worker = ScanWorker(songs_dir, workers, self, use_osu_db=use_osu_db, cache_path=cache_path)
+        self.scan_worker.songs_found.connect(self.add_songs)
+        self.scan_worker.progress.connect(self.update_scan_progress)
+        self.scan_worker.scan_finished.connect(self.handle_scan_finished)
+        self.scan_started_at = None
+        self.scan_status_label.setText("Scanning songs...")
+        self.scan_cancel_button.setEnabled(True)
+        self.scan_status_widget.show()
+        self.scan_worker.start()
+
+    def cancel_scan(self):
+        if self.scan_worker and self.scan_worker.isRunning():
+            self.scan_worker.cancel()
+            self.scan_cancel_button.setEnabled(False)
+            self.scan_status_label.setText("Cancelling scan...")
+
+    def update_scan_progress(self, done, total):
+        if self.scan_started_at is None:
+            self.scan_started_at = time.monotonic()
+        if not self.scan_cancel_button.isEnabled():
+            return
+        text = f"Scanning songs... {done}/{total}"
+        if 0 < done < total:
+            elapsed = time.monotonic() - self.scan_started_at
+            eta_ms = elapsed / done * (total - done) * 1000
+            text += f" · {format_time(eta_ms)} left"
+        self.scan_status_label.setText(text)
+
+    def handle_scan_finished(self, song_library, cancelled):
+        self.scan_worker = None
+        self.set_library(song_library)
+        self.scan_status_widget.hide()
+        if self.watch_songs_dir and not cancelled and self.library_watcher is None:
+            self.library_watcher = LibraryWatcher(self.songs_dir, self, self.cache_path)
+            self.library_watcher.library_changed.connect(self.apply_library_diff)
+            self.library_watcher.start()
+        if not cancelled:
+            self.start_loudness_analysis()
+        if not song_library and not cancelled:
+            msg_box = QMessageBox(self)
+            msg_box.setIcon(QMessageBox.Icon.Warning)
+            msg_box.setText("No songs found in the selected directory.")
+            msg_box.setWindowTitle("Empty Library")
+            msg_box.exec()
+
+    def add_songs(self, songs):
+        """
+        Merges a batch of songs found by the scan into the library. The rows
+        are inserted into the model in place, so the view keeps its state and
+        only the indices of the current track and the queues are moved.
+        """
+        songs = sorted(songs, key=lambda x: x['display_text'])
+        if not self.song_library:
+            self.set_library(songs)
+            return
+        # song_library — тот же список, что у модели: она вставляет песни прямо в него
+        positions = self.song_model.insert_songs(songs)
+
+        def moved(index):
+            # Перед старым индексом встали все песни с позицией вставки не больше его
+            return index + bisect_right(positions, index) if index >= 0 else index
+
+        self.current_song_index = moved(self.current_song_index)
+        self.history = [moved(i) for i in self.history]
+        self.shuffled_indices = [moved(i) for i in self.shuffled_indices]
+        if self.shuffle_enabled:
+            for i, position in enumerate(positions):
+                self.shuffled_indices.insert(random.randint(0, len(self.shuffled_indices)), position + i)
+        self.queue_next_track()
+
+    def apply_library_diff(self, diff):
+        """
+        Applies an added/removed/updated diff from the watcher. The track that
+        is playing right now is never removed under the player: its removal
+        waits until playback moves to another song.
+        """
+        current_path = None
+        if 0 <= self.current_song_index < len(self.song_library):
+            current_path = self.song_library[self.current_song_index]['audio_path']
+
+        removed = set(diff['removed'])
+        if current_path in removed:
+            removed.discard(current_path)
+            self.pending_removals.add(current_path)
+        changed = {song['audio_path']: song for song in diff['updated'] + diff['added']}
+        self.pending_removals -= changed.keys()
+
+        library = []
+        for song in self.song_library:
+            path = song['audio_path']
+            if path in removed:
+                continue
+            library.append(changed.pop(path, song))
+        library.extend(changed.values())
+        library.sort(key=lambda x: x['display_text'])
+        self.set_library(library)
+        if any('loudness' not in song for song in changed.values()):
+            self.start_loudness_analysis()
+
+    def start_loudness_analysis(self):
+        """
+        Starts the background pass over the library: songs imported from
+        osu!.db get their backgrounds, durations and hashes, and, once
+        init_audio has set a loudness target, tracks without a loudness
+        measurement are measured.
+        """
+        if not self.songs_dir or self.scan_worker is not None:
+            return
+        if self.loudness_worker is not None:
+            # Новые песни разберёт следующий проход
+            self.loudness_rerun = True
+            return
+        # Цель громкости задаёт init_audio: до запуска движка громкость не измеряется
+        measure_loudness = self.loudness_target is not None and any('loudness' not in song
+                                                                     for song in self.song_library)
+        self.loudness_rerun = False
+        self.loudness_worker = LoudnessWorker(self.songs_dir, list(self.song_library), self.loudness_workers, self,
+                                             self.cache_path, measure_loudness)
+        self.loudness_worker.loudness_ready.connect(self.apply_loudness)
+        self.loudness_worker.details_ready.connect(self.apply_library_diff)
+        self.loudness_worker.finished.connect(self.handle_loudness_finished)
+        self.loudness_worker.start()
+
+    def handle_loudness_finished(self):
+        self.loudness_worker = None
+        if self.loudness_rerun:
+            self.start_loudness_analysis()
+
+    def apply_loudness(self, results):
+        """Attaches measured loudness to the songs; it applies from their next play."""
+        for song in self.song_library:
+            loudness = results.get(song['audio_path'])
+            if loudness is not None:
+                song['loudness'] = loudness
+        # Следующий трек уже подготовлен движком: обновляем его громкость
+        self.queue_next_track()
+
+    def song_gain(self, song):
+        from utils.loudness import track_gain
+
+        if self.loudness_target is None:
+            return 1.0
+        return track_gain(song.get('loudness'), self.loudness_target)
+
+    def _apply_pending_removals(self):
+        removals, self.pending_removals = self.pending_removals, set()
+        self.set_library([song for song in self.song_library if song['audio_path'] not in removals])
+
+    def set_library(self, song_library):
+        """
+        Replaces the library while keeping the current track, the selection and
+        the shuffle queue pointing at the same songs (matched by audio path).
+        """
+        def path_at(index):
+            return self.song_library[index]['audio_path'] if 0 <= index < len(self.song_library) else None
+
+        current_path = path_at(self.current_song_index)
+        selected_path = path_at(self.selected_song_index())
+        shuffled_paths = [path_at(i) for i in self.shuffled_indices]
+        history_paths = [path_at(i) for i in self.history]
+
+        self.song_library = song_library
+        positions = {song['audio_path']: i for i, song in enumerate(song_library)}
+        self.current_song_index = positions.get(current_path, -1)
+        self.history = [positions[p] for p in history_paths if p in positions]
+        self.shuffled_indices = [positions[p] for p in shuffled_paths if p in positions]
+        if self.shuffle_enabled:
+            # Новые песни тоже попадают в перемешанную очередь
+            known = set(self.shuffled_indices) | set(self.history) | {self.current_song_index}
+            new_indices = [i for i in range(len(song_library)) if i not in known]
+            for i in new_indices:
+                self.shuffled_indices.insert(random.randint(0, len(self.shuffled_indices)), i)
+
+        # --- Обновление модели с сохранением прокрутки и выделения ---
+        sbar = self.song_list_view.verticalScrollBar()
+        scroll_value = sbar.value() if sbar is not None else 0
+        self.song_model.set_songs(song_library)
+        if selected_path in positions:
+            self.select_song(positions[selected_path], scroll=False)
+        if sbar is not None:
+            sbar.setValue(scroll_value)
+        self.queue_next_track()
+        if self.scan_worker is None:
+            # Во время сканирования библиотека меняется каждые несколько сотен мс,
+            # индекс строится один раз по её окончательному виду
+            self.build_search_index()
+
+    def build_search_index(self):
+        worker = SearchIndexWorker(self.song_library, self)
+        worker.index_ready.connect(self.song_proxy_model.set_search_index)
+        worker.finished.connect(lambda: self.index_workers.remove(worker))
+        self.index_workers.append(worker)
+        worker.start()
+
+    def selected_song_index(self):
+        """Library index of the selected row, or -1."""
+        index = self.song_list_view.currentIndex()
+        if not index.isValid():
+            return -1
+        return self.song_proxy_model.mapToSource(index).row()
+
+    def select_song(self, song_index, scroll=True):
+        proxy_index = self.song_proxy_model.mapFromSource(self.song_model.index(song_index, 0))
+        if not proxy_index.isValid():
+            self.song_list_view.clearSelection()
+            return
+        self.song_list_view.setCurrentIndex(proxy_index)
+        if scroll:
+            self.song_list_view.scrollTo(proxy_index)
+
+    def apply_search(self):
+        self.search_timer.stop()
+        self.filter_song_list(self.search_bar.text())
+
     def filter_song_list(self, text):
-        for i in range(self.song_list_widget.count()):
-            item = self.song_list_widget.item(i)
-            if item:
-                item.setHidden(text.lower() not in item.text().lower())
+        selected = self.selected_song_index()
+        self.song_proxy_model.set_filter_text(text)
+        if selected >= 0:
+            self.select_song(selected)
 
     def apply_stylesheet(self):
         self.setStyleSheet("""
@@ -329,20 +795,20 @@ class OsuPlayerApp(QMainWindow):
             QMainWindow {
                 background-color: #222222;
             }
-            QListWidget {
+            QTableView {
                 background-color: #2c2c2c;
                 border: 1px solid #444444;
                 font-size: 14px;
                 padding: 5px;
                 outline: none;
             }
-            QListWidget::item {
+            QTableView::item {
                 padding: 8px;
             }
-            QListWidget::item:hover {
+            QTableView::item:hover {
                 background-color: #3a3a3a;
             }
-            QListWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #ff66aa;
                 color: #ffffff;
             }
@@ -371,6 +837,14 @@ class OsuPlayerApp(QMainWindow):
             #catLabel {
                 color: #bbbbbb;
             }
+            #scanStatusLabel {
+                color: #999999;
+                font-size: 12px;
+            }
+            #scanCancelButton {
+                color: #bbbbbb;
+                font-size: 12px;
+            }
             #searchBar {
                 background-color: #2c2c2c;
                 border: 1px solid #444444;
@@ -482,13 +956,13 @@ class OsuPlayerApp(QMainWindow):
             QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
                 background: none;
             }
-            #dtButton {
+            #dtButton, #htButton {
                 margin: 0 0 0 0;
                 padding: 6px;
                 background: none;
                 background-color: transparent;
             }
-            #dtButton:hover:!disabled {
+            #dtButton:hover:!disabled, #htButton:hover:!disabled {
                 background-color: #232336;
                 color: #ff66aa;
             }
@@ -548,50 +1022,78 @@ class OsuPlayerApp(QMainWindow):
         self.volume = value / 100.0
         if not self.is_muted:
             self.last_volume = self.volume
-            icon = self.volume_popup.volume_icon_high if value > 50 else self.volume_popup.volume_icon_med if value > 0 else self.volume_popup.volume_icon_low
+            icon = self.volume_popup.icons['high'] if value > 50 else self.volume_popup.icons['med'] if value > 0 else self.volume_popup.icons['low']
             self.volume_popup.set_icon(icon)
         self.volume_popup.set_slider_position(value)
+        self._update_engine_volume()
 
     def toggle_mute(self):
         self.is_muted = not self.is_muted
         if self.is_muted:
-            self.volume_popup.set_icon(self.volume_popup.volume_icon_mute)
+            self.volume_popup.set_icon(self.volume_popup.icons['mute'])
         else:
             current_volume_percent = int(self.last_volume * 100)
-            icon = self.volume_popup.volume_icon_high if current_volume_percent > 50 else self.volume_popup.volume_icon_med if current_volume_percent > 0 else self.volume_popup.volume_icon_low
+            icon = self.volume_popup.icons['high'] if current_volume_percent > 50 else self.volume_popup.icons['med'] if current_volume_percent > 0 else self.volume_popup.icons['low']
             self.volume_popup.set_icon(icon)
             self.volume = self.last_volume
+        self._update_engine_volume()
+
+    def _update_engine_volume(self):
+        # До init_audio громкость просто запоминается: движок возьмёт её при создании
+        if self._engine is not None:
+            self._engine.volume = 0.0 if self.is_muted else self.volume
+
+    def playback_speed(self):
+        if self.is_dt_enabled:
+            return 1.5
+        if self.is_ht_enabled:
+            return 0.75
+        return 1.0
 
     def toggle_dt(self):
         self.is_dt_enabled = self.dt_button.isChecked()
-        self.dt_button.setIcon(self.dt_icon_on if self.is_dt_enabled else self.dt_icon)
-        
-        # Если песня сейчас играет (или на паузе), нужно плавно переключить скорость
-        if self.stream and (self.stream.active or self.is_paused) and self.samplerate > 0:
-            # 1. Сохраняем текущую музыкальную позицию в кадрах
-            frame_to_preserve = self.current_frame
-            
-            # 2. Определяем НОВУЮ скорость воспроизведения
-            new_playback_rate = self.samplerate * 1.5 if self.is_dt_enabled else self.samplerate
-            
-            # 3. Рассчитываем новую стартовую позицию в миллисекундах,
-            #    которая будет соответствовать сохраненному кадру при новой скорости.
-            new_start_pos_ms = (frame_to_preserve / new_playback_rate) * 1000
-            
-            # 4. Перезапускаем воспроизведение с этой новой, пересчитанной позиции.
-            #    Функция play_song также обновит BPM на лету.
-            self.play_song(self.current_song_index, start_pos_ms=new_start_pos_ms)
+        if self.is_dt_enabled and self.is_ht_enabled:
+            self.ht_button.setChecked(False)
+            self.is_ht_enabled = False
+        self.apply_playback_speed()
+
+    def toggle_ht(self):
+        self.is_ht_enabled = self.ht_button.isChecked()
+        if self.is_ht_enabled and self.is_dt_enabled:
+            self.dt_button.setChecked(False)
+            self.is_dt_enabled = False
+        self.apply_playback_speed()
+
+    def apply_playback_speed(self):
+        self.dt_button.setIcon(self.icons['dt_on'] if self.is_dt_enabled else self.icons['dt_off'])
+        self.ht_button.setIcon(self.icons['ht_on'] if self.is_ht_enabled else self.icons['ht_off'])
+
+        # Темп меняется без смены высоты и без перезапуска; позиция в треке сохраняется.
+        # Движок, которого ещё нет, возьмёт темп в init_audio
+        if self._engine is None:
+            return
+        self.engine.set_speed(self.playback_speed())
+        if self.engine.has_track():
+            self.update_info_on_selection(self.current_song_index)
+            self.update_duration_display(self.track_duration() / self.playback_speed() * 1000)
+
+    def track_duration(self):
+        """Length of the current track in seconds: probed at scan time, or from the engine for older cache entries."""
+        if 0 <= self.current_song_index < len(self.song_library):
+            duration = self.song_library[self.current_song_index].get('duration')
+            if duration:
+                return duration
+        return self.engine.duration() if self._engine is not None else 0.0
 
     def update_duration_display(self, duration_ms):
         self.total_time_label.setText(format_time(duration_ms))
         self.progress_slider.setMaximum(int(duration_ms))
 
     def update_progress_bar(self):
-        if self.stream and not self.user_is_seeking and self.current_playback_rate > 0:
-            with self.playback_lock:
-                position_ms = (self.current_frame / self.current_playback_rate) * 1000
-                self.progress_slider.setValue(int(position_ms))
-                self.current_time_label.setText(format_time(position_ms))
+        if self._engine is not None and self.engine.has_track() and not self.user_is_seeking:
+            position_ms = self.engine.position() / self.playback_speed() * 1000
+            self.progress_slider.setValue(int(position_ms))
+            self.current_time_label.setText(format_time(position_ms))
 
     def handle_playback_finished(self):
         if not self.is_paused and not self.user_is_seeking:
@@ -601,11 +1103,18 @@ class OsuPlayerApp(QMainWindow):
             else:
                 self.next_song()
 
+    def handle_engine_error(self, cmd, message):
+        """A command sent to the engine process failed; it answers after play_song has returned."""
+        if cmd == 'play':
+            print(f"Error processing audio file: {message}")
+            self._stop_current_playback()
+        else:
+            print(f"Engine command {cmd} failed: {message}")
+
     def set_music_position(self, position_ms):
-        if self.audio_file and self.current_playback_rate > 0:
-            with self.playback_lock:
-                self.current_frame = int((position_ms / 1000.0) * self.current_playback_rate)
-                self.audio_file.seek(self.current_frame)
+        if self._engine is None:
+            return
+        self.engine.seek(position_ms / 1000.0 * self.playback_speed())
 
     def update_info_on_selection(self, index):
         if not (0 <= index < len(self.song_library)):
@@ -616,95 +1125,38 @@ class OsuPlayerApp(QMainWindow):
         self.artist_label.setText(song_info['artist'])
 
         bpm_text = f"BPM: {song_info['bpm']}" if song_info.get('bpm') else ""
-        if self.is_dt_enabled and song_info.get('bpm'):
-             bpm_text += f" -> {round(song_info['bpm'] * 1.5)}"
+        if self.playback_speed() != 1.0 and song_info.get('bpm'):
+             bpm_text += f" -> {round(song_info['bpm'] * self.playback_speed())}"
         self.bpm_label.setText(bpm_text)
 
-        if song_info['background_path']:
-            pixmap = QPixmap(song_info['background_path'])
-            self.cover_label.setPixmap(pixmap.scaled(
-                280, 280,
-                Qt.AspectRatioMode.KeepAspectRatioByExpanding,
-                Qt.TransformationMode.SmoothTransformation
-            ))
+        # Обложка декодируется в фоне; пока её нет, поле остаётся пустым
+        self.displayed_cover_path = song_info['background_path']
+        pixmap = self.cover_cache.get(self.displayed_cover_path) if self.displayed_cover_path else None
+        if pixmap is not None:
+            self.cover_label.setPixmap(pixmap)
         else:
             self.cover_label.clear()
-            self.cover_label.setText("No Cover")
-        
-        self.song_list_widget.setCurrentRow(index)
-    
-    def _stop_current_playback(self):
-        self.stop_playback_event.set()
-        if self.playback_thread and self.playback_thread.is_alive():
-            self.playback_thread.join()
-        self.stop_playback_event.clear()
-
-    def _audio_callback(self, outdata, frames, time, status):
-        if status:
-            print(status, file=sys.stderr)
-
-        with self.playback_lock:
-            if self.is_paused or not self.audio_file:
-                outdata.fill(0)
-                return
-
-            chunk = self.audio_file.read(frames, dtype='float32', always_2d=True)
-            
-            if len(chunk) == 0:
-                outdata.fill(0)
-                raise sd.CallbackStop # End of song
-
-            # Apply volume
-            volume = self.volume if not self.is_muted else 0.0
-            chunk *= volume
-            
-            if chunk.shape[0] < frames:
-                outdata[:len(chunk)] = chunk
-                outdata[len(chunk):].fill(0)
-            else:
-                outdata[:] = chunk
-            
-            self.current_frame += len(chunk)
-
-    def _playback_manager(self, start_pos_ms):
-        try:
-            if not self.audio_file:
-                return
-
-            with self.playback_lock:
-                self.audio_file.seek(self.current_frame)
-
-            self.stream = sd.OutputStream(
-                samplerate=self.current_playback_rate, # Use the effective rate for playback
-                channels=self.audio_file.channels,
-                callback=self._audio_callback
-            )
-            self.stream.start()
-            self.is_paused = False
-            self.play_pause_button.setIcon(self.pause_icon)
+            if not self.displayed_cover_path:
+                self.cover_label.setText("No Cover")
+        self.cover_cache.prefetch(self.song_library[i]['background_path'] for i in self.upcoming_song_indices())
 
-            # Keep the thread alive while the stream is active
-            while not self.stop_playback_event.is_set() and self.stream.active:
-                 time.sleep(0.1)
+        self.select_song(index)
 
-        except Exception as e:
-            print(f"Error in playback thread: {e}")
-        finally:
-            if self.stream:
-                self.stream.stop()
-                self.stream.close(ignore_errors=True)
-                self.stream = None
-            if self.audio_file:
-                self.audio_file.close()
-                self.audio_file = None
-
-            if not self.stop_playback_event.is_set():
-                self.playback_finished.emit()
+    def show_loaded_cover(self, path):
+        pixmap = self.cover_cache.get(path) if path == self.displayed_cover_path else None
+        if pixmap is not None:
+            self.cover_label.setPixmap(pixmap)
+    
+    def _stop_current_playback(self):
+        self._pending_play = None
+        if self._engine is not None:
+            self.engine.stop()
+        self.playback_timer.stop()
 
     def play_song(self, song_index: int, start_pos_ms: float = 0.0):
         if song_index == -1: # Сигнал остановки
             self._stop_current_playback()
-            self.play_pause_button.setIcon(self.play_icon)
+            self.play_pause_button.setIcon(self.icons['play'])
             self.set_controls_enabled(False)
             self.progress_slider.setValue(0)
             self.current_time_label.setText("00:00")
@@ -712,6 +1164,10 @@ class OsuPlayerApp(QMainWindow):
         
         if not (0 <= song_index < len(self.song_library)):
             return
+        if self._engine is None:
+            # Движок ещё подключается: песня заиграет из init_audio
+            self._pending_play = (song_index, start_pos_ms)
+            return
 
         # Обновление истории для shuffle
         if self.shuffle_enabled:
@@ -722,61 +1178,94 @@ class OsuPlayerApp(QMainWindow):
             if not self.history or self.history[-1] != song_index:
                  self.history.append(song_index)
 
-        self._stop_current_playback()
-        
-        self.left_panel_stack.setCurrentWidget(self.player_widget)
-        self.current_song_index = song_index
         song_info = self.song_library[song_index]
-        
         try:
-            self.audio_file = sf.SoundFile(song_info['audio_path'])
-            self.samplerate = self.audio_file.samplerate
-            self.total_frames = len(self.audio_file)
-            
-            # Setup playback rate for DT
-            if self.is_dt_enabled:
-                self.current_playback_rate = self.samplerate * 1.5
-            else:
-                self.current_playback_rate = self.samplerate
-
+            # Поток вывода не пересоздаётся: движок просто переключает источник
+            self.engine.play(song_info['audio_path'], start_pos_ms / 1000.0 * self.playback_speed(),
+                             self.song_gain(song_info))
         except Exception as e:
             print(f"Error processing audio file: {e}")
             self._stop_current_playback()
             return
-        
-        duration_ms = (self.total_frames / self.current_playback_rate) * 1000 if self.current_playback_rate > 0 else 0
+
+        self._show_current_track(song_index)
+
+    def handle_track_advanced(self, audio_path):
+        """The engine moved on to the queued track without a gap: update the player state to match."""
+        if self.repeat_mode == 2:
+            song_index = self.current_song_index
+        else:
+            song_index = self.get_next_song_index()
+        if not (0 <= song_index < len(self.song_library)) or self.song_library[song_index]['audio_path'] != audio_path:
+            # Очередь изменилась, пока следующий трек уже готовился
+            song_index = next((i for i, song in enumerate(self.song_library) if song['audio_path'] == audio_path), -1)
+        if song_index == -1:
+            self.play_song(-1)
+            return
+        self._show_current_track(song_index)
+
+    def _show_current_track(self, song_index):
+        # Удаленные с диска треки убираются из библиотеки, когда их перестали играть
+        if self.pending_removals and song_index != self.current_song_index:
+            target_path = self.song_library[song_index]['audio_path']
+            self._apply_pending_removals()
+            song_index = next(i for i, song in enumerate(self.song_library) if song['audio_path'] == target_path)
+
+        self.left_panel_stack.setCurrentWidget(self.player_widget)
+        self.current_song_index = song_index
+        self.is_paused = False
+        self.play_pause_button.setIcon(self.icons['pause'])
+
         self.update_info_on_selection(song_index)
-        self.set_music_position(start_pos_ms)
-        self.update_duration_display(duration_ms)
-        
+        self.update_duration_display(self.track_duration() / self.playback_speed() * 1000)
+        self.update_progress_bar()
         self.set_controls_enabled(True)
-        
-        # Start playback manager in a new thread
-        self.playback_thread = threading.Thread(target=self._playback_manager, args=(start_pos_ms,))
-        self.playback_thread.daemon = True
-        self.playback_thread.start()
+        self.queue_next_track()
 
         self.playback_timer.start(100)
+
+    def peek_next_song_index(self):
+        """The song that will play after the current one, without advancing the queue."""
+        if self.current_song_index < 0:
+            return -1
+        if self.repeat_mode == 2:
+            return self.current_song_index
+        if self.shuffle_enabled:
+            return self.shuffled_indices[0] if self.shuffled_indices else -1
+        next_index = self.current_song_index + 1
+        return next_index if next_index < len(self.song_library) else -1
+
+    def queue_next_track(self):
+        """Lets the engine pre-open the next song so the transition is gapless."""
+        # Библиотека приходит из кэша ещё до первого кадра: движок ради неё не создаётся
+        if self._engine is None or not self._engine.has_track():
+            return
+        next_index = self.peek_next_song_index()
+        if next_index >= 0:
+            next_song = self.song_library[next_index]
+            self.engine.queue_next(next_song['audio_path'], self.song_gain(next_song))
+        else:
+            self.engine.queue_next(None)
     
     def toggle_play_pause(self):
-        if not self.stream: # Not playing anything
-            current_row = self.song_list_widget.currentRow()
+        if self._engine is None or not self.engine.has_track(): # Not playing anything
+            current_row = self.selected_song_index()
             if current_row < 0 and self.song_library:
                 current_row = 0
             if current_row >= 0:
                 self.play_song(current_row)
             return
 
-        if self.stream:
-            if self.is_paused:
-                self.is_paused = False
-                self.play_pause_button.setIcon(self.pause_icon)
-            else:
-                self.is_paused = True
-                self.play_pause_button.setIcon(self.play_icon)
+        if self.is_paused:
+            self.is_paused = False
+            self.play_pause_button.setIcon(self.icons['pause'])
+        else:
+            self.is_paused = True
+            self.play_pause_button.setIcon(self.icons['play'])
+        self.engine.paused = self.is_paused
 
-    def play_selected_song_from_item(self, item):
-        selected_index = self.song_list_widget.row(item)
+    def play_selected_song(self, proxy_index):
+        selected_index = self.song_proxy_model.mapToSource(proxy_index).row()
         if self.shuffle_enabled:
             # При ручном выборе, перегенерируем плейлист,
             # чтобы он начинался с выбранного трека
@@ -794,7 +1283,7 @@ class OsuPlayerApp(QMainWindow):
         if self.current_song_index < 0: return
         
         # Если трек играет больше 3 секунд, "назад" просто перезапускает его
-        position_ms = (self.current_frame / self.current_playback_rate) * 1000 if self.current_playback_rate > 0 else 0
+        position_ms = self.engine.position() / self.playback_speed() * 1000 if self._engine is not None else 0.0
         if position_ms > 3000:
             self.play_song(self.current_song_index)
             return
@@ -803,37 +1292,56 @@ class OsuPlayerApp(QMainWindow):
         self.play_song(prev_index)
 
     def closeEvent(self, event):
-        self._stop_current_playback()
+        if self.library_watcher:
+            self.library_watcher.stop()
+        if self.scan_worker:
+            self.scan_worker.cancel()
+            self.scan_worker.wait()
+        for worker in list(self.index_workers):
+            worker.wait()
+        if self.loudness_worker:
+            # Уже измеренное сохраняется в кэш, анализ продолжится при следующем запуске
+            self.loudness_worker.cancel()
+            self.loudness_worker.wait()
+        self.cover_cache.shutdown()
+        self.playback_timer.stop()
+        if self._engine is not None:
+            self._engine.close()
+        if self._engine_process is not None:
+            self._engine_process[0].kill()
+        if self.seek_index is not None:
+            self.seek_index.close()
         event.accept()
 
     def toggle_shuffle(self):
         self.shuffle_enabled = self.shuffle_button.isChecked()
-        self.shuffle_button.setIcon(self.shuffle_icon_on if self.shuffle_enabled else self.shuffle_icon)
+        self.shuffle_button.setIcon(self.icons['shuffle_on'] if self.shuffle_enabled else self.icons['shuffle_off'])
         if self.shuffle_enabled:
             self.generate_shuffled_list()
         else:
             # При отключении шаффла, сбрасываем историю и перемешанный плейлист
             self.shuffled_indices = []
             self.history = []
+        self.queue_next_track()
 
     def toggle_repeat(self):
         # 0: No Repeat, 2: Repeat One
         if self.repeat_mode == 0:
             self.repeat_mode = 2 # Turn on Repeat One
-            self.repeat_button.setIcon(self.repeat_icon_one)
+            self.repeat_button.setIcon(self.icons['repeat_one'])
             self.repeat_button.setProperty("class", "repeat-one")
         else:
             self.repeat_mode = 0 # Turn off
-            self.repeat_button.setIcon(self.repeat_icon)
+            self.repeat_button.setIcon(self.icons['repeat_off'])
             self.repeat_button.setProperty("class", "")
         
         # Обновление стиля
         style = self.repeat_button.style()
         if style:
             style.polish(self.repeat_button)
+        self.queue_next_track()
 
     def generate_shuffled_list(self):
-        import random
         # Создаем список индексов, кроме текущей песни
         indices = list(range(len(self.song_library)))
         if self.current_song_index != -1:
@@ -870,6 +1378,19 @@ class OsuPlayerApp(QMainWindow):
             return -1 # Конец плейлиста
         return next_index
 
+    def upcoming_song_indices(self, count=COVER_PREFETCH_COUNT):
+        """Indices the next/previous buttons are likely to play, without touching the queue."""
+        if self.shuffle_enabled:
+            upcoming = self.shuffled_indices[:count]
+            if len(self.history) > 1:
+                upcoming.append(self.history[-2])
+            return upcoming
+        current = self.current_song_index
+        upcoming = [i for i in range(current + 1, current + 1 + count) if i < len(self.song_library)]
+        if current > 0:
+            upcoming.append(current - 1)
+        return upcoming
+
     def get_previous_song_index(self):
         if not self.song_library:
             return -1
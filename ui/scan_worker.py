@@ -0,0 +1,119 @@
+import threading
+
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+
+from utils.scanner import CACHE_PATH, analyze_loudness, complete_songs, rescan_folders, scan_songs
+from utils.search import SearchIndex
+from utils.watcher import SongsWatcher
+
+
+class ScanWorker(QThread):
+    """Runs scan_songs off the GUI thread and streams its results as signals."""
+    songs_found = pyqtSignal(list)
+    progress = pyqtSignal(int, int)
+    scan_finished = pyqtSignal(list, bool)  # library, cancelled
+
+    def __init__(self, songs_dir, workers=1, parent=None, use_osu_db=True, cache_path=CACHE_PATH):
+        super().__init__(parent)
+        self.songs_dir = songs_dir
+        self.workers = workers
+        self.use_osu_db = use_osu_db
+        self.cache_path = cache_path
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def run(self):
+        library = scan_songs(
+            self.songs_dir,
+            workers=self.workers,
+            cache_path=self.cache_path,
+            use_osu_db=self.use_osu_db,
+            on_songs=self.songs_found.emit,
+            on_progress=self.progress.emit,
+            cancel_event=self._cancel_event,
+        )
+        self.scan_finished.emit(library, self._cancel_event.is_set())
+
+
+class LoudnessWorker(QThread):
+    """
+    The background pass after a scan, off the GUI thread: complete_songs
+    fills in the songs imported from osu!.db, their changes arrive through
+    details_ready as a library diff; then, with measure_loudness,
+    analyze_loudness runs and its saved batches arrive through loudness_ready.
+    """
+    loudness_ready = pyqtSignal(dict)
+    details_ready = pyqtSignal(dict)
+
+    def __init__(self, songs_dir, song_library, workers=1, parent=None, cache_path=CACHE_PATH, measure_loudness=True):
+        super().__init__(parent)
+        self.songs_dir = songs_dir
+        self.song_library = song_library
+        self.workers = workers
+        self.cache_path = cache_path
+        self.measure_loudness = measure_loudness
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def run(self):
+        complete_songs(
+            self.songs_dir,
+            workers=self.workers,
+            cache_path=self.cache_path,
+            on_diff=self.details_ready.emit,
+            cancel_event=self._cancel_event,
+        )
+        if not self.measure_loudness or self._cancel_event.is_set():
+            return
+        analyze_loudness(
+            self.songs_dir,
+            self.song_library,
+            workers=self.workers,
+            cache_path=self.cache_path,
+            on_results=self.loudness_ready.emit,
+            cancel_event=self._cancel_event,
+        )
+
+
+class SearchIndexWorker(QThread):
+    """Builds a SearchIndex over a library snapshot off the GUI thread."""
+    index_ready = pyqtSignal(object)
+
+    def __init__(self, song_library, parent=None):
+        super().__init__(parent)
+        self.song_library = song_library
+
+    def run(self):
+        self.index_ready.emit(SearchIndex(self.song_library))
+
+
+class LibraryWatcher(QObject):
+    """
+    Watches the Songs directory and re-parses changed beatmapset folders on the
+    watcher thread; the resulting add/remove/update diff is delivered to the
+    GUI thread through library_changed.
+    """
+    library_changed = pyqtSignal(dict)
+
+    def __init__(self, songs_dir, parent=None, cache_path=CACHE_PATH):
+        super().__init__(parent)
+        self.songs_dir = songs_dir
+        self.cache_path = cache_path
+        self.watcher = SongsWatcher(songs_dir, self._rescan)
+
+    def start(self):
+        self.watcher.start()
+
+    def stop(self):
+        self.watcher.stop()
+
+    def _rescan(self, set_folders):
+        diff = rescan_folders(self.songs_dir, set_folders, self.cache_path)
+        if diff['added'] or diff['removed'] or diff['updated']:
+            print(f"Library updated: {len(diff['added'])} added, {len(diff['removed'])} removed, "
+                  f"{len(diff['updated'])} updated.")
+            self.library_changed.emit(diff)
@@ -0,0 +1,238 @@
+from bisect import bisect_left
+
+from PyQt6.QtCore import QAbstractListModel, QAbstractProxyModel, QModelIndex, Qt, pyqtSignal
+
+from utils.scanner import format_time
+from utils.search import linear_search, song_search_text
+
+
+def _insert_position(songs, display_text):
+    """Index after the last song in songs (sorted by display text) whose display text is not above display_text."""
+    lo, hi = 0, len(songs)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if display_text < songs[mid]['display_text']:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+class SongListModel(QAbstractListModel):
+    """Read-only list model over the song library (a list of song dicts)."""
+    SongRole = Qt.ItemDataRole.UserRole + 1
+    # После всех вставок insert_songs(): позиции вставки каждой песни в прежнем списке
+    songs_inserted = pyqtSignal(list)
+
+    def __init__(self, songs=None, parent=None):
+        super().__init__(parent)
+        self.songs = songs or []
+        self._search_keys = None
+
+    def set_songs(self, songs):
+        self.beginResetModel()
+        self.songs = songs
+        self._search_keys = None
+        self.endResetModel()
+
+    def insert_songs(self, songs):
+        """
+        Merges songs, sorted by display text, into the list sorted the same
+        way, with one row insertion per run of songs that land between the
+        same two rows. Returns the index in the old list before which each
+        song was inserted; songs_inserted gets the same list once all rows
+        are in.
+        """
+        positions = [_insert_position(self.songs, song['display_text']) for song in songs]
+        # Серии вставляются с конца: позиции ещё не вставленных серий не сдвигаются
+        end = len(songs)
+        while end > 0:
+            start = end - 1
+            while start > 0 and positions[start - 1] == positions[end - 1]:
+                start -= 1
+            position = positions[start]
+            self.beginInsertRows(QModelIndex(), position, position + end - start - 1)
+            self.songs[position:position] = songs[start:end]
+            if self._search_keys is not None:
+                self._search_keys[position:position] = [song_search_text(song) for song in songs[start:end]]
+            self.endInsertRows()
+            end = start
+        self.songs_inserted.emit(positions)
+        return positions
+
+    @property
+    def search_keys(self):
+        """Casefolded searchable fields per song, built on the first unindexed search after a reset."""
+        if self._search_keys is None:
+            self._search_keys = [song_search_text(song) for song in self.songs]
+        return self._search_keys
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.songs)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            song = self.songs[index.row()]
+            if song.get('duration'):
+                return f"{song['display_text']}  [{format_time(song['duration'] * 1000)}]"
+            return song['display_text']
+        if role == self.SongRole:
+            return self.songs[index.row()]
+        return None
+
+
+class SongFilterProxyModel(QAbstractProxyModel):
+    """
+    Filtering proxy for SongListModel. Unlike QSortFilterProxyModel
+    it does not call back into Python once per row: the visible rows come from
+    the SearchIndex of the current library (or, until it is built, one pass
+    over the source's search keys) and are kept as a plain list, so a filter
+    change is a single model reset. While a filter is set, a batch of songs
+    merged in by SongListModel.insert_songs is searched on its own, without
+    searching the rest of the library again.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.filter_text = ''
+        self.fuzzy = True
+        self.search_index = None
+        self._rows = []
+        self._positions = None
+
+    def setSourceModel(self, source_model):
+        old_model = self.sourceModel()
+        if old_model is not None:
+            old_model.modelAboutToBeReset.disconnect(self.beginResetModel)
+            old_model.modelReset.disconnect(self._source_reset)
+            old_model.rowsAboutToBeInserted.disconnect(self._source_rows_about_to_be_inserted)
+            old_model.rowsInserted.disconnect(self._source_rows_inserted)
+            old_model.songs_inserted.disconnect(self._source_songs_inserted)
+        self.beginResetModel()
+        super().setSourceModel(source_model)
+        source_model.modelAboutToBeReset.connect(self.beginResetModel)
+        source_model.modelReset.connect(self._source_reset)
+        source_model.rowsAboutToBeInserted.connect(self._source_rows_about_to_be_inserted)
+        source_model.rowsInserted.connect(self._source_rows_inserted)
+        source_model.songs_inserted.connect(self._source_songs_inserted)
+        self._rebuild()
+        self.endResetModel()
+
+    def _source_reset(self):
+        self._rebuild()
+        self.endResetModel()
+
+    def _source_rows_about_to_be_inserted(self, parent, first, last):
+        if not self.filter_text:
+            # Без фильтра строки вставляются там же, где в источнике
+            self.beginInsertRows(QModelIndex(), first, last)
+
+    def _source_rows_inserted(self, parent, first, last):
+        # Индекс построен по списку без новых песен
+        self.search_index = None
+        if not self.filter_text:
+            self._rows = range(len(self.sourceModel().songs))
+            self._positions = None
+            self.endInsertRows()
+
+    def _source_songs_inserted(self, positions):
+        if not self.filter_text:
+            return
+        # С фильтром строки обновляются один раз на всю пачку: старые сдвигаются за один проход,
+        # а ищутся только новые песни. Пока идёт сканирование, строки могут чуть отличаться от
+        # поиска по всей библиотеке, он повторится по её окончательному виду
+        rows = []
+        inserted = 0
+        for row in self._rows:
+            while inserted < len(positions) and positions[inserted] <= row:
+                inserted += 1
+            rows.append(row + inserted)
+        self._rows = rows
+        self._positions = None
+        songs = self.sourceModel().songs
+        new_rows = [position + i for i, position in enumerate(positions)]
+        texts = [song_search_text(songs[row]) for row in new_rows]
+        matches = [new_rows[i] for i in linear_search(texts, self.filter_text, fuzzy=self.fuzzy)]
+        # Группы строк, попадающих между одними и теми же видимыми строками, вставляются с конца
+        end = len(matches)
+        while end > 0:
+            position = bisect_left(rows, matches[end - 1])
+            start = end - 1
+            while start > 0 and bisect_left(rows, matches[start - 1]) == position:
+                start -= 1
+            self.beginInsertRows(QModelIndex(), position, position + end - start - 1)
+            rows[position:position] = matches[start:end]
+            self.endInsertRows()
+            end = start
+
+    def _rebuild(self):
+        source = self.sourceModel()
+        if source is None:
+            self._rows = []
+        elif self.filter_text:
+            if self.search_index is not None and self.search_index.songs is source.songs:
+                self._rows = self.search_index.search(self.filter_text, fuzzy=self.fuzzy)
+            else:
+                # Индекс ещё строится: тот же поиск перебором, строки не изменятся, когда индекс будет готов
+                self._rows = linear_search(source.search_keys, self.filter_text, fuzzy=self.fuzzy)
+        else:
+            self._rows = range(len(source.songs))
+        self._positions = None
+
+    def set_search_index(self, search_index):
+        """Uses search_index for filtering; it is ignored unless built over the current songs."""
+        self.search_index = search_index
+        if self.filter_text and search_index.songs is self.sourceModel().songs:
+            self.beginResetModel()
+            self._rebuild()
+            self.endResetModel()
+
+    def set_filter_text(self, text):
+        text = text.strip().casefold()
+        if text == self.filter_text:
+            return
+        self.beginResetModel()
+        self.filter_text = text
+        self._rebuild()
+        self.endResetModel()
+
+    def source_rows(self):
+        """Library indices of the visible rows, in view order."""
+        return self._rows
+
+    # --- QAbstractProxyModel ---
+    def index(self, row, column=0, parent=QModelIndex()):
+        if parent.isValid() or column != 0 or not 0 <= row < len(self._rows):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 1
+
+    def mapToSource(self, proxy_index):
+        source = self.sourceModel()
+        if source is None or not proxy_index.isValid():
+            return QModelIndex()
+        return source.index(self._rows[proxy_index.row()], 0)
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        if isinstance(self._rows, range):
+            # Без фильтра строки совпадают со строками источника
+            row = source_index.row()
+            return self.createIndex(row, 0) if row in self._rows else QModelIndex()
+        if self._positions is None:
+            self._positions = {row: position for position, row in enumerate(self._rows)}
+        position = self._positions.get(source_index.row())
+        if position is None:
+            return QModelIndex()
+        return self.createIndex(position, 0)
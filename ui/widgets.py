@@ -1,6 +1,15 @@
-from PyQt6.QtWidgets import QWidget, QHBoxLayout, QPushButton, QSlider
-from PyQt6.QtGui import QIcon
-from PyQt6.QtCore import Qt, QSize, pyqtSignal
+import time
+
+from PyQt6.QtWidgets import QWidget, QHBoxLayout, QLabel, QPushButton, QSlider
+from PyQt6.QtGui import QFont, QIcon
+from PyQt6.QtCore import Qt, QSize, QTimer, pyqtSignal
+
+from utils.audio_stats import COUNTERS, percentile
+
+# Как часто оверлей перечитывает статистику
+OVERLAY_REFRESH_MS = 500
+# Сколько последних сбоев показывает оверлей
+OVERLAY_DROPOUTS = 4
 
 class VolumePopupWidget(QWidget):
     volume_changed = pyqtSignal(int)
@@ -9,10 +18,7 @@ class VolumePopupWidget(QWidget):
     def __init__(self, icons_dict, parent=None):
         super().__init__(parent)
 
-        self.volume_icon_high = icons_dict['high']
-        self.volume_icon_med = icons_dict['med']
-        self.volume_icon_low = icons_dict['low']
-        self.volume_icon_mute = icons_dict['mute']
+        self.icons = icons_dict
 
         layout = QHBoxLayout(self)
         layout.setContentsMargins(0, 8, 0, 8)
@@ -20,7 +26,7 @@ class VolumePopupWidget(QWidget):
         
         self.volume_button = QPushButton()
         self.volume_button.setObjectName("volumeButton")
-        self.volume_button.setIcon(self.volume_icon_high)
+        self.volume_button.setIcon(self.icons['high'])
         self.volume_button.setIconSize(QSize(24,24))
 
         self.volume_slider = QSlider(Qt.Orientation.Horizontal)
@@ -40,3 +46,81 @@ class VolumePopupWidget(QWidget):
         self.volume_slider.blockSignals(True)
         self.volume_slider.setValue(value)
         self.volume_slider.blockSignals(False)
+
+
+class AudioHealthOverlay(QLabel):
+    """
+    Debug overlay over the window with the audio health counters. source()
+    returns the dict of OsuPlayerApp.audio_health(); it is polled only while
+    the overlay is shown.
+    """
+
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self.source = source
+        self.setObjectName("audioHealthOverlay")
+        self.setFont(QFont("Courier New", 9))
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 200); color: #d0d0d0; padding: 8px;")
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(OVERLAY_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def toggle(self):
+        if self.isVisible():
+            self.refresh_timer.stop()
+            self.hide()
+            return
+        self.refresh()
+        self.show()
+        self.raise_()
+        self.refresh_timer.start()
+
+    def refresh(self):
+        self.setText(format_audio_health(self.source()))
+        self.adjustSize()
+        self.move(8, 8)
+
+
+def format_audio_health(health):
+    """Text of the overlay for a dict from OsuPlayerApp.audio_health()."""
+    lines = []
+    engine = health['engine']
+    gui = health['gui']
+    if engine is None:
+        lines.append("audio engine not running" if health.get('error') is None
+                     else f"audio engine unavailable: {health['error']}")
+    else:
+        histograms = engine['histograms']
+        session = engine['session']
+        lines.append(f"{'engine process' if health['engine_process'] else 'in-process engine'}, "
+                     f"block {engine['block_frames']} frames ({engine['block_budget_ms']:.1f} ms), "
+                     f"{engine['callbacks']} callbacks")
+        lines.append(f"session   underruns {session['underruns']}  underflows {session['output_underflows']}  "
+                     f"overflows {session['output_overflows']}  over budget {session['over_budget']}")
+        if health.get('track'):
+            track = engine['tracks'].get(health['track'], dict.fromkeys(COUNTERS, 0))
+            lines.append(f"track     underruns {track['underruns']}  underflows {track['output_underflows']}  "
+                         f"overflows {track['output_overflows']}  over budget {track['over_budget']}")
+        load = histograms['callback_load']
+        lines.append(f"callback  p50 {percentile(load, 0.5):.2f}  p99 {percentile(load, 0.99):.2f}  "
+                     f"max {load['max']:.2f} of the block budget")
+        interval = histograms['callback_interval']
+        lines.append(f"interval  p99 {percentile(interval, 0.99):.1f}  max {interval['max']:.1f} blocks")
+        fill = histograms['ring_fill_ms']
+        lines.append(f"ring fill p1 {percentile(fill, 0.01):.0f} ms  p50 {percentile(fill, 0.5):.0f} ms")
+        decode = histograms['decode_step_ms']
+        lines.append(f"decode    p99 {percentile(decode, 0.99):.1f} ms  max {decode['max']:.1f} ms per step")
+        lock = histograms['lock_wait_ms']
+        if lock['count']:
+            lines.append(f"lock wait p99 {percentile(lock, 0.99):.2f} ms  max {lock['max']:.2f} ms")
+    lag = gui['lag_ms']
+    lines.append(f"GUI lag   p99 {percentile(lag, 0.99):.0f} ms  max {lag['max']:.0f} ms, "
+                 f"{len(gui['stalls'])} stalls")
+    for dropout in (engine['dropouts'][-OVERLAY_DROPOUTS:] if engine else []):
+        lines.append(f"{time.strftime('%H:%M:%S', time.localtime(dropout['time']))} "
+                     f"{dropout['kind'].rstrip('s')} at {dropout['position']:.1f} s: {dropout['cause']}, "
+                     f"ring {dropout['fill_ms']:.0f} ms, decoder {dropout['decoder_task'] or 'idle'}")
+    lines.append("F12 hides, Ctrl+F12 saves a JSON dump")
+    return '\n'.join(lines)
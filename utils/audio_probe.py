@@ -0,0 +1,73 @@
+import os
+
+import soundfile as sf
+
+from utils.seek_index import MAX_SCAN_BYTES, map_file, scan_mp3_frames
+
+# Столько байт от начала файла хватает на ID3-тег обычного размера и первые фреймы
+HEAD_BYTES = 64 * 1024
+# Постоянство битрейта проверяется по кускам из стольких мест файла
+CBR_CHECK_POINTS = 8
+CBR_CHECK_BYTES = 8 * 1024
+VBR_TAGS = (b'Xing', b'Info', b'VBRI')
+
+
+def _frame_sizes(data):
+    offsets, _ = scan_mp3_frames(data)
+    # Первые фреймы куска могут оказаться ложной синхронизацией посреди данных
+    return {b - a for a, b in zip(offsets[2:], offsets[3:])}
+
+
+def _mp3_needs_frame_count(f, head, file_size):
+    """
+    True for an MP3 whose length the decoder can only estimate: no
+    Xing/Info/VBRI header and a bitrate that changes over the file. Without
+    the header, libsndfile extrapolates the length from the file size and
+    the first frame's bitrate, which is only right for CBR.
+    """
+    offsets, _ = scan_mp3_frames(head)
+    if len(offsets) < 2:
+        return False
+    if any(tag in head[offsets[0]:offsets[1]] for tag in VBR_TAGS):
+        return False
+    sizes = _frame_sizes(head)
+    for point in range(1, CBR_CHECK_POINTS):
+        f.seek(file_size * point // CBR_CHECK_POINTS)
+        sizes |= _frame_sizes(f.read(CBR_CHECK_BYTES))
+    # Байт заполнения меняет длину фрейма на 1 и при постоянном битрейте
+    return bool(sizes) and max(sizes) - min(sizes) > 1
+
+
+def probe_audio(path):
+    """
+    Reads the stream parameters of an audio file from its headers, without
+    decoding: {'duration' (seconds), 'samplerate', 'channels', 'codec',
+    'file_size'}, or None if the file cannot be opened. VBR MP3s without a
+    VBR header are the one case where the frames are counted, by walking
+    the frame headers of the first MAX_SCAN_BYTES and extrapolating past
+    them.
+    """
+    try:
+        info = sf.info(path)
+        file_size = os.path.getsize(path)
+        frames = info.frames
+        if info.format == 'MP3':
+            with open(path, 'rb') as f:
+                head = f.read(HEAD_BYTES)
+                if _mp3_needs_frame_count(f, head, file_size):
+                    with map_file(f) as data:
+                        offsets, samples_per_frame = scan_mp3_frames(data, MAX_SCAN_BYTES)
+                    frames = len(offsets) * samples_per_frame
+                    if file_size > MAX_SCAN_BYTES and offsets:
+                        # Остаток длинного файла досчитывается по среднему размеру просканированных фреймов
+                        frames = frames * (file_size - offsets[0]) // (MAX_SCAN_BYTES - offsets[0])
+    except Exception as e:
+        print(f"Error probing audio file {path}: {e}")
+        return None
+    return {
+        'duration': frames / info.samplerate if info.samplerate else 0.0,
+        'samplerate': info.samplerate,
+        'channels': info.channels,
+        'codec': info.subtype,
+        'file_size': file_size,
+    }
@@ -0,0 +1,226 @@
+"""
+Health counters of the audio path: output underflows and overflows, ring
+underruns, callback time against the block budget, ring fill, decoder step
+time and the time spent waiting for the engine process lock.
+
+The audio callback writes its counters without a lock: it is the only
+writer of them, an update is a list item or dict increment, and a reader
+on another thread only ever sees a counter that is one behind. Nothing is
+allocated per callback; a dropout appends one tuple to a short deque.
+Per-track counts go into a preallocated event ring and are folded into the
+per-track history by the decoder thread or a reader.
+"""
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+
+# Счётчики, которые ведутся за сессию и по трекам
+COUNTERS = ('underruns', 'output_underflows', 'output_overflows', 'over_budget')
+# Сколько последних треков хранят свои счётчики
+TRACK_HISTORY = 50
+# Кольцо событий счётчиков по трекам между сворачиваниями; декодер сворачивает его каждый шаг
+TRACK_EVENTS = 1024
+# Сколько последних сбоев хранится с обстановкой, в которой они случились
+DROPOUT_HISTORY = 32
+# Callback, начавшийся позже стольких периодов блока после предыдущего, считается опоздавшим
+LATE_INTERVAL = 2.0
+
+# Верхние границы корзин гистограмм; последняя корзина открыта
+LOAD_EDGES = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+INTERVAL_EDGES = (0.5, 0.9, 1.1, 1.5, 2.0, 3.0, 5.0)
+FILL_EDGES_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2000)
+TIME_EDGES_MS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Counts of values in buckets with the given upper edges, plus count, sum and max."""
+
+    def __init__(self, edges):
+        self.edges = tuple(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect_right(self.edges, value)] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def to_dict(self):
+        counts = list(self.counts)
+        count = sum(counts)
+        return {'edges': list(self.edges), 'counts': counts, 'count': count,
+                'mean': self.total / count if count else 0.0, 'max': self.max}
+
+
+class AudioStats:
+    """
+    Counters and histograms of one PlaybackEngine, written by its audio
+    callback and decoder thread; snapshot() gives a JSON-ready copy.
+
+    Each dropout (a ring underrun or an output underflow) is kept with what
+    the decoder was doing at the time, so it can be told apart as decode
+    (a decoder step or command running too long), lock (the decoder waiting
+    for the engine process lock), late callback (the ring had audio but the
+    callback started late, e.g. the interpreter was busy in another thread)
+    or starved (the decoder was idle yet behind).
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.callbacks = 0
+        self.session = dict.fromkeys(COUNTERS, 0)
+        self.tracks = {}
+        # (трек, счётчик) из callback по кругу; _events_written пишет только callback
+        self._event_tracks = [None] * TRACK_EVENTS
+        self._event_counters = [None] * TRACK_EVENTS
+        self._events_written = 0
+        self._events_folded = 0
+        self._fold_lock = threading.Lock()
+        self.block_frames = 0
+        self.block_budget = 0.0
+        self.load = Histogram(LOAD_EDGES)
+        self.interval = Histogram(INTERVAL_EDGES)
+        self.fill = Histogram(FILL_EDGES_MS)
+        self.decode = Histogram(TIME_EDGES_MS)
+        self.lock_wait = Histogram(TIME_EDGES_MS)
+        self.dropouts = deque(maxlen=DROPOUT_HISTORY)
+        # Чем занят поток декодера: 'decode', 'command', 'lock' или None, и с какого момента
+        self.decoder_task = None
+        self.decoder_since = 0.0
+        self.last_decode_ms = 0.0
+        self._last_start = 0.0
+
+    # --- Поток вывода ---
+    def callback_started(self, started, frames, rate, fill_frames):
+        """Records the start of a callback for frames at rate with fill_frames in the ring."""
+        if frames != self.block_frames:
+            self.block_frames = frames
+            self.block_budget = frames / rate
+        budget = self.block_budget
+        interval = (started - self._last_start) / budget if self._last_start else 1.0
+        self._last_start = started
+        self.callbacks += 1
+        self.interval.add(interval)
+        if fill_frames is not None:
+            self.fill.add(fill_frames * 1000 / rate)
+        return interval
+
+    def callback_finished(self, started, finished, track):
+        load = (finished - started) / self.block_budget
+        self.load.add(load)
+        if load > 1.0:
+            self.count('over_budget', track)
+
+    def count(self, counter, track):
+        self.session[counter] += 1
+        if track is None:
+            return
+        # Словарь по трекам не трогается: в callback только запись в готовые ячейки
+        slot = self._events_written % TRACK_EVENTS
+        self._event_tracks[slot] = track
+        self._event_counters[slot] = counter
+        self._events_written += 1
+
+    def dropout(self, kind, track, position, fill_frames, rate, interval, now):
+        """Counts a dropout of kind ('underruns', 'output_underflows') and keeps its context."""
+        self.count(kind, track)
+        task, since = self.decoder_task, self.decoder_since
+        busy_ms = (now - since) * 1000 if task is not None else 0.0
+        if task == 'lock':
+            cause = 'lock'
+        elif fill_frames >= self.block_frames or interval > LATE_INTERVAL:
+            # Звук в буфере был: не успел сам callback или устройство
+            cause = 'late callback'
+        elif task is not None and busy_ms > self.block_budget * 1000:
+            cause = 'decode'
+        else:
+            cause = 'starved'
+        self.dropouts.append((time.time(), kind, track, position, fill_frames * 1000 / rate, interval,
+                              task, busy_ms, self.last_decode_ms, cause))
+
+    # --- Поток декодера ---
+    def decoder_busy(self, task, now):
+        self.decoder_task = task
+        self.decoder_since = now
+
+    def decoder_idle(self, now, decoded=False):
+        if decoded:
+            self.last_decode_ms = (now - self.decoder_since) * 1000
+            self.decode.add(self.last_decode_ms)
+        self.decoder_task = None
+        if self._events_folded != self._events_written:
+            self.fold_track_counts()
+
+    def fold_track_counts(self):
+        """Moves the per-track counts recorded by the callback into tracks, keeping the last TRACK_HISTORY tracks."""
+        with self._fold_lock:
+            written = self._events_written
+            # Callback обогнал на целый круг: самые старые события потеряны (в session они есть)
+            start = max(self._events_folded, written - TRACK_EVENTS)
+            for i in range(start, written):
+                slot = i % TRACK_EVENTS
+                track = self._event_tracks[slot]
+                counters = self.tracks.get(track)
+                if counters is None:
+                    if len(self.tracks) >= TRACK_HISTORY:
+                        del self.tracks[next(iter(self.tracks))]
+                    counters = self.tracks[track] = dict.fromkeys(COUNTERS, 0)
+                counters[self._event_counters[slot]] += 1
+            self._events_folded = written
+
+    # --- Чтение ---
+    def snapshot(self):
+        """JSON-ready copy of everything recorded since the engine started."""
+        keys = ('time', 'kind', 'track', 'position', 'fill_ms', 'interval', 'decoder_task', 'decoder_busy_ms',
+                'last_decode_ms', 'cause')
+        self.fold_track_counts()
+        return {
+            'started': self.started,
+            'time': time.time(),
+            'callbacks': self.callbacks,
+            'block_frames': self.block_frames,
+            'block_budget_ms': self.block_budget * 1000,
+            'session': dict(self.session),
+            'tracks': {track: dict(counters) for track, counters in list(self.tracks.items())},
+            'histograms': {
+                'callback_load': self.load.to_dict(),
+                'callback_interval': self.interval.to_dict(),
+                'ring_fill_ms': self.fill.to_dict(),
+                'decode_step_ms': self.decode.to_dict(),
+                'lock_wait_ms': self.lock_wait.to_dict(),
+            },
+            'dropouts': [dict(zip(keys, dropout)) for dropout in list(self.dropouts)],
+        }
+
+
+def percentile(histogram, q):
+    """
+    Upper edge of the bucket of a Histogram.to_dict() that holds the q-th
+    quantile, capped by the largest value seen; 0.0 when it is empty.
+    """
+    rank = q * histogram['count']
+    seen = 0
+    for i, count in enumerate(histogram['counts']):
+        seen += count
+        if count and seen >= rank:
+            edges = histogram['edges']
+            return min(edges[i], histogram['max']) if i < len(edges) else histogram['max']
+    return 0.0
+
+
+def attribute_gui_stalls(snapshot, stalls, slack=0.05):
+    """
+    Marks the dropouts of snapshot that happened during one of stalls
+    ((end time, duration in seconds) of GUI event loop stalls) as 'gui stall'
+    when nothing in the engine explains them better. For an engine running
+    in the GUI process, where a busy GUI thread delays the callback.
+    """
+    for dropout in snapshot['dropouts']:
+        if dropout['cause'] not in ('late callback', 'starved'):
+            continue
+        if any(end - duration - slack <= dropout['time'] <= end + slack for end, duration in stalls):
+            dropout['cause'] = 'gui stall'
+    return snapshot
@@ -1,6 +1,5 @@
 import os
 import json
-from PyQt6.QtWidgets import QFileDialog, QMessageBox
 
 CONFIG_FILE = 'config.json'
 
@@ -15,6 +14,9 @@ def save_config(config):
         json.dump(config, f, indent=4)
 
 def get_songs_directory(parent=None):
+    # Qt грузится только здесь: load_config() нужен и режиму --daemon без Qt
+    from PyQt6.QtWidgets import QFileDialog, QMessageBox
+
     config = load_config()
     songs_dir = config.get('songs_directory')
 
@@ -0,0 +1,807 @@
+"""
+Audio engine in its own process, controlled over a local Unix socket.
+
+The protocol is one JSON object per line. A request is
+{"id": n, "cmd": name, ...arguments} and gets {"id": n, "result": ...} or
+{"id": n, "error": message} back. Events are pushed without an id:
+{"event": "track_changed", "path": ...}, {"event": "finished"} and, to
+connections that sent "subscribe", {"event": "state", ...} every interval.
+
+Commands: hello, play(path, start, gain), pause(paused), resume, stop,
+seek(seconds), set_speed(speed), set_volume(volume), queue_next(path, gain),
+enqueue(path, gain), next, state, stats, subscribe(interval), unsubscribe,
+shutdown. stats returns the engine's AudioStats snapshot (see audio_stats).
+
+The engine process owns the decoder, the play queue and the output
+stream. Its output ring buffer lives in shared memory together with a
+small header (track, position, duration, pause) that the server refreshes
+every STATE_INTERVAL and after each command, and the stats snapshot as
+JSON, refreshed every STATS_INTERVAL, so clients read the playback state,
+the audio health and the audio just played without a round trip.
+
+This module imports no Qt, numpy or audio libraries at the top: the GUI
+uses it as a thin client, and they are loaded only where an engine is built.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import queue
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+
+# Поля заголовка в общей памяти (float64); поле 0 — счётчик записи, нечётный во время записи
+HEADER_FIELDS = ('sequence', 'has_track', 'position', 'duration', 'paused', 'output_position', 'underruns')
+HEADER_BYTES = 64
+# Сколько раз клиент перечитывает заголовок, пока сервер пишет в него
+HEADER_READ_ATTEMPTS = 100
+# Снимок AudioStats в общей памяти: счётчик записи, длина и JSON
+STATS_BYTES = 256 * 1024
+STATS_PREFIX_BYTES = 16
+# Как часто сервер обновляет заголовок и рассылает события
+STATE_INTERVAL = 0.02
+# Как часто сервер обновляет снимок статистики
+STATS_INTERVAL = 0.5
+# Сколько ждать, пока запущенный процесс движка начнёт принимать подключения
+SPAWN_TIMEOUT = 15.0
+REQUEST_TIMEOUT = 10.0
+# Настройки из config.json, которые передаются процессу движка
+ENGINE_SETTINGS = ('resample_quality', 'pcm_cache_mb')
+# Метка в очереди отправки клиента: послать громкость, заданную последней
+_SEND_VOLUME = object()
+
+
+def available():
+    """Unix sockets are not available everywhere (e.g. Windows builds of Python)."""
+    return hasattr(socket, 'AF_UNIX')
+
+
+def default_socket_path():
+    """Socket of the --daemon engine: one per user."""
+    user = os.getuid() if hasattr(os, 'getuid') else os.getpid()
+    return os.path.join(tempfile.gettempdir(), f'osuradio-{user}.sock')
+
+
+def create_engine(config, on_track_changed=None, on_finished=None, ring_memory=None):
+    """
+    PlaybackEngine with the PCM cache and the MP3 seek index, set up from
+    the config.json settings (resample_quality, pcm_cache_mb). Loads the
+    audio stack. The seek index is left in engine.seek_index.
+    """
+    from utils.pcm_cache import DEFAULT_BUDGET_MB, PcmCache
+    from utils.playback import PlaybackEngine
+    from utils.resampler import DEFAULT_QUALITY
+    from utils.seek_index import SeekIndex
+
+    # Таблицы перемотки для MP3 строятся в фоне при первом проигрывании и хранятся рядом с кэшем
+    try:
+        seek_index = SeekIndex()
+    except Exception as e:
+        print(f"Seek index is unavailable: {e}")
+        seek_index = None
+    pcm_cache_mb = config.get('pcm_cache_mb', DEFAULT_BUDGET_MB)
+    return PlaybackEngine(
+        on_track_changed=on_track_changed,
+        on_finished=on_finished,
+        resample_quality=config.get('resample_quality', DEFAULT_QUALITY),
+        # Недавние треки хранятся декодированными: повтор и "назад" не трогают диск
+        pcm_cache=PcmCache(pcm_cache_mb * 1024 * 1024) if pcm_cache_mb else None,
+        seek_index=seek_index,
+        ring_memory=ring_memory,
+    )
+
+
+def _send(connection, message):
+    data = (json.dumps(message) + '\n').encode()
+    with connection.send_lock:
+        connection.sock.sendall(data)
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        # Интервал рассылки состояния; None — подписки нет
+        self.interval = None
+        self.next_state_at = 0.0
+
+
+class EngineServer:
+    """
+    Serves one PlaybackEngine on a Unix socket. With exit_when_orphaned
+    (the process started by the GUI) it stops when its last client
+    disconnects, when no client connects within SPAWN_TIMEOUT, or when the
+    parent process is gone.
+    """
+
+    def __init__(self, socket_path, config, exit_when_orphaned=False):
+        from utils.playback import OUTPUT_CHANNELS, RING_FRAMES
+
+        self.socket_path = socket_path
+        self.exit_when_orphaned = exit_when_orphaned
+        self.ring_frames = RING_FRAMES
+        self.channels = OUTPUT_CHANNELS
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=HEADER_BYTES + STATS_BYTES + RING_FRAMES * OUTPUT_CHANNELS * 4)
+        self.header = self.memory.buf[:HEADER_BYTES].cast('d')
+        self._stats_counters = self.memory.buf[HEADER_BYTES:HEADER_BYTES + STATS_PREFIX_BYTES].cast('q')
+        self._stats_data = self.memory.buf[HEADER_BYTES + STATS_PREFIX_BYTES:HEADER_BYTES + STATS_BYTES]
+        self._ring_memory = self.memory.buf[HEADER_BYTES + STATS_BYTES:]
+        self.engine = create_engine(config, self._track_changed, self._finished, ring_memory=self._ring_memory)
+        # Очередь после текущего трека: (path, gain); голова всегда подготовлена в движке
+        self.queue = deque()
+        self._lock = threading.Lock()
+        self._header_lock = threading.Lock()
+        self._events = queue.SimpleQueue()
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        self._had_client = False
+        self._parent = os.getppid()
+        self._stopped = threading.Event()
+
+    @contextlib.contextmanager
+    def _locked(self, decoder=False):
+        """
+        Holds self._lock and records the wait for it in the engine's stats;
+        with decoder, a dropout during the wait is put down to the lock.
+        """
+        stats = self.engine.stats
+        started = time.perf_counter()
+        if decoder:
+            stats.decoder_busy('lock', started)
+        with self._lock:
+            now = time.perf_counter()
+            # Гистограмму пишут под самой блокировкой: писатель всегда один
+            stats.lock_wait.add((now - started) * 1000)
+            if decoder:
+                stats.decoder_busy('command', now)
+            yield
+
+    # --- Обратные вызовы движка (поток декодера) ---
+    def _track_changed(self, path):
+        with self._locked(decoder=True):
+            if self.queue and self.queue[0][0] == path:
+                self.queue.popleft()
+            self._prepare_next()
+        # Сокеты трогает только поток рассылки: декодер не ждёт медленного клиента
+        self._events.put({'event': 'track_changed', 'path': path})
+
+    def _finished(self):
+        self._events.put({'event': 'finished'})
+
+    def _prepare_next(self):
+        path, gain = self.queue[0] if self.queue else (None, 1.0)
+        self.engine.queue_next(path, gain)
+
+    # --- Команды (под self._lock) ---
+    def _cmd_hello(self, connection):
+        return {'memory': self.memory.name, 'header_bytes': HEADER_BYTES, 'header_fields': HEADER_FIELDS,
+                'stats_bytes': STATS_BYTES, 'ring_frames': self.ring_frames, 'channels': self.channels,
+                'samplerate': self.engine.output_rate, 'pid': os.getpid()}
+
+    def _cmd_play(self, connection, path, start=0.0, gain=1.0):
+        self.engine.play(path, start, gain)
+
+    def _cmd_pause(self, connection, paused=True):
+        self.engine.paused = bool(paused)
+
+    def _cmd_resume(self, connection):
+        self.engine.paused = False
+
+    def _cmd_stop(self, connection):
+        self.queue.clear()
+        self.engine.stop()
+
+    def _cmd_seek(self, connection, seconds):
+        self.engine.seek(float(seconds))
+
+    def _cmd_set_speed(self, connection, speed):
+        self.engine.set_speed(float(speed))
+
+    def _cmd_set_volume(self, connection, volume):
+        self.engine.volume = float(volume)
+
+    def _cmd_queue_next(self, connection, path=None, gain=1.0):
+        """Replaces the queue with path (None empties it), like PlaybackEngine.queue_next."""
+        self.queue.clear()
+        if path is not None:
+            self.queue.append((path, gain))
+        self._prepare_next()
+
+    def _cmd_enqueue(self, connection, path, gain=1.0):
+        """Adds path to the end of the queue; starts it right away if nothing is playing."""
+        if not self.engine.has_track():
+            self.engine.play(path, 0.0, gain)
+            return
+        self.queue.append((path, gain))
+        if len(self.queue) == 1:
+            self._prepare_next()
+
+    def _cmd_next(self, connection):
+        if not self.queue:
+            self.engine.stop()
+            return
+        path, gain = self.queue.popleft()
+        self.engine.play(path, 0.0, gain)
+        self._prepare_next()
+
+    def _cmd_state(self, connection):
+        return self._state()
+
+    def _cmd_stats(self, connection):
+        return self.engine.audio_stats()
+
+    def _cmd_subscribe(self, connection, interval=0.5):
+        connection.interval = max(STATE_INTERVAL, float(interval))
+        connection.next_state_at = 0.0
+
+    def _cmd_unsubscribe(self, connection):
+        connection.interval = None
+
+    def _cmd_shutdown(self, connection):
+        self._stopped.set()
+
+    def _state(self):
+        engine = self.engine
+        return {
+            'track': engine.track_path(),
+            'position': engine.position(),
+            'duration': engine.duration(),
+            'paused': engine.paused,
+            'volume': engine.volume,
+            'speed': engine.speed,
+            'queue': [path for path, _ in self.queue],
+            'buffered_frames': engine.buffered_frames(),
+            'underruns': engine.underruns,
+        }
+
+    # --- Заголовок в общей памяти ---
+    def _publish(self):
+        engine = self.engine
+        values = (1.0 if engine.has_track() else 0.0, engine.position(), engine.duration(),
+                  1.0 if engine.paused else 0.0, float(engine.output_position()), float(engine.underruns))
+        with self._header_lock:
+            header = self.header
+            header[0] += 1
+            for i, value in enumerate(values, 1):
+                header[i] = value
+            header[0] += 1
+
+    def _publish_stats(self):
+        """Writes the AudioStats snapshot into shared memory for audio health overlays."""
+        with self._locked():
+            snapshot = self.engine.audio_stats()
+        data = json.dumps(snapshot, ensure_ascii=False).encode()
+        if len(data) > len(self._stats_data):
+            # Очень длинные пути треков: счётчики по трекам не помещаются
+            snapshot['tracks'] = {}
+            data = json.dumps(snapshot, ensure_ascii=False).encode()[:len(self._stats_data)]
+        counters = self._stats_counters
+        counters[0] += 1
+        counters[1] = len(data)
+        self._stats_data[:len(data)] = data
+        counters[0] += 1
+
+    # --- Сеть ---
+    def _handle(self, connection, request):
+        params = {key: value for key, value in request.items() if key not in ('id', 'cmd')}
+        handler = getattr(self, f"_cmd_{request.get('cmd')}", None)
+        if handler is None:
+            raise ValueError(f"Unknown command {request.get('cmd')!r}")
+        with self._locked():
+            result = handler(connection, **params)
+        # Клиент получает ответ, когда заголовок уже отражает команду
+        self._publish()
+        return result
+
+    def _serve_connection(self, connection):
+        try:
+            for line in connection.sock.makefile('rb'):
+                request = None
+                try:
+                    request = json.loads(line)
+                    reply = {'id': request.get('id'), 'result': self._handle(connection, request)}
+                except Exception as e:
+                    reply = {'id': request.get('id') if isinstance(request, dict) else None, 'error': str(e)}
+                _send(connection, reply)
+                if self._stopped.is_set():
+                    break
+        except OSError:
+            pass
+        finally:
+            with self._connections_lock:
+                self._connections.discard(connection)
+                orphaned = not self._connections
+            connection.sock.close()
+            if orphaned and self.exit_when_orphaned:
+                self._stopped.set()
+
+    def _broadcast_loop(self):
+        next_stats_at = 0.0
+        while not self._stopped.is_set():
+            try:
+                event = self._events.get(timeout=STATE_INTERVAL)
+            except queue.Empty:
+                event = None
+            self._publish()
+            now = time.monotonic()
+            if now >= next_stats_at:
+                next_stats_at = now + STATS_INTERVAL
+                self._publish_stats()
+            with self._connections_lock:
+                connections = list(self._connections)
+            state = None
+            for connection in connections:
+                messages = [event] if event else []
+                if connection.interval is not None and now >= connection.next_state_at:
+                    connection.next_state_at = now + connection.interval
+                    if state is None:
+                        with self._locked():
+                            state = dict(self._state(), event='state')
+                    messages.append(state)
+                try:
+                    for message in messages:
+                        _send(connection, message)
+                except OSError:
+                    pass
+            if self.exit_when_orphaned and os.getppid() != self._parent:
+                self._stopped.set()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        """Accepts clients until shutdown, then closes the engine and removes the socket and shared memory."""
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Сокет создаётся сразу только для владельца: между bind() и chmod() к нему успел бы подключиться кто угодно
+        umask = os.umask(0o177)
+        try:
+            listener.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        listener.listen()
+        listener.settimeout(STATE_INTERVAL * 10)
+        broadcaster = threading.Thread(target=self._broadcast_loop, name="EngineBroadcast", daemon=True)
+        broadcaster.start()
+        started = time.monotonic()
+        try:
+            while not self._stopped.is_set():
+                try:
+                    sock, _ = listener.accept()
+                except socket.timeout:
+                    if self.exit_when_orphaned and not self._had_client and time.monotonic() - started > SPAWN_TIMEOUT:
+                        break
+                    continue
+                connection = _Connection(sock)
+                with self._connections_lock:
+                    self._connections.add(connection)
+                self._had_client = True
+                threading.Thread(target=self._serve_connection, args=(connection,), name="EngineClient",
+                                 daemon=True).start()
+        finally:
+            self._stopped.set()
+            listener.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            broadcaster.join()
+            with self._connections_lock:
+                for connection in self._connections:
+                    connection.sock.close()
+            self.engine.close()
+            if self.engine.seek_index is not None:
+                self.engine.seek_index.close()
+            self.memory.unlink()
+            # Отображение закрывается, только когда на него не осталось ссылок (кольцо движка — одна из них)
+            self.engine = None
+            self.header.release()
+            self._stats_counters.release()
+            self._stats_data.release()
+            self._ring_memory.release()
+            self.memory.close()
+
+
+def serve(socket_path, config, exit_when_orphaned=False):
+    """Runs the engine process until shutdown or SIGINT/SIGTERM."""
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            # Сокет остался от процесса, который завершился аварийно
+            os.unlink(socket_path)
+        else:
+            probe.close()
+            raise RuntimeError(f"An engine is already listening on {socket_path}")
+    server = EngineServer(socket_path, config, exit_when_orphaned)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: server.stop())
+    server.run()
+
+
+class EngineClient:
+    """
+    Connection to an engine process with the control surface of
+    PlaybackEngine, so the GUI can use either. on_track_changed(path),
+    on_finished() and on_error(cmd, message), for a control command the
+    engine failed, are called on the client's reader thread, on_state(state)
+    for each state event after subscribe(). Position, duration, pause and
+    the audio stats come from shared memory without a round trip.
+
+    Control commands (play, seek, pause, volume, speed, the queue) return
+    at once: a writer thread sends them in order, and their replies only
+    mark them applied. Until then the header fields a command changes read
+    as the command left them, so the caller sees its own change right away.
+    Volume changes that pile up before the writer gets to them are sent
+    once, with the latest value.
+    """
+
+    def __init__(self, socket_path, on_track_changed=None, on_finished=None, on_state=None, process=None,
+                 on_error=None):
+        self.on_track_changed = on_track_changed
+        self.on_finished = on_finished
+        self.on_state = on_state
+        self.on_error = on_error
+        self.process = process
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(socket_path)
+        except OSError:
+            self._sock.close()
+            raise
+        self._ids = itertools.count(1)
+        self._pending = {}
+        # Команды без ожидания, на которые ещё нет ответа: id -> имя
+        self._sent = {}
+        self._closed = False
+        # Последний запрос, на который движок ответил; ответы приходят по порядку
+        self._applied = 0
+        # Поле заголовка: (значение, id команды), пока движок её не выполнил
+        self._expected = {}
+        self._volume = 1.0
+        self._volume_queued = False
+        self.speed = 1.0
+        self._outbox = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_loop, name="EngineClientWriter", daemon=True)
+        self._writer.start()
+        self._reader = threading.Thread(target=self._read_loop, name="EngineClientReader", daemon=True)
+        self._reader.start()
+
+        try:
+            hello = self.request('hello')
+            self.output_rate = hello['samplerate']
+            self.ring_frames = hello['ring_frames']
+            self.channels = hello['channels']
+            self._memory = shared_memory.SharedMemory(hello['memory'])
+        except BaseException:
+            # Рукопожатие не удалось: сокет и потоки клиента не должны пережить исключение
+            self._disconnect()
+            raise
+        # Память принадлежит процессу движка: трекер ресурсов клиента не должен её удалять
+        resource_tracker.unregister(self._memory._name, 'shared_memory')
+        header_bytes = hello['header_bytes']
+        self._header = self._memory.buf[:header_bytes].cast('d')
+        self._stats_counters = self._memory.buf[header_bytes:header_bytes + STATS_PREFIX_BYTES].cast('q')
+        self._stats_data = self._memory.buf[header_bytes + STATS_PREFIX_BYTES:header_bytes + hello['stats_bytes']]
+        self._ring_offset = header_bytes + hello['stats_bytes']
+        # Последнее согласованное чтение заголовка; до первого — движок без трека
+        self._header_values = dict.fromkeys(HEADER_FIELDS, 0.0)
+        self._stats_json = None
+
+    # --- Протокол ---
+    def _message(self, cmd, params):
+        request_id = next(self._ids)
+        return request_id, (json.dumps(dict(params, id=request_id, cmd=cmd)) + '\n').encode()
+
+    def send(self, cmd, **params):
+        """Queues a command without waiting for it; returns its id. An error reply goes to on_error."""
+        request_id, data = self._message(cmd, params)
+        self._sent[request_id] = cmd
+        self._outbox.put(data)
+        return request_id
+
+    def request(self, cmd, **params):
+        """Sends a command and waits for its result; raises RuntimeError with the engine's error message."""
+        if self._closed:
+            raise ConnectionError("Engine connection is closed")
+        request_id, data = self._message(cmd, params)
+        done = threading.Event()
+        slot = self._pending[request_id] = [done, None]
+        self._outbox.put(data)
+        if not done.wait(REQUEST_TIMEOUT):
+            self._pending.pop(request_id, None)
+            raise TimeoutError(f"Engine did not answer {cmd}")
+        reply = slot[1]
+        if reply is None:
+            raise ConnectionError("Engine process is gone")
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply.get('result')
+
+    def _write_loop(self):
+        while True:
+            data = self._outbox.get()
+            if data is None:
+                return
+            if data is _SEND_VOLUME:
+                # Громкость берётся на момент отправки: накопившиеся изменения уходят одним сообщением
+                self._volume_queued = False
+                _, data = self._message('set_volume', {'volume': self._volume})
+            try:
+                self._sock.sendall(data)
+            except OSError as e:
+                print(f"Engine process is gone: {e}")
+                self._fail_pending()
+                return
+
+    def _read_loop(self):
+        try:
+            for line in self._sock.makefile('rb'):
+                message = json.loads(line)
+                if 'id' in message:
+                    self._applied = max(self._applied, message['id'] or 0)
+                    slot = self._pending.pop(message['id'], None)
+                    cmd = self._sent.pop(message['id'], None)
+                    if slot is not None:
+                        slot[1] = message
+                        slot[0].set()
+                    elif 'error' in message:
+                        if self.on_error:
+                            self.on_error(cmd, message['error'])
+                        else:
+                            print(f"Engine command {cmd} failed: {message['error']}")
+                    continue
+                event = message.get('event')
+                if event == 'track_changed' and self.on_track_changed:
+                    self.on_track_changed(message['path'])
+                elif event == 'finished' and self.on_finished:
+                    self.on_finished()
+                elif event == 'state' and self.on_state:
+                    self.on_state(message)
+        except (OSError, ValueError):
+            pass
+        self._fail_pending()
+
+    def _disconnect(self):
+        """Sends what is queued, then closes the socket and stops both threads."""
+        self._closed = True
+        self._outbox.put(None)
+        self._writer.join(REQUEST_TIMEOUT)
+        # Поток чтения держит makefile(): без shutdown дескриптор не закрылся бы до его выхода
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+    def _fail_pending(self):
+        # Соединение закрыто: ожидающие запросы получают ошибку
+        for slot in list(self._pending.values()):
+            slot[0].set()
+
+    def _expect(self, request_id, **fields):
+        for field, value in fields.items():
+            self._expected[field] = (value, request_id)
+
+    def _read_header(self):
+        """
+        The header fields from a read the writer did not overlap, with the
+        fields of commands the engine has not applied yet as they set them.
+        If every attempt was torn, the previous consistent read is used.
+        """
+        header = self._header
+        for _ in range(HEADER_READ_ATTEMPTS):
+            sequence = header[0]
+            if sequence % 2 == 0:
+                values = header.tolist()
+                if header[0] == sequence:
+                    self._header_values = dict(zip(HEADER_FIELDS, values))
+                    break
+        if not self._expected:
+            return self._header_values
+        values = dict(self._header_values)
+        applied = self._applied
+        for field, (value, request_id) in list(self._expected.items()):
+            if request_id > applied:
+                values[field] = value
+            else:
+                del self._expected[field]
+        return values
+
+    # --- Интерфейс PlaybackEngine ---
+    def play(self, path, start_seconds=0.0, gain=1.0):
+        request_id = self.send('play', path=path, start=start_seconds, gain=gain)
+        self._expect(request_id, has_track=1.0, position=start_seconds, paused=0.0)
+
+    def queue_next(self, path, gain=1.0):
+        self.send('queue_next', path=path, gain=gain)
+
+    def stop(self):
+        request_id = self.send('stop')
+        self._expect(request_id, has_track=0.0, position=0.0)
+
+    def seek(self, seconds):
+        self._expect(self.send('seek', seconds=seconds), position=seconds)
+
+    def set_speed(self, speed):
+        self.speed = speed
+        self.send('set_speed', speed=speed)
+
+    def has_track(self):
+        return bool(self._read_header()['has_track'])
+
+    def position(self):
+        return self._read_header()['position']
+
+    def duration(self):
+        return self._read_header()['duration']
+
+    def buffered_frames(self):
+        return self.request('state')['buffered_frames']
+
+    @property
+    def paused(self):
+        return bool(self._read_header()['paused'])
+
+    @paused.setter
+    def paused(self, value):
+        self._expect(self.send('pause', paused=bool(value)), paused=1.0 if value else 0.0)
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, value):
+        self._volume = value
+        if not self._volume_queued:
+            self._volume_queued = True
+            self._outbox.put(_SEND_VOLUME)
+
+    # --- Только для процесса движка ---
+    def next(self):
+        self.send('next')
+
+    def enqueue(self, path, gain=1.0):
+        self.send('enqueue', path=path, gain=gain)
+
+    def state(self):
+        return self.request('state')
+
+    def audio_stats(self):
+        """The engine's AudioStats snapshot from shared memory (up to STATS_INTERVAL old), or None before the first."""
+        counters = self._stats_counters
+        for _ in range(HEADER_READ_ATTEMPTS):
+            sequence = counters[0]
+            length = counters[1]
+            if sequence % 2 == 0 and 0 <= length <= len(self._stats_data):
+                data = bytes(self._stats_data[:length])
+                if counters[0] == sequence:
+                    self._stats_json = data or None
+                    break
+        return json.loads(self._stats_json) if self._stats_json else None
+
+    def subscribe(self, interval=0.5):
+        self.request('subscribe', interval=interval)
+
+    def recent_output(self, frames):
+        """Copy of the last frames handed to the output device (for level meters and visualizers)."""
+        import numpy as np
+
+        ring = np.ndarray((self.ring_frames, self.channels), dtype=np.float32,
+                          buffer=self._memory.buf, offset=self._ring_offset)
+        end = int(self._read_header()['output_position'])
+        frames = min(frames, end, self.ring_frames)
+        indices = np.arange(end - frames, end) % self.ring_frames
+        return ring[indices]
+
+    def close(self):
+        """Disconnects once the queued commands are sent; a process started by start_engine_process() is shut down."""
+        if self._closed:
+            return
+        if self.process is not None:
+            self.send('shutdown')
+        self._disconnect()
+        self._header.release()
+        self._stats_counters.release()
+        self._stats_data.release()
+        self._memory.close()
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=REQUEST_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def _engine_command(socket_path, settings):
+    if getattr(sys, 'frozen', False):
+        # Сборка PyInstaller: main.py уже внутри исполняемого файла
+        command = [sys.executable]
+    else:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')]
+    return command + ['--engine', socket_path, '--engine-config', json.dumps(settings)]
+
+
+def start_engine_process(config):
+    """
+    Starts an engine process for this GUI and returns (process,
+    socket_path) right away; connect_engine() attaches to it. The process
+    loads the audio stack while the window is being drawn.
+    """
+    socket_path = os.path.join(tempfile.gettempdir(), f'osuradio-engine-{os.getpid()}.sock')
+    settings = {key: config[key] for key in ENGINE_SETTINGS if key in config}
+    return subprocess.Popen(_engine_command(socket_path, settings)), socket_path
+
+
+def connect_engine(socket_path, process=None, timeout=SPAWN_TIMEOUT, **callbacks):
+    """EngineClient for socket_path, waiting up to timeout for the engine to start listening."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Engine process exited with code {process.returncode}")
+        try:
+            return EngineClient(socket_path, process=process, **callbacks)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                if process is not None:
+                    process.kill()
+                raise TimeoutError(f"Engine did not start listening on {socket_path}")
+            time.sleep(0.01)
+
+
+def main():
+    """Command-line client: python -m utils.engine_service [--socket PATH] COMMAND [ARGS]."""
+    parser = argparse.ArgumentParser(description="Control a running osu!radio engine (main.py --daemon).")
+    parser.add_argument('--socket', default=default_socket_path())
+    commands = parser.add_subparsers(dest='cmd', required=True)
+    for name in ('play', 'enqueue'):
+        command = commands.add_parser(name)
+        command.add_argument('path')
+        command.add_argument('--gain', type=float, default=1.0)
+    commands.add_parser('seek').add_argument('seconds', type=float)
+    commands.add_parser('volume').add_argument('volume', type=float)
+    commands.add_parser('speed').add_argument('speed', type=float)
+    for name in ('pause', 'resume', 'next', 'stop', 'shutdown'):
+        commands.add_parser(name)
+    commands.add_parser('stats', help="print the audio health counters and histograms as JSON")
+    state = commands.add_parser('state')
+    state.add_argument('--follow', type=float, metavar='INTERVAL', help="keep printing the state every INTERVAL seconds")
+    args = parser.parse_args()
+
+    client = connect_engine(args.socket, timeout=0,
+                            on_state=lambda message: print(json.dumps(message), flush=True))
+    try:
+        # Команды ждут ответа: ошибка движка печатается, а не теряется при выходе
+        if args.cmd in ('play', 'enqueue'):
+            client.request(args.cmd, path=os.path.abspath(args.path), gain=args.gain)
+        elif args.cmd == 'seek':
+            client.request('seek', seconds=args.seconds)
+        elif args.cmd == 'volume':
+            client.request('set_volume', volume=args.volume)
+        elif args.cmd == 'speed':
+            client.request('set_speed', speed=args.speed)
+        elif args.cmd == 'state' and args.follow:
+            client.subscribe(args.follow)
+            while client._reader.is_alive():
+                client._reader.join(1.0)
+        elif args.cmd == 'state':
+            print(json.dumps(client.state(), indent=2))
+        elif args.cmd == 'stats':
+            print(json.dumps(client.request('stats'), indent=2, ensure_ascii=False))
+        else:
+            client.request(args.cmd)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
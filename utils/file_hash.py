@@ -0,0 +1,33 @@
+import hashlib
+import os
+
+# Сколько байт с начала и с конца файла входит в быстрый хэш
+PARTIAL_BLOCK = 64 * 1024
+FULL_HASH_CHUNK = 1024 * 1024
+
+
+def partial_hash(path):
+    """
+    Quick content key: the file size plus its first and last PARTIAL_BLOCK
+    bytes. Equal keys only suggest equal files; full_hash() decides.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_BLOCK))
+        if size > PARTIAL_BLOCK:
+            f.seek(max(PARTIAL_BLOCK, size - PARTIAL_BLOCK))
+            digest.update(f.read(PARTIAL_BLOCK))
+    return digest.hexdigest()
+
+
+def full_hash(path):
+    """Hash of the whole file contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(FULL_HASH_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,460 @@
+import gc
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+
+if sys.platform == 'win32':
+    import ctypes
+
+FILE_ATTRIBUTE_HIDDEN = 0x02
+# Поля песни, которые SQLite-кэш хранит отдельными столбцами; audio_path берётся из записи
+SONG_COLUMNS = ('artist', 'title', 'background_path', 'bpm', 'display_text', 'artist_unicode', 'title_unicode',
+                'creator', 'source', 'tags', 'duration', 'samplerate', 'channels', 'codec', 'file_size')
+
+
+def _hide_file(path):
+    # --- Сделать файл кэша скрытым в Windows ---
+    if sys.platform == 'win32' and os.path.exists(path):
+        ctypes.windll.kernel32.SetFileAttributesW(path, FILE_ATTRIBUTE_HIDDEN)
+
+
+def _temp_file(path):
+    """
+    Creates an empty file with a unique name next to path and returns (fd,
+    its path): a save writes there and renames it over path, so two stores
+    or two saves of one cache never share a temporary file.
+    """
+    return tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                            dir=os.path.dirname(os.path.abspath(path)))
+
+
+def _remove_temp_file(tmp_path):
+    # Сохранение не удалось: недописанный файл не остаётся рядом с кэшем
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+def _replace_atomically(tmp_path, path, rotate_backup):
+    """
+    Moves a fully written tmp_path over path. The previous generation is kept
+    as path + '.bak', so a crash between the two renames or a later corruption
+    of the main file still leaves a readable cache behind. A main file that
+    could not be read is never rotated into the backup slot.
+    """
+    backup_path = path + '.bak'
+    if rotate_backup and os.path.exists(path):
+        os.replace(path, backup_path)
+    elif not os.path.exists(backup_path):
+        shutil.copyfile(tmp_path, backup_path)
+    _hide_file(backup_path)
+    os.replace(tmp_path, path)
+    _hide_file(path)
+
+
+class JsonLibraryStore:
+    """Library cache kept in a single indented JSON document (the original format)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._main_readable = False
+
+    def exists(self):
+        return os.path.exists(self.path) or os.path.exists(self.path + '.bak')
+
+    def load(self):
+        for candidate in (self.path, self.path + '.bak'):
+            if not os.path.exists(candidate):
+                continue
+            try:
+                with open(candidate, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._main_readable = candidate == self.path
+                    return data
+            except (ValueError, OSError) as e:
+                print(f"Cache file {candidate} is unreadable: {e}")
+        return {}
+
+    def save(self, data):
+        fd, tmp_path = _temp_file(self.path)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            _replace_atomically(tmp_path, self.path, self._main_readable)
+        except BaseException:
+            _remove_temp_file(tmp_path)
+            raise
+        self._main_readable = True
+
+    def update_songs(self, fields):
+        """Sets {audio_path: {field: value}} in the songs of the stored entries."""
+        data = self.load()
+        if not data:
+            return
+        for record in data.get('folders', {}).values():
+            for entry in record.get('entries', ()):
+                if entry['song'] and entry['audio_path'] in fields:
+                    entry['song'].update(fields[entry['audio_path']])
+        self.save(data)
+
+    def update_entries(self, entries):
+        """Replaces the stored entries with the same audio paths as entries."""
+        data = self.load()
+        if not data:
+            return
+        by_path = {entry['audio_path']: entry for entry in entries}
+        for record in data.get('folders', {}).values():
+            record['entries'] = [by_path.get(entry['audio_path'], entry) for entry in record.get('entries', ())]
+        self.save(data)
+
+    def query_songs(self, text=None, limit=None, offset=0):
+        songs = [entry['song'] for record in self.load().get('folders', {}).values()
+                 for entry in record.get('entries', ()) if entry['song'] and not entry.get('duplicate_of')]
+        if text:
+            songs = [song for song in songs if text.lower() in song['display_text'].lower()]
+        songs.sort(key=lambda x: x['display_text'])
+        end = offset + limit if limit is not None else None
+        return songs[offset:end]
+
+    def remove(self):
+        for path in (self.path, self.path + '.bak'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class SqliteLibraryStore:
+    """
+    Library cache kept in an SQLite database: one row per beatmapset folder
+    and one per audio file of a folder. Signatures, hashes and the song
+    fields are stored as plain columns, so a loudness measurement or a song
+    completed in the background is written with an UPDATE of its row, and
+    the display text is indexed for partial queries. A song with other
+    fields than SONG_COLUMNS (left by an older scanner until its folder is
+    parsed again) is kept whole as JSON in the song column. Caches with the
+    whole song as JSON and with one row per folder (version 2) are still read.
+    """
+
+    SCHEMA = """
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE folders (
+            path TEXT NOT NULL,
+            osu_stat TEXT,
+            error TEXT
+        );
+        CREATE TABLE entries (
+            folder TEXT NOT NULL,
+            audio_path TEXT NOT NULL,
+            audio_mtime REAL,
+            audio_size INTEGER,
+            hash TEXT,
+            full_hash TEXT,
+            duplicate_of TEXT,
+            deferred TEXT,
+            song TEXT,
+            artist TEXT,
+            title TEXT,
+            background_path TEXT,
+            bpm,
+            display_text TEXT,
+            artist_unicode TEXT,
+            title_unicode TEXT,
+            creator TEXT,
+            source TEXT,
+            tags TEXT,
+            duration,
+            samplerate,
+            channels,
+            codec TEXT,
+            file_size,
+            loudness_lufs REAL,
+            loudness_peak REAL
+        );
+        CREATE INDEX entries_audio_path ON entries (audio_path);
+        CREATE INDEX entries_display_text ON entries (display_text) WHERE display_text IS NOT NULL AND duplicate_of IS NULL;
+    """
+    ENTRY_COLUMNS = ('folder', 'audio_path', 'audio_mtime', 'audio_size', 'hash', 'full_hash', 'duplicate_of',
+                     'deferred', 'song') + SONG_COLUMNS + ('loudness_lufs', 'loudness_peak')
+
+    def __init__(self, path):
+        self.path = path
+        self._main_readable = False
+
+    def exists(self):
+        return os.path.exists(self.path) or os.path.exists(self.path + '.bak')
+
+    def _connect(self, path):
+        # Только чтение: открытие не должно создавать пустую базу на месте пропавшей
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def _read(self, path):
+        conn = self._connect(path)
+        # Сотни тысяч словарей записей создаются подряд и все остаются живы: сборщик мусора
+        # на каждом поколении обходил бы их впустую и занимал бы больше половины загрузки
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            data = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+            tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if 'entries' not in tables:
+                data['folders'] = self._read_single_song_folders(conn)
+                return data
+            rows = conn.execute("SELECT path, osu_stat, error FROM folders").fetchall()
+            # Один вызов json.loads на все записи быстрее, чем разбор каждой строки отдельно
+            osu_stats = json.loads('[' + ','.join(row[1] or 'null' for row in rows) + ']')
+            folders = {
+                path_: {'osu_stat': osu_stat, 'entries': [], 'error': error}
+                for (path_, _, error), osu_stat in zip(rows, osu_stats)
+            }
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+            if 'artist' not in columns:
+                folders_entries = self._read_json_song_entries(conn, columns)
+            else:
+                rows = conn.execute(f"SELECT {', '.join(self.ENTRY_COLUMNS)} FROM entries ORDER BY rowid").fetchall()
+                folders_entries = ((row[0], self._entry_from_row(row)) for row in rows)
+            for folder, entry in folders_entries:
+                folders[folder]['entries'].append(entry)
+            data['folders'] = folders
+            return data
+        finally:
+            if gc_enabled:
+                gc.enable()
+            conn.close()
+
+    @staticmethod
+    def _entry_from_row(row):
+        folder, audio_path, audio_mtime, audio_size, hash_, full_hash, duplicate_of, deferred, song = row[:9]
+        if song is not None:
+            song = json.loads(song)
+        elif row[13] is not None:
+            # display_text есть у каждой песни: без него у записи нет песни
+            song = dict(zip(SONG_COLUMNS, row[9:24]))
+            song['audio_path'] = audio_path
+            if row[25] is not None:
+                song['loudness'] = {'lufs': row[24], 'peak': row[25]}
+        return {
+            'audio_path': audio_path,
+            'audio_stat': [audio_mtime, audio_size] if audio_mtime is not None else None,
+            'hash': hash_,
+            'full_hash': full_hash,
+            'duplicate_of': duplicate_of,
+            'deferred': deferred,
+            'song': song,
+        }
+
+    @staticmethod
+    def _read_json_song_entries(conn, columns):
+        """(folder, entry) pairs of a cache that keeps every song as JSON."""
+        # В кэшах, записанных до импорта из osu!.db, нет столбца deferred
+        deferred_column = 'deferred' if 'deferred' in columns else 'NULL'
+        rows = conn.execute(
+            "SELECT folder, audio_path, audio_mtime, audio_size, hash, full_hash, duplicate_of, song, "
+            f"{deferred_column} FROM entries ORDER BY rowid").fetchall()
+        # Один вызов json.loads на все записи быстрее, чем разбор каждой строки отдельно
+        songs = json.loads('[' + ','.join(row[7] or 'null' for row in rows) + ']')
+        for (folder, audio_path, audio_mtime, audio_size, hash_, full_hash, duplicate_of, _, deferred), song \
+                in zip(rows, songs):
+            yield folder, {
+                'audio_path': audio_path,
+                'audio_stat': [audio_mtime, audio_size] if audio_mtime is not None else None,
+                'hash': hash_,
+                'full_hash': full_hash,
+                'duplicate_of': duplicate_of,
+                'deferred': deferred,
+                'song': song,
+            }
+
+    @staticmethod
+    def _read_single_song_folders(conn):
+        """Folder records of a version 2 cache, for the scanner to upgrade."""
+        rows = conn.execute(
+            "SELECT path, osu_file, osu_mtime, osu_size, audio_path, audio_mtime, audio_size, "
+            "failed_osu_stat, error, song FROM folders").fetchall()
+        songs = json.loads('[' + ','.join(row[9] or 'null' for row in rows) + ']')
+        return {
+            path_: {
+                'osu_file': osu_file,
+                'osu_stat': json.loads(failed_osu_stat) if osu_file is None else [osu_mtime, osu_size],
+                'audio_path': audio_path,
+                'audio_stat': [audio_mtime, audio_size] if audio_mtime is not None else None,
+                'song': song,
+                'error': error,
+            }
+            for (path_, osu_file, osu_mtime, osu_size, audio_path, audio_mtime, audio_size,
+                 failed_osu_stat, error, _), song in zip(rows, songs)
+        }
+
+    def load(self):
+        for candidate in (self.path, self.path + '.bak'):
+            if not os.path.exists(candidate):
+                continue
+            try:
+                data = self._read(candidate)
+                self._main_readable = candidate == self.path
+                return data
+            except (sqlite3.Error, ValueError, KeyError) as e:
+                print(f"Cache file {candidate} is unreadable: {e}")
+        return {}
+
+    def save(self, data):
+        fd, tmp_path = _temp_file(self.path)
+        os.close(fd)
+        try:
+            self._write(tmp_path, data)
+            # Файл полностью записан: сбрасываем на диск и подменяем атомарным переименованием
+            with open(tmp_path, 'rb+') as f:
+                os.fsync(f.fileno())
+            _replace_atomically(tmp_path, self.path, self._main_readable)
+        except BaseException:
+            _remove_temp_file(tmp_path)
+            raise
+        self._main_readable = True
+
+    def _write(self, path, data):
+        # SQLite принимает пустой файл от mkstemp за новую базу
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            with conn:
+                conn.executescript(self.SCHEMA)
+                conn.executemany(
+                    "INSERT INTO meta VALUES (?, ?)",
+                    ((key, json.dumps(value)) for key, value in data.items() if key != 'folders'))
+                folders = data.get('folders', {})
+                conn.executemany(
+                    "INSERT INTO folders VALUES (?, ?, ?)",
+                    ((path, json.dumps(record.get('osu_stat')), record.get('error'))
+                     for path, record in folders.items()))
+                conn.executemany(
+                    f"INSERT INTO entries VALUES ({', '.join('?' * len(self.ENTRY_COLUMNS))})",
+                    (self._entry_row(path, entry)
+                     for path, record in folders.items() for entry in record.get('entries', ())))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _song_columns(song, audio_path):
+        """Column values of a song, or None if it has other fields than SONG_COLUMNS and is kept as JSON."""
+        loudness = song.get('loudness')
+        fields = len(song) - ('loudness' in song)
+        if (fields != len(SONG_COLUMNS) + 1 or song.get('audio_path') != audio_path
+                or not all(column in song for column in SONG_COLUMNS)
+                or ('loudness' in song and not (isinstance(loudness, dict) and loudness.keys() == {'lufs', 'peak'}
+                                                and loudness['peak'] is not None))):
+            return None
+        return tuple(song[column] for column in SONG_COLUMNS) + (
+            (loudness['lufs'], loudness['peak']) if loudness else (None, None))
+
+    @classmethod
+    def _entry_row(cls, folder, entry):
+        audio_stat = entry.get('audio_stat') or [None, None]
+        song = entry.get('song')
+        song_columns = cls._song_columns(song, entry['audio_path']) if song else None
+        song_json = json.dumps(song, ensure_ascii=False, separators=(',', ':')) if song and not song_columns else None
+        if song_columns is None:
+            song_columns = (None,) * (len(SONG_COLUMNS) + 2)
+            if song:
+                # Запросы по display_text находят и песни, сохранённые целиком
+                song_columns = song_columns[:4] + (song.get('display_text', ''),) + song_columns[5:]
+        return (
+            folder,
+            entry['audio_path'],
+            audio_stat[0],
+            audio_stat[1],
+            entry.get('hash'),
+            entry.get('full_hash'),
+            entry.get('duplicate_of'),
+            entry.get('deferred'),
+            song_json,
+        ) + song_columns
+
+    def _update(self, write):
+        """Runs write(conn) in a transaction on the main file; a missing cache is left alone."""
+        if not os.path.exists(self.path):
+            return
+        conn = sqlite3.connect(f"file:{self.path}?mode=rw", uri=True)
+        try:
+            with conn:
+                write(conn)
+        finally:
+            conn.close()
+
+    def update_songs(self, fields):
+        """
+        Sets {audio_path: {field: value}} in the songs of the stored entries
+        with one UPDATE of each row; fields are SONG_COLUMNS or 'loudness'.
+        """
+        def write(conn):
+            column_rows = []
+            for audio_path, song_fields in fields.items():
+                values = dict(song_fields)
+                loudness = values.pop('loudness', None)
+                if loudness is not None:
+                    values['loudness_lufs'] = loudness['lufs']
+                    values['loudness_peak'] = loudness['peak']
+                column_rows.append((values, audio_path))
+            for values, audio_path in column_rows:
+                conn.execute(
+                    f"UPDATE entries SET {', '.join(f'{column} = ?' for column in values)} "
+                    "WHERE audio_path = ? AND song IS NULL AND display_text IS NOT NULL",
+                    (*values.values(), audio_path))
+            # Песни, сохранённые целиком, меняются в своём JSON
+            for audio_path, song in conn.execute(
+                    "SELECT audio_path, song FROM entries WHERE song IS NOT NULL").fetchall():
+                if audio_path in fields:
+                    song = dict(json.loads(song), **fields[audio_path])
+                    conn.execute("UPDATE entries SET song = ? WHERE audio_path = ?",
+                                 (json.dumps(song, ensure_ascii=False, separators=(',', ':')), audio_path))
+
+        self._update(write)
+
+    def update_entries(self, entries):
+        """Rewrites the rows of the stored entries with the same audio paths as entries."""
+        def write(conn):
+            columns = self.ENTRY_COLUMNS[2:]
+            conn.executemany(
+                f"UPDATE entries SET {', '.join(f'{column} = ?' for column in columns)} WHERE audio_path = ?",
+                (self._entry_row(None, entry)[2:] + (entry['audio_path'],) for entry in entries))
+
+        self._update(write)
+
+    def query_songs(self, text=None, limit=None, offset=0):
+        """Returns songs ordered by display text, optionally filtered by a substring."""
+        sql = f"SELECT {', '.join(self.ENTRY_COLUMNS)} FROM entries WHERE display_text IS NOT NULL AND duplicate_of IS NULL"
+        params = []
+        if text:
+            sql += " AND display_text LIKE ? ESCAPE '\\'"
+            escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f"%{escaped}%")
+        sql += " ORDER BY display_text LIMIT ? OFFSET ?"
+        params += [limit if limit is not None else -1, offset]
+
+        for candidate in (self.path, self.path + '.bak'):
+            if not os.path.exists(candidate):
+                continue
+            try:
+                conn = self._connect(candidate)
+                try:
+                    return [self._entry_from_row(row)['song'] for row in conn.execute(sql, params)]
+                finally:
+                    conn.close()
+            except (sqlite3.Error, ValueError) as e:
+                print(f"Cache file {candidate} is unreadable: {e}")
+        return []
+
+    def remove(self):
+        for path in (self.path, self.path + '.bak'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def open_library_store(path):
+    """Picks the store implementation from the file extension of path."""
+    if path.endswith('.json'):
+        return JsonLibraryStore(path)
+    return SqliteLibraryStore(path)
@@ -0,0 +1,127 @@
+import os
+import sys
+
+import numpy as np
+import soundfile as sf
+
+# Громкость, к которой приводятся треки (LUFS); osu!-треки обычно громче, так что чаще это ослабление
+DEFAULT_TARGET_LUFS = -14.0
+# Тихие треки поднимаются не больше чем на столько
+MAX_GAIN_DB = 12.0
+# Блоки BS.1770: 400 мс с перекрытием 75%, т.е. шаг 100 мс
+SUBBLOCK_SECONDS = 0.1
+SUBBLOCKS_PER_BLOCK = 4
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# Сколько подблоков декодируется и обрабатывается за раз
+SUBBLOCKS_PER_READ = 100
+
+
+def _biquad_power(b, a, w):
+    z = np.exp(-1j * w)
+    return np.abs((b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)) ** 2
+
+
+def k_weighting_power(samplerate, n):
+    """|H(f)|^2 of the BS.1770 K-weighting filter at the rfft bins of an n-sample block."""
+    w = 2 * np.pi * np.fft.rfftfreq(n, 1.0 / samplerate) / samplerate
+    # Полочный фильтр "головы" (+4 дБ на высоких)
+    k = np.tan(np.pi * 1681.974450955533 / samplerate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    shelf = _biquad_power(
+        (vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k),
+        (1 + k / q + k * k, 2 * (k * k - 1), 1 - k / q + k * k), w)
+    # RLB: срез низов около 38 Гц
+    k = np.tan(np.pi * 38.13547087602444 / samplerate)
+    q = 0.5003270373238773
+    highpass = _biquad_power((1, -2, 1), (1 + k / q + k * k, 2 * (k * k - 1), 1 - k / q + k * k), w)
+    # Нормировка так, как в фильтре с a0 = 1 и b = (1, -2, 1) для среза
+    return shelf * highpass * (1 + k / q + k * k) ** 2
+
+
+def _subblock_power(frames, weighting, n):
+    """K-weighted mean square of each n-frame subblock, summed over channels."""
+    blocks = frames[:len(frames) // n * n].reshape(-1, n, frames.shape[1])
+    spectrum = np.fft.rfft(blocks, axis=1)
+    power = (spectrum.real ** 2 + spectrum.imag ** 2) * weighting[None, :, None]
+    # Парсеваль для rfft: бины кроме нулевого (и последнего при чётном n) учитываются дважды
+    power[:, 1:(n + 1) // 2] *= 2
+    return power.sum(axis=(1, 2)) / (n * n)
+
+
+def integrated_loudness(subblock_power):
+    """Gated integrated loudness (LUFS) from per-100 ms K-weighted powers, or None for silence."""
+    if len(subblock_power) < SUBBLOCKS_PER_BLOCK:
+        return None
+    # Блок 400 мс — среднее четырёх соседних подблоков
+    cumulative = np.concatenate(([0.0], np.cumsum(subblock_power)))
+    blocks = (cumulative[SUBBLOCKS_PER_BLOCK:] - cumulative[:-SUBBLOCKS_PER_BLOCK]) / SUBBLOCKS_PER_BLOCK
+    with np.errstate(divide='ignore'):
+        levels = -0.691 + 10 * np.log10(blocks)
+    gated = blocks[levels > ABSOLUTE_GATE_LUFS]
+    if not len(gated):
+        return None
+    threshold = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+    gated = blocks[levels > max(threshold, ABSOLUTE_GATE_LUFS)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def measure_file(path):
+    """
+    Integrated loudness and sample peak of an audio file as played (mono is
+    counted as two channels, like the player outputs it). Returns
+    {'lufs': float or None, 'peak': float}.
+    """
+    with sf.SoundFile(path) as audio_file:
+        samplerate = audio_file.samplerate
+        n = int(round(samplerate * SUBBLOCK_SECONDS))
+        weighting = k_weighting_power(samplerate, n)
+        powers = []
+        peak = 0.0
+        leftover = None
+        while True:
+            chunk = audio_file.read(n * SUBBLOCKS_PER_READ, dtype='float32', always_2d=True)
+            if not len(chunk):
+                break
+            if chunk.shape[1] == 1:
+                chunk = np.repeat(chunk, 2, axis=1)
+            elif chunk.shape[1] > 2:
+                chunk = chunk[:, :2]
+            peak = max(peak, float(np.abs(chunk).max()))
+            if leftover is not None:
+                chunk = np.concatenate((leftover, chunk))
+            usable = len(chunk) // n * n
+            if usable:
+                powers.append(_subblock_power(chunk[:usable], weighting, n))
+            leftover = chunk[usable:]
+    power = np.concatenate(powers) if powers else np.zeros(0)
+    return {'lufs': integrated_loudness(power), 'peak': peak}
+
+
+def analyze_task(path):
+    """Process-pool entry point: (path, result), with lufs None when the file cannot be analyzed."""
+    try:
+        return path, measure_file(path)
+    except Exception as e:
+        print(f"Error analyzing loudness of {path}: {e}")
+        return path, {'lufs': None, 'peak': 0.0}
+
+
+def lower_priority():
+    # Анализ идёт в фоне и не должен отнимать процессор у интерфейса и воспроизведения
+    if sys.platform != 'win32':
+        os.nice(10)
+
+
+def track_gain(loudness, target_lufs=DEFAULT_TARGET_LUFS):
+    """Linear gain that brings a track to target_lufs without pushing its peak past full scale."""
+    if not loudness or loudness.get('lufs') is None:
+        return 1.0
+    gain = 10 ** (min(target_lufs - loudness['lufs'], MAX_GAIN_DB) / 20)
+    peak = loudness.get('peak') or 0.0
+    if gain > 1.0 and peak > 0:
+        # Усиление только до полной шкалы по пику
+        gain = max(1.0, min(gain, 1.0 / peak))
+    return gain
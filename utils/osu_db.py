@@ -0,0 +1,250 @@
+"""
+Streaming reader of osu!.db, the beatmap database osu! (stable) keeps next
+to its Songs folder. It holds, per difficulty, the metadata, audio file
+name, .osu file name, set folder and timing points osu! read from the .osu
+files, so a library can be built without opening them.
+
+The file is read in chunks and beatmaps are yielded one at a time; the
+fields the player has no use for (star ratings, grades, per-map settings)
+are skipped without being decoded. Layout changes handled, by osu! version:
+
+    < 20140609   difficulty settings as bytes, no star ratings, a trailing
+                 short after the per-map settings
+    < 20191106   each beatmap prefixed with its size in bytes
+    >= 20250107  star ratings as floats instead of doubles
+"""
+import struct
+
+OSU_DB_FILE = 'osu!.db'
+FLOAT_DIFFICULTY_VERSION = 20140609
+NO_ENTRY_SIZE_VERSION = 20191106
+FLOAT_STAR_RATING_VERSION = 20250107
+CHUNK_SIZE = 1 << 20
+# DateTime .NET в тиках по 100 нс от 0001-01-01; столько их до 1970-01-01
+UNIX_EPOCH_TICKS = 621355968000000000
+
+_HEADER = struct.Struct('<ii?q')
+_INT = struct.Struct('<i')
+# Статус, число кругов, слайдеров и спиннеров, время изменения, AR CS HP OD, скорость слайдеров
+_COUNTS_BYTE_DIFFICULTY = struct.Struct('<BhhhqBBBBd')
+_COUNTS_FLOAT_DIFFICULTY = struct.Struct('<Bhhhqffffd')
+_TIMES = struct.Struct('<iiii')  # drain, total, preview, число точек тайминга
+_TIMING_POINT = struct.Struct('<dd?')
+# ID карты, ID сета, ID темы, оценки в четырёх режимах, локальный оффсет, stack leniency, режим
+_IDS = struct.Struct('<iiiBBBBhfB')
+# Онлайн-оффсет перед шрифтом заголовка; после него: не сыграна, когда играли, osz2
+_ONLINE_OFFSET = 2
+_PLAY_STATE = 10
+# Последняя проверка, пять флагов, (short до 20140609), последнее изменение, скорость скролла mania
+_SETTINGS = 8 + 5 + 4 + 1
+_SETTINGS_OLD = _SETTINGS + 2
+# Пара (0x08, int моды, 0x0d, double) или с 0x0c и float
+_STAR_RATING_DOUBLE = 14
+_STAR_RATING_FLOAT = 10
+
+
+class _Underflow(Exception):
+    """The beatmap being read goes on past the end of the buffer."""
+
+
+def _string(buf, pos):
+    """A .NET string at pos: 0x00 for none, or 0x0b, its length in ULEB128 and UTF-8 bytes. Returns (str, end)."""
+    marker = buf[pos]
+    if marker == 0x0b:
+        length = buf[pos + 1]
+        if length < 0x80:
+            # Почти все строки короче 128 байт: длина в одном байте
+            end = pos + 2 + length
+            if end > len(buf):
+                raise _Underflow
+            return buf[pos + 2:end].decode('utf-8', 'replace'), end
+    elif marker == 0:
+        return None, pos + 1
+    else:
+        raise ValueError(f"bad string marker {marker:#x}")
+    pos += 2
+    if length & 0x80:
+        length &= 0x7f
+        shift = 7
+        while True:
+            byte = buf[pos]
+            pos += 1
+            length |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+    end = pos + length
+    if end > len(buf):
+        raise _Underflow
+    return buf[pos:end].decode('utf-8', 'replace'), end
+
+
+def _skip_string(buf, pos):
+    """End of the .NET string at pos, without decoding it."""
+    if buf[pos] == 0:
+        return pos + 1
+    length = 0
+    shift = 0
+    pos += 1
+    while True:
+        byte = buf[pos]
+        pos += 1
+        length |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return pos + length
+        shift += 7
+
+
+def _unpack(buf, pos, fmt):
+    return fmt.unpack_from(buf, pos), pos + fmt.size
+
+
+def _read_beatmap(buf, pos, version):
+    """The beatmap record at pos of buf; returns (beatmap, end). Raises _Underflow if buf ends inside it."""
+    end = None
+    if version < NO_ENTRY_SIZE_VERSION:
+        size, = _INT.unpack_from(buf, pos)
+        pos += 4
+        end = pos + size
+    artist, pos = _string(buf, pos)
+    artist_unicode, pos = _string(buf, pos)
+    title, pos = _string(buf, pos)
+    title_unicode, pos = _string(buf, pos)
+    creator, pos = _string(buf, pos)
+    difficulty, pos = _string(buf, pos)
+    audio_filename, pos = _string(buf, pos)
+    md5, pos = _string(buf, pos)
+    osu_file, pos = _string(buf, pos)
+
+    if version >= FLOAT_DIFFICULTY_VERSION:
+        ranked_status, _, _, _, modified, _, _, _, _, _ = _COUNTS_FLOAT_DIFFICULTY.unpack_from(buf, pos)
+        pos += _COUNTS_FLOAT_DIFFICULTY.size
+        rating_size = _STAR_RATING_FLOAT if version >= FLOAT_STAR_RATING_VERSION else _STAR_RATING_DOUBLE
+        for _mode in range(4):
+            ratings, = _INT.unpack_from(buf, pos)
+            pos += 4 + ratings * rating_size
+    else:
+        ranked_status, _, _, _, modified, _, _, _, _, _ = _COUNTS_BYTE_DIFFICULTY.unpack_from(buf, pos)
+        pos += _COUNTS_BYTE_DIFFICULTY.size
+
+    drain_time, total_time, preview_time, timing_points = _TIMES.unpack_from(buf, pos)
+    pos += _TIMES.size
+    beat_length = None
+    for i in range(timing_points):
+        length, _, uninherited = _TIMING_POINT.unpack_from(buf, pos + i * _TIMING_POINT.size)
+        if uninherited:
+            beat_length = length
+            break
+    pos += timing_points * _TIMING_POINT.size
+
+    beatmap_id, beatmapset_id, _, _, _, _, _, _, _, mode = _IDS.unpack_from(buf, pos)
+    pos += _IDS.size
+    source, pos = _string(buf, pos)
+    tags, pos = _string(buf, pos)
+    pos = _skip_string(buf, pos + _ONLINE_OFFSET)  # шрифт заголовка
+    folder, pos = _string(buf, pos + _PLAY_STATE)
+    if end is None:
+        end = pos + (_SETTINGS_OLD if version < FLOAT_DIFFICULTY_VERSION else _SETTINGS)
+    elif end < pos:
+        raise ValueError("beatmap overruns its size")
+    if end > len(buf):
+        raise _Underflow
+    return {
+        'artist': artist,
+        'artist_unicode': artist_unicode,
+        'title': title,
+        'title_unicode': title_unicode,
+        'creator': creator,
+        'difficulty': difficulty,
+        'audio_filename': audio_filename,
+        'md5': md5,
+        'osu_file': osu_file,
+        'folder': folder,
+        'source': source,
+        'tags': tags,
+        'ranked_status': ranked_status,
+        'mode': mode,
+        'beatmap_id': beatmap_id,
+        'beatmapset_id': beatmapset_id,
+        'modified': (modified - UNIX_EPOCH_TICKS) / 1e7,
+        'drain_time': drain_time,
+        'total_time': total_time,
+        'preview_time': preview_time,
+        'beat_length': beat_length,
+    }, end
+
+
+class OsuDbReader:
+    """
+    Reads an osu!.db file: the header fields are set on open (version,
+    folder_count, player, beatmap_count) and iterating yields one dict per
+    difficulty:
+
+        artist, artist_unicode, title, title_unicode, creator, difficulty,
+        audio_filename, md5, osu_file, folder (relative to Songs, as osu!
+        wrote it), source, tags     str or None
+        ranked_status, mode, beatmap_id, beatmapset_id    int
+        modified          last modification, Unix time
+        drain_time        s
+        total_time, preview_time    ms
+        beat_length       of the first uninherited timing point, ms, or None
+
+    Raises OSError if the file cannot be read and ValueError if it is not
+    an osu!.db or ends early.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._buf = b''
+        self._pos = 0
+        self._offset = 0
+        try:
+            self.version, self.folder_count, _, _ = self._read(_unpack, _HEADER)
+            self.player = self._read(_string)
+            self.beatmap_count, = self._read(_unpack, _INT)
+            if not 20000000 <= self.version < 30000000 or self.beatmap_count < 0:
+                raise ValueError(f"{path} is not an osu!.db file (version {self.version})")
+        except Exception:
+            self._file.close()
+            raise
+
+    def _read(self, read, *args):
+        """Calls read(buf, pos, *args) -> (value, end) on the buffer, reading more of the file until it fits."""
+        while True:
+            try:
+                value, end = read(self._buf, self._pos, *args)
+                break
+            except (_Underflow, IndexError, struct.error):
+                # Запись целиком не поместилась: буфер дополняется, запись читается заново
+                data = self._file.read(CHUNK_SIZE)
+                if not data:
+                    raise ValueError(f"{self.path} is truncated at byte {self._offset + len(self._buf)}") from None
+                self._offset += self._pos
+                self._buf = self._buf[self._pos:] + data
+                self._pos = 0
+            except ValueError as e:
+                raise ValueError(f"{self.path} is corrupt at byte {self._offset + self._pos}: {e}") from None
+        self._pos = end
+        return value
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def __iter__(self):
+        version = self.version
+        for _ in range(self.beatmap_count):
+            yield self._read(_read_beatmap, version)
+
+
+def read_osu_db(path):
+    """Yields the beatmaps of the osu!.db at path (see OsuDbReader), closing it when done."""
+    with OsuDbReader(path) as db:
+        yield from db
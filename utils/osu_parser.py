@@ -0,0 +1,150 @@
+from utils import scan_profile
+
+# Увеличивается при изменениях, после которых стоит повторить разбор неудавшихся папок
+PARSER_VERSION = 2
+
+BACKGROUND_EXTENSIONS = (b'.jpg', b'.jpeg', b'.png')
+BACKGROUND_EVENT_PREFIXES = (b'0,0,', b'Video,', b'1,0,')
+REQUIRED_KEYS = ('AudioFilename', 'Title', 'Artist', 'Background', 'BPM')
+# Дополнительные поля [Metadata], которые нужны для поиска
+SEARCH_KEYS = {
+    b'TitleUnicode': 'TitleUnicode',
+    b'ArtistUnicode': 'ArtistUnicode',
+    b'Creator': 'Creator',
+    b'Source': 'Source',
+    b'Tags': 'Tags',
+}
+
+
+def _decode(value):
+    # Битые байты в одном поле не должны терять всю карту
+    return value.decode('utf-8', errors='replace').strip()
+
+
+def _background(line):
+    """Image filename of a background or video event line of [Events], or None for a video."""
+    parts = line.split(b',')
+    if len(parts) > 2:
+        filename = parts[2].strip(b'"')
+        if filename.lower().endswith(BACKGROUND_EXTENSIONS):
+            return filename.decode('utf-8', errors='replace')
+    return None
+
+
+def parse_osu_file(filepath):
+    """
+    Reads the metadata the player needs from a .osu file: AudioFilename,
+    Title, Artist, Background and BPM (from the first uninherited timing
+    point), plus the searchable [Metadata] fields TitleUnicode,
+    ArtistUnicode, Creator, Source and Tags when present.
+
+    Works on raw bytes and stops at [HitObjects] or as soon as [Events] and
+    [TimingPoints] are both done, so the hit objects are never read. Invalid
+    UTF-8 is replaced instead of failing the whole file. Returns None if the
+    file cannot be read.
+    """
+    metadata = {}
+    in_metadata_section = False
+    in_events_section = False
+    in_timing_section = False
+    events_done = False
+    timing_done = False
+    try:
+        with open(filepath, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+
+                if line[:1] == b'[':
+                    if in_events_section:
+                        events_done = True
+                    if in_timing_section:
+                        timing_done = True
+                    if line == b'[HitObjects]' or (events_done and timing_done):
+                        break
+                    in_metadata_section = line == b'[Metadata]'
+                    in_events_section = line == b'[Events]'
+                    in_timing_section = line == b'[TimingPoints]'
+                    continue
+
+                if line.startswith(b'AudioFilename:'):
+                    metadata['AudioFilename'] = _decode(line.split(b':', 1)[1])
+                elif line.startswith(b'Title:'):
+                    metadata['Title'] = _decode(line.split(b':', 1)[1])
+                elif line.startswith(b'Artist:'):
+                    metadata['Artist'] = _decode(line.split(b':', 1)[1])
+                elif in_metadata_section:
+                    key, _, value = line.partition(b':')
+                    key = key.strip()
+                    if key in SEARCH_KEYS:
+                        metadata[SEARCH_KEYS[key]] = _decode(value)
+                elif in_events_section and line.startswith(BACKGROUND_EVENT_PREFIXES):
+                    background = _background(line)
+                    if background is not None:
+                        metadata['Background'] = background
+                elif in_timing_section and 'BPM' not in metadata:
+                    parts = line.split(b',')
+                    if len(parts) >= 8 and parts[6] == b'1':
+                        try:
+                            beat_length = float(parts[1])
+                        except ValueError:
+                            continue
+                        if beat_length > 0:
+                            metadata['BPM'] = round(60000 / beat_length)
+
+                if 'BPM' in metadata and all(key in metadata for key in REQUIRED_KEYS):
+                    break
+            scan_profile.count('.osu files parsed')
+            scan_profile.count('.osu bytes parsed', f.tell())
+    except Exception as e:
+        print(f"Error parsing file {filepath}: {e}")
+        scan_profile.failure(f"unreadable .osu ({type(e).__name__})")
+        return None
+    return metadata
+
+
+def read_audio_filename(filepath):
+    """
+    Reads only AudioFilename from the [General] section of a .osu file, for
+    difficulties whose other metadata is already known. Returns None if the
+    file has none or cannot be read.
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith(b'AudioFilename:'):
+                    scan_profile.count('.osu files read for AudioFilename')
+                    return _decode(line.split(b':', 1)[1])
+                if line[:1] == b'[' and line != b'[General]':
+                    return None
+    except Exception as e:
+        print(f"Error parsing file {filepath}: {e}")
+        scan_profile.failure(f"unreadable .osu ({type(e).__name__})")
+    return None
+
+
+def read_background(filepath):
+    """
+    Reads only the background image of a .osu file, the one thing a beatmap
+    in osu!.db lacks, as parse_osu_file() would. Stops at the end of
+    [Events]. Returns None if the file has none or cannot be read.
+    """
+    background = None
+    in_events_section = False
+    try:
+        with open(filepath, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if line[:1] == b'[':
+                    if in_events_section or line == b'[HitObjects]':
+                        break
+                    in_events_section = line == b'[Events]'
+                elif in_events_section and line.startswith(BACKGROUND_EVENT_PREFIXES):
+                    background = _background(line) or background
+            scan_profile.count('.osu files read for the background')
+    except Exception as e:
+        print(f"Error parsing file {filepath}: {e}")
+        scan_profile.failure(f"unreadable .osu ({type(e).__name__})")
+    return background
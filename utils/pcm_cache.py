@@ -0,0 +1,115 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Бюджет по умолчанию: ~10 треков по 4 минуты в int16 стерео 44.1 кГц
+DEFAULT_BUDGET_MB = 512
+INT16_SCALE = 32767.0
+
+
+class _Entry:
+    __slots__ = ('stamp', 'frames', 'samplerate')
+
+    def __init__(self, stamp, frames, samplerate):
+        self.stamp = stamp
+        self.frames = frames
+        self.samplerate = samplerate
+
+
+def _file_stamp(path):
+    # Изменённый на диске файл не совпадёт со старой записью
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PcmCache:
+    """
+    LRU cache of fully decoded tracks kept within a memory budget.
+
+    Frames are stored as int16 (half the memory of float32) unless dtype says
+    otherwise; to_float() converts a slice back for playback. Entries are
+    keyed by path and checked against the file's mtime and size. get() and
+    put() may be called from the GUI and the decoder thread.
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_MB * 1024 * 1024, dtype=np.int16):
+        self.budget_bytes = budget_bytes
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_used = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fits(self, frames, channels):
+        return 0 < frames * channels * self.dtype.itemsize <= self.budget_bytes
+
+    def get(self, path):
+        """Returns (frames, samplerate) for path, or None."""
+        stamp = _file_stamp(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry.stamp != stamp:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry.frames, entry.samplerate
+
+    def contains(self, path):
+        """Like get() but does not count towards the hit rate or the LRU order."""
+        with self._lock:
+            entry = self._entries.get(path)
+            return entry is not None and entry.stamp == _file_stamp(path)
+
+    def from_float(self, chunk):
+        """Converts decoded float32 frames to the storage dtype."""
+        if self.dtype == np.float32:
+            return chunk.copy()
+        return (np.clip(chunk, -1.0, 1.0) * INT16_SCALE).astype(self.dtype)
+
+    def to_float(self, frames):
+        if self.dtype == np.float32:
+            return frames
+        return frames.astype(np.float32) * (1.0 / INT16_SCALE)
+
+    def put(self, path, frames, samplerate):
+        """Stores frames (already in the storage dtype), evicting least recently used tracks."""
+        if frames.nbytes > self.budget_bytes:
+            return
+        stamp = _file_stamp(path)
+        if stamp is None:
+            return
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.bytes_used -= old.frames.nbytes
+            while self._entries and self.bytes_used + frames.nbytes > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes_used -= evicted.frames.nbytes
+                self.evictions += 1
+            self._entries[path] = _Entry(stamp, frames, samplerate)
+            self.bytes_used += frames.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes_used': self.bytes_used,
+            'budget_bytes': self.budget_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,598 @@
+import queue
+import threading
+from collections import deque
+from time import perf_counter
+
+import numpy as np
+import sounddevice as sd
+import soundfile as sf
+
+from utils.audio_stats import AudioStats
+from utils.resampler import DEFAULT_QUALITY, Resampler
+from utils.ring_buffer import RingBuffer
+from utils.time_stretch import MAX_SPEED, MIN_SPEED, TimeStretcher
+
+# Поток вывода всегда стерео: моно и многоканальные треки приводятся к двум каналам,
+# чтобы смена трека не требовала нового потока
+OUTPUT_CHANNELS = 2
+# Запас декодированного звука между декодером и callback; покрывает задержки диска
+RING_FRAMES = 1 << 17
+# Сколько кадров декодер читает за раз
+DECODE_FRAMES = 4096
+# Как часто декодер проверяет место в буфере, когда тот полон
+DECODER_POLL_INTERVAL = 0.005
+# Частота, если устройство вывода не удалось опросить
+FALLBACK_OUTPUT_RATE = 44100
+
+
+def _device_rate():
+    """Native sample rate of the default output device."""
+    try:
+        return int(sd.query_devices(kind='output')['default_samplerate'])
+    except Exception as e:
+        print(f"Could not query the output device, using {FALLBACK_OUTPUT_RATE} Hz: {e}")
+        return FALLBACK_OUTPUT_RATE
+
+
+def _to_output_channels(data):
+    if data.shape[1] == OUTPUT_CHANNELS:
+        return data
+    if data.shape[1] == 1:
+        return np.repeat(data, OUTPUT_CHANNELS, axis=1)
+    return np.ascontiguousarray(data[:, :OUTPUT_CHANNELS])
+
+
+class _Source:
+    """
+    An opened track. Only the decoder thread reads from it.
+
+    A track found in the PCM cache is played from memory without opening the
+    file, and seeking in it is only an index change. Otherwise the file is
+    decoded, and a track read through from the start is put into the cache.
+    Seeks in files with a table in seek_index start decoding at the nearest
+    entry point instead of letting the decoder scan from the start.
+    """
+
+    def __init__(self, path, start_seconds=0.0, cache=None, seek_index=None, gain=1.0):
+        self.path = path
+        # Множитель нормализации громкости; применяется в callback вместе с громкостью
+        self.gain = gain
+        self.cache = cache
+        self.seek_index = seek_index
+        self._seek_table = None
+        cached = cache.get(path) if cache is not None else None
+        if cached is not None:
+            self.file = None
+            self.pcm, self.samplerate = cached
+            self.total_frames = len(self.pcm)
+            self._cacheable = False
+        else:
+            self.file = sf.SoundFile(path)
+            self.pcm = None
+            self.samplerate = self.file.samplerate
+            self.total_frames = self.file.frames
+            self._cacheable = cache is not None and cache.fits(self.total_frames, OUTPUT_CHANNELS)
+        self._capture = [] if self._cacheable else None
+        self.frame = 0
+        if start_seconds:
+            self.seek(int(start_seconds * self.samplerate))
+
+    @property
+    def cached(self):
+        return self.pcm is not None
+
+    def read(self, frames):
+        """Returns up to `frames` stereo float32 frames; fewer at the end of the track."""
+        if self.pcm is not None:
+            chunk = self.cache.to_float(self.pcm[self.frame:self.frame + frames])
+            self.frame += len(chunk)
+            return chunk
+        if not isinstance(self.file, sf.SoundFile):
+            # Открытый с середины поток не знает о паддинге кодера в конце
+            frames = min(frames, self.total_frames - self.frame)
+        chunk = _to_output_channels(self.file.read(frames, dtype='float32', always_2d=True))
+        self.frame += len(chunk)
+        if self._capture is not None:
+            self._capture.append(self.cache.from_float(chunk))
+            if len(chunk) < frames:
+                self.cache.put(self.path, np.concatenate(self._capture), self.samplerate)
+                self._capture = None
+        return chunk
+
+    def seek(self, frame):
+        frame = max(0, min(frame, self.total_frames))
+        if self.file is not None:
+            if self._seek_table is None and self.seek_index is not None:
+                self._seek_table = self.seek_index.get(self.path)
+            reader = self._seek_table.open_at(self.path, frame) if self._seek_table else None
+            if reader is not None:
+                self.file.close()
+                self.file = reader
+            else:
+                if not isinstance(self.file, sf.SoundFile):
+                    self.file.close()
+                    self.file = sf.SoundFile(self.path)
+                self.file.seek(frame)
+            # В кэш попадает только трек, прочитанный подряд с начала
+            self._capture = [] if frame == 0 and self._cacheable else None
+        self.frame = frame
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class _Marker:
+    """
+    Written by the decoder next to the audio: from ring position stream_frame
+    on, the frames belong to `source` starting at track_frame and each output
+    frame advances `rate` track frames (speed times the ratio of the track's
+    sample rate to the output rate; source None means silence). A flush marker makes the callback drop everything before it,
+    which is how play, seek, stop and speed changes take effect.
+    """
+    __slots__ = ('stream_frame', 'generation', 'source', 'track_frame', 'rate', 'flush', 'event')
+
+    def __init__(self, stream_frame, generation, source, track_frame, rate, flush, event=None):
+        self.stream_frame = stream_frame
+        self.generation = generation
+        self.source = source
+        self.track_frame = track_frame
+        self.rate = rate
+        self.flush = flush
+        self.event = event
+
+
+class PlaybackEngine:
+    """
+    Plays tracks through a single persistent output stream.
+
+    A decoder thread owns the open files: it reads ahead into a preallocated
+    ring buffer and, when the current track ends, goes straight on with the
+    track prepared by queue_next(), so the switch happens at the exact
+    sample. Speeds other than 1 (DT, HT) go through a pitch-preserving
+    TimeStretcher on the decoder thread and apply live. The stream always
+    runs at the output device's native rate (or output_rate); tracks at
+    other rates are converted by a Resampler on the decoder thread, so the
+    stream is opened once and transitions stay gapless across sample rates.
+    The audio callback only copies from the ring with the volume (times the
+    playing track's normalization gain) applied in place; it takes no lock, touches no file and allocates no sample memory.
+    Recently played tracks are kept decoded in pcm_cache (a PcmCache, None
+    to disable), so replaying, repeating or going back to one skips the
+    decoder entirely. With a SeekIndex, seek tables for played and queued
+    tracks are built in the background and used for later seeks.
+
+    on_track_changed(path) and on_finished() are called on the decoder thread
+    when the listener has reached the queued track or the end of the queue.
+    ring_memory is an optional buffer of RING_FRAMES * OUTPUT_CHANNELS
+    float32 values to hold the ring, e.g. shared memory of the engine process.
+    The callback and the decoder record their timing, underruns and device
+    underflows in stats (an AudioStats); audio_stats() returns a copy.
+    """
+
+    def __init__(self, on_track_changed=None, on_finished=None, stream_factory=None,
+                 output_rate=None, resample_quality=DEFAULT_QUALITY, pcm_cache=None, seek_index=None,
+                 ring_memory=None):
+        self.on_track_changed = on_track_changed
+        self.on_finished = on_finished
+        self.stream_factory = stream_factory or sd.OutputStream
+        self.output_rate = output_rate or _device_rate()
+        self.resample_quality = resample_quality
+        self.pcm_cache = pcm_cache
+        self.seek_index = seek_index
+        self.volume = 1.0
+        self.paused = False
+        self.speed = 1.0
+        self.transitions = 0
+        self.stats = AudioStats()
+
+        self._ring = RingBuffer(RING_FRAMES, OUTPUT_CHANNELS, ring_memory)
+        self._markers = deque()
+        # Поколение растёт при play/seek/stop: маркеры и уведомления старых поколений не действуют
+        self._generation = 0
+        self._segment = _Marker(0, 0, None, 0, 1.0, True)
+        self._track = None
+        self._start_position = 0.0
+        self._stream = None
+
+        # Состояние декодера: трогает только его поток
+        self._decoder_generation = 0
+        self._decoder_speed = 1.0
+        self._stretcher = None
+        self._resampler = None
+        # Хвост растяжителя и ресемплера, не поместившийся в буфер: дописывается раньше следующего трека
+        self._tail = None
+        self._source = None
+        self._previous = None
+        self._queued = None
+        self._queued_path = None
+
+        self._commands = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="PlaybackDecoder", daemon=True)
+        self._thread.start()
+
+    # --- Управление (вызывается из GUI) ---
+    def play(self, path, start_seconds=0.0, gain=1.0):
+        """
+        Starts path from start_seconds (track time) with its loudness
+        normalization gain. Raises if the file cannot be opened.
+        """
+        source = _Source(path, start_seconds, self.pcm_cache, self.seek_index, gain)
+        if self.seek_index is not None and not source.cached:
+            self.seek_index.ensure(path)
+        self._ensure_stream()
+        self._generation += 1
+        self._track = source
+        self._start_position = source.frame / source.samplerate
+        self.paused = False
+        self._commands.put((self._play, source, self._generation))
+
+    def queue_next(self, path, gain=1.0):
+        """Prepares path (played with gain) to follow the current track; None clears the queue."""
+        self._commands.put((self._queue_next, path, gain))
+
+    def stop(self):
+        self._generation += 1
+        self._track = None
+        self._commands.put((self._stop, self._generation))
+
+    def seek(self, seconds):
+        track = self._track
+        if track is None:
+            return
+        self._generation += 1
+        self._start_position = max(0.0, min(seconds, track.total_frames / track.samplerate))
+        self._commands.put((self._seek, track, seconds, self._generation))
+
+    def set_speed(self, speed):
+        """
+        Changes the tempo without changing the pitch (1.5 for DT, 0.75 for HT).
+        The current track keeps its position; nothing is reopened.
+        """
+        speed = min(MAX_SPEED, max(MIN_SPEED, speed))
+        if speed == self.speed:
+            return
+        self.speed = speed
+        track = self._track
+        if track is None:
+            self._commands.put((self._set_speed, speed, None, 0.0, self._generation))
+            return
+        position = self.position()
+        self._generation += 1
+        self._start_position = position
+        self._commands.put((self._set_speed, speed, track, position, self._generation))
+
+    def has_track(self):
+        return self._track is not None
+
+    def track_path(self):
+        track = self._track
+        return track.path if track else None
+
+    def buffered_frames(self):
+        """Decoded frames waiting in the ring for the output stream."""
+        return self._ring.readable()
+
+    def output_position(self):
+        """Frames handed to the output stream so far; the ring slot of frame n is n % RING_FRAMES."""
+        return self._ring.read_pos
+
+    def position(self):
+        """Position in the current track, in seconds of track time."""
+        segment = self._segment
+        if segment.generation != self._generation or segment.source is None:
+            return self._start_position
+        frames = segment.track_frame + max(0, self._ring.read_pos - segment.stream_frame) * segment.rate
+        return min(frames, segment.source.total_frames) / segment.source.samplerate
+
+    def duration(self):
+        track = self._track
+        return track.total_frames / track.samplerate if track else 0.0
+
+    @property
+    def underruns(self):
+        """Callbacks that found the ring empty in the middle of a track."""
+        return self.stats.session['underruns']
+
+    def audio_stats(self):
+        return self.stats.snapshot()
+
+    def close(self):
+        self._close_stream()
+        self.stop()
+        self._commands.put(None)
+        self._thread.join()
+
+    # --- Поток вывода ---
+    def _ensure_stream(self):
+        if self._stream is not None:
+            return
+        self._stream = self.stream_factory(
+            samplerate=self.output_rate,
+            channels=OUTPUT_CHANNELS,
+            dtype='float32',
+            callback=self._audio_callback,
+        )
+        self._stream.start()
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close(ignore_errors=True)
+            self._stream = None
+
+    def _audio_callback(self, outdata, frames, time, status):
+        started = perf_counter()
+        stats = self.stats
+        source = self._segment.source
+        fill = self._ring.readable()
+        interval = stats.callback_started(started, frames, self.output_rate,
+                                          fill if source is not None and not self.paused else None)
+        if status:
+            path = source.path if source is not None else None
+            # Устройство проиграло тишину или потеряло блок: учитывается, а не печатается из callback
+            if status.output_underflow:
+                stats.dropout('output_underflows', path, self.position(), fill, self.output_rate, interval, started)
+            if status.output_overflow:
+                stats.count('output_overflows', path)
+        if self._render(outdata, frames):
+            source = self._segment.source
+            stats.dropout('underruns', source.path if source is not None else None, self.position(), fill,
+                          self.output_rate, interval, started)
+        stats.callback_finished(started, perf_counter(), source.path if source is not None else None)
+
+    def _render(self, outdata, frames):
+        """Fills outdata; True if the ring ran dry in the middle of a track."""
+        ring = self._ring
+        markers = self._markers
+        # Декодер только добавляет маркеры, callback только забирает: deque хватает без блокировки
+        flush_index = -1
+        for i in range(len(markers)):
+            if markers[i].flush:
+                flush_index = i
+        if flush_index >= 0:
+            for _ in range(flush_index):
+                markers.popleft()
+            self._apply_marker(markers.popleft())
+            ring.skip_to(self._segment.stream_frame)
+
+        if self.paused:
+            outdata.fill(0)
+            return False
+
+        underrun = False
+        written = 0
+        while written < frames:
+            limit = frames - written
+            if markers:
+                until = markers[0].stream_frame - ring.read_pos
+                if until <= 0:
+                    self._apply_marker(markers.popleft())
+                    continue
+                limit = min(limit, until)
+            if self._segment.source is None:
+                break
+            started = ring.read_pos > self._segment.stream_frame
+            # Громкость трека меняется ровно на границе треков вместе с сегментом
+            count = ring.read_into(outdata[written:written + limit], self.volume * self._segment.source.gain)
+            written += count
+            if count < limit:
+                # Декодер не успел: недостающее заполняется тишиной (кроме самого начала трека)
+                underrun = started or count > 0
+                break
+        outdata[written:].fill(0)
+        return underrun
+
+    def _apply_marker(self, marker):
+        self._segment = marker
+        if marker.event is None or marker.generation != self._generation:
+            return
+        if marker.event == 'changed':
+            self.transitions += 1
+        # Уведомление передаётся потоку декодера, callback ничего не ждёт
+        self._commands.put((self._notify, marker))
+
+    # --- Поток декодера ---
+    def _notify(self, marker):
+        if marker.generation != self._generation:
+            return
+        if marker.event == 'changed':
+            self._track = marker.source
+            if self.on_track_changed:
+                self.on_track_changed(marker.source.path)
+        elif marker.event == 'finished':
+            self._track = None
+            if self.on_finished:
+                self.on_finished()
+
+    def _mark(self, generation, source, flush, event=None, delay=0):
+        if flush:
+            # Всё записанное раньше сбрасывается, недописанный хвост тоже
+            self._tail = None
+        rate = self._decoder_speed * source.samplerate / self.output_rate if source else 1.0
+        self._markers.append(_Marker(
+            self._ring.write_pos + delay, generation, source, source.frame if source else 0,
+            rate, flush, event))
+
+    def _reset_pipeline(self, source):
+        """Sets up time-stretching and resampling for source from its current frame."""
+        if self._decoder_speed == 1.0 or source is None:
+            self._stretcher = None
+        else:
+            self._stretcher = TimeStretcher(source.samplerate, OUTPUT_CHANNELS, self._decoder_speed)
+        if source is None or source.samplerate == self.output_rate:
+            self._resampler = None
+        else:
+            self._resampler = Resampler(source.samplerate, self.output_rate, OUTPUT_CHANNELS,
+                                        self.resample_quality)
+
+    def _convert(self, chunk):
+        if self._stretcher is not None:
+            chunk = self._stretcher.process(chunk)
+        if self._resampler is not None:
+            chunk = self._resampler.process(chunk)
+        return chunk
+
+    def _drain_pipeline(self):
+        """
+        Writes out the tail still held by the stretcher and the resampler, as
+        much of it as the ring has room for; _write_tail writes the rest on
+        the next iterations. Returns the number of frames left for later.
+        """
+        tails = []
+        if self._stretcher is not None:
+            tail = self._stretcher.drain()
+            tails.append(self._resampler.process(tail) if self._resampler is not None else tail)
+        if self._resampler is not None:
+            tails.append(self._resampler.drain())
+        if tails:
+            self._tail = np.concatenate(tails)
+            self._write_tail()
+        return len(self._tail) if self._tail is not None else 0
+
+    def _write_tail(self):
+        count = min(len(self._tail), self._ring.writable())
+        self._ring.write(self._tail[:count])
+        self._tail = self._tail[count:] if count < len(self._tail) else None
+
+    def _pending_output(self):
+        """Output frames the pipeline still owes for input already read."""
+        pending = 0.0
+        if self._stretcher is not None:
+            pending = self._stretcher.pending_output()
+        if self._resampler is not None:
+            pending = pending / self._resampler.step + self._resampler.pending_output()
+        return int(pending)
+
+    def _close_sources(self, *sources):
+        for source in sources:
+            if source is not None:
+                source.close()
+
+    def _play(self, source, generation):
+        self._decoder_generation = generation
+        self._close_sources(self._source, self._previous)
+        self._source, self._previous = source, None
+        self._reset_pipeline(source)
+        self._mark(generation, source, flush=True)
+
+    def _stop(self, generation):
+        self._decoder_generation = generation
+        self._close_sources(self._source, self._previous, self._queued)
+        self._source = self._previous = self._queued = self._queued_path = None
+        self._mark(generation, None, flush=True)
+
+    def _seek(self, track, seconds, generation):
+        self._decoder_generation = generation
+        if self._source is not track and self._previous is track:
+            # Декодер уже ушёл в следующий трек, а слушатель ещё в предыдущем: возвращаемся
+            if self._source is not None:
+                self._close_sources(self._queued)
+                self._queued, self._queued_path = self._source, self._source.path
+                self._queued.seek(0)
+            self._source, self._previous = track, None
+        if self._source is not track:
+            return
+        track.seek(int(seconds * track.samplerate))
+        self._reset_pipeline(track)
+        self._mark(generation, track, flush=True)
+
+    def _set_speed(self, speed, track, seconds, generation):
+        self._decoder_speed = speed
+        if track is None:
+            return
+        # Буфер уже заполнен звуком на старой скорости: он сбрасывается с текущей позиции слушателя
+        self._seek(track, seconds, generation)
+
+    def _queue_next(self, path, gain):
+        if path == self._queued_path:
+            if self._queued is not None:
+                self._queued.gain = gain
+            return
+        self._close_sources(self._queued)
+        self._queued, self._queued_path = None, path
+        if path is None:
+            return
+        try:
+            self._queued = _Source(path, cache=self.pcm_cache, seek_index=self.seek_index, gain=gain)
+            if self.seek_index is not None and not self._queued.cached:
+                self.seek_index.ensure(path)
+        except Exception as e:
+            print(f"Error preparing next track {path}: {e}")
+
+    def _prefer_cached(self, source):
+        """Swaps an unread file source for the cached copy, e.g. repeat-one of the track just finished."""
+        if (source is None or source.cached or source.frame or self.pcm_cache is None
+                or not self.pcm_cache.contains(source.path)):
+            return source
+        try:
+            cached = _Source(source.path, cache=self.pcm_cache, seek_index=self.seek_index, gain=source.gain)
+        except Exception:
+            return source
+        source.close()
+        return cached
+
+    def _decode_step(self):
+        source = self._source
+        chunk = source.read(DECODE_FRAMES)
+        end_of_track = len(chunk) < DECODE_FRAMES
+        chunk = self._convert(chunk)
+        if len(chunk):
+            self._ring.write(chunk)
+        if not end_of_track:
+            return
+
+        # Конец трека: следующий пишется в буфер сразу за ним, без паузы
+        following = self._prefer_cached(self._queued)
+        self._close_sources(self._previous)
+        self._previous = source
+        if following is not None and following.samplerate == source.samplerate:
+            self._source, self._queued, self._queued_path = following, None, None
+            # Растяжитель и ресемплер продолжают работать через границу; в буфере ещё не весь хвост трека
+            self._mark(self._decoder_generation, following, flush=False, event='changed',
+                       delay=self._pending_output())
+        elif following is not None:
+            # Другая частота: хвост дописывается целиком, следующий трек идёт со своим ресемплером
+            held = self._drain_pipeline()
+            self._source, self._queued, self._queued_path = following, None, None
+            self._reset_pipeline(following)
+            self._mark(self._decoder_generation, following, flush=False, event='changed', delay=held)
+        else:
+            held = self._drain_pipeline()
+            self._source = None
+            self._mark(self._decoder_generation, None, flush=False, event='finished', delay=held)
+
+    def _step_frames(self):
+        # Худший случай одного шага: замедление и повышение частоты дают больше кадров, чем прочитано
+        upsampling = max(1.0, self.output_rate / self._source.samplerate)
+        return int((DECODE_FRAMES / MIN_SPEED + DECODE_FRAMES) * upsampling)
+
+    def _run(self):
+        while True:
+            if self._tail is not None:
+                busy = self._ring.writable() > 0
+            else:
+                # При замедлении из DECODE_FRAMES входа получается больше кадров на выходе
+                busy = self._source is not None and self._ring.writable() >= self._step_frames()
+            try:
+                command = self._commands.get(block=not busy, timeout=None if busy else DECODER_POLL_INTERVAL)
+            except queue.Empty:
+                command = ()
+            if command is None:
+                self._close_sources(self._source, self._previous, self._queued)
+                return
+            task = 'command' if command else 'decode' if busy else None
+            if task:
+                self.stats.decoder_busy(task, perf_counter())
+            try:
+                if command:
+                    command[0](*command[1:])
+                elif busy and self._tail is not None:
+                    self._write_tail()
+                elif busy:
+                    self._decode_step()
+            except Exception as e:
+                print(f"Error in playback decoder: {e}")
+                self._stop(self._decoder_generation)
+            finally:
+                if task:
+                    self.stats.decoder_idle(perf_counter(), decoded=task == 'decode')
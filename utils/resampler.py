@@ -0,0 +1,100 @@
+import numpy as np
+
+# Качество: (число отводов фильтра, число фаз, beta окна Кайзера); 'low' — линейная интерполяция
+QUALITIES = {
+    'low': (2, 1, None),
+    'medium': (16, 256, 6.0),
+    'high': (64, 1024, 9.0),
+}
+DEFAULT_QUALITY = 'medium'
+
+
+def _build_table(taps, phases, beta, cutoff):
+    """Polyphase windowed-sinc coefficients: one row of `taps` weights per fractional phase."""
+    if beta is None:
+        fractions = np.arange(phases + 1) / phases
+        return np.column_stack((1 - fractions, fractions)).astype(np.float32), np.array([0, 1])
+    half = taps // 2
+    offsets = np.arange(-half + 1, half + 1)
+    fractions = np.arange(phases + 1) / phases
+    x = offsets[None, :] - fractions[:, None]
+    window = np.i0(beta * np.sqrt(np.clip(1 - (x / half) ** 2, 0, None))) / np.i0(beta)
+    table = cutoff * np.sinc(cutoff * x) * window
+    # Единичное усиление на постоянном сигнале для каждой фазы
+    table /= table.sum(axis=1, keepdims=True)
+    return table.astype(np.float32), offsets
+
+
+class Resampler:
+    """
+    Streaming sample-rate converter from in_rate to out_rate.
+
+    Each output frame is a dot product of the input frames around its
+    position with the polyphase windowed-sinc row for its fractional offset.
+    A whole block is computed at once, one filter tap per NumPy pass over all
+    output frames, so Python loops over taps, never over samples. When
+    downsampling, the cutoff follows
+    the output Nyquist so nothing aliases. The fractional position and the
+    input tail carry over between blocks, so any block size gives the same
+    output.
+    """
+
+    def __init__(self, in_rate, out_rate, channels, quality=DEFAULT_QUALITY):
+        if quality not in QUALITIES:
+            raise ValueError(f"Unknown resample quality {quality!r}, expected one of {', '.join(QUALITIES)}")
+        taps, phases, beta = QUALITIES[quality]
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.channels = channels
+        self.quality = quality
+        self.step = in_rate / out_rate
+        self.phases = phases
+        table, self.offsets = _build_table(taps, phases, beta, min(1.0, out_rate / in_rate))
+        # По строке на отвод: коэффициенты одного отвода для всех фаз лежат подряд
+        self.table = np.ascontiguousarray(table.T)
+        self.reset()
+
+    def reset(self):
+        # Перед первым кадром входа — нули, чтобы у первых выходных кадров было полное окно
+        self._left = -int(self.offsets[0])
+        self._buffer = np.zeros((self._left, self.channels), dtype=np.float32)
+        self._position = float(self._left)
+
+    def pending_output(self):
+        """Output frames still owed for input that was already fed in."""
+        # Выходные кадры, позиции которых ещё внутри поданного входа
+        last = len(self._buffer) - 1 - self._position
+        return int(last / self.step + 1e-9) + 1 if last >= 0 else 0
+
+    def process(self, chunk):
+        """Feeds input frames and returns the resampled frames that are ready."""
+        buffer = np.concatenate((self._buffer, chunk)) if len(chunk) else self._buffer
+        right = int(self.offsets[-1])
+        last_base = len(buffer) - 1 - right
+        if last_base < self._position:
+            self._buffer = buffer
+            return np.zeros((0, self.channels), dtype=np.float32)
+
+        count = int((last_base - self._position) / self.step) + 1
+        positions = self._position + np.arange(count) * self.step
+        bases = positions.astype(np.int64)
+        phases = ((positions - bases) * self.phases + 0.5).astype(np.int64)
+        output = np.zeros((count, self.channels), dtype=np.float32)
+        for offset, coefficients in zip(self.offsets, self.table):
+            frames = buffer.take(bases + offset, axis=0)
+            frames *= coefficients.take(phases)[:, None]
+            output += frames
+
+        # Остаток входа, который понадобится следующим выходным кадрам
+        self._position += count * self.step
+        keep_from = int(self._position) - self._left
+        self._buffer = buffer[keep_from:]
+        self._position -= keep_from
+        return output
+
+    def drain(self):
+        """Returns the remaining output at the end of the input and resets."""
+        owed = self.pending_output()
+        tail = self.process(np.zeros((len(self.offsets), self.channels), dtype=np.float32))
+        self.reset()
+        return tail[:owed]
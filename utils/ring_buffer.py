@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Single-producer, single-consumer ring of float32 audio frames.
+
+    write_pos and read_pos only ever grow and each is advanced by one side
+    only (the decoder writes, the audio callback reads), so neither side takes
+    a lock: a position is published only after the frames behind it are in
+    place. The storage is allocated once; reading copies into the caller's
+    buffer with the gain applied in the same pass. The storage can be given
+    as a buffer (e.g. shared memory) of frames * channels float32 values.
+    """
+
+    def __init__(self, frames, channels, buffer=None):
+        if buffer is None:
+            self.data = np.zeros((frames, channels), dtype=np.float32)
+        else:
+            self.data = np.ndarray((frames, channels), dtype=np.float32, buffer=buffer)
+            self.data.fill(0)
+        self.capacity = frames
+        self.write_pos = 0
+        self.read_pos = 0
+
+    def readable(self):
+        return self.write_pos - self.read_pos
+
+    def writable(self):
+        return self.capacity - (self.write_pos - self.read_pos)
+
+    def write(self, frames):
+        """Appends frames (producer side); the caller checks writable() first."""
+        count = len(frames)
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = frames[:first]
+        if first < count:
+            self.data[:count - first] = frames[first:]
+        self.write_pos += count
+
+    def read_into(self, out, gain=1.0):
+        """
+        Copies up to len(out) frames into out scaled by gain (consumer side)
+        and returns how many were copied. Allocates no sample memory.
+        """
+        count = min(len(out), self.write_pos - self.read_pos)
+        start = self.read_pos % self.capacity
+        first = min(count, self.capacity - start)
+        np.multiply(self.data[start:start + first], gain, out=out[:first])
+        if first < count:
+            np.multiply(self.data[:count - first], gain, out=out[first:count])
+        self.read_pos += count
+        return count
+
+    def skip_to(self, position):
+        """Drops everything before position (consumer side), e.g. after a seek."""
+        self.read_pos = max(self.read_pos, min(position, self.write_pos))
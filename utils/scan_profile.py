@@ -0,0 +1,218 @@
+"""
+Profiling mode of scan_songs (python main.py --profile-scan): wall and CPU
+time per phase, counts of directories visited, files stat'ed, bytes read
+and parse failures by cause, and the slowest beatmap folders.
+
+The scanner reports to the active profile through walk(), phase(),
+count() and failure(); with no profile active they cost a global lookup
+and return at once, so normal scans are not slowed down. A profiled scan
+runs in a single process, so every folder and stat call is seen.
+"""
+import contextlib
+import datetime
+import heapq
+import os
+import platform
+import tempfile
+import time
+
+# Профиль идущего сканирования; None — профилирование выключено
+active = None
+_NULL = contextlib.nullcontext()
+# Сколько самых медленных папок попадает в отчёт по умолчанию
+DEFAULT_TOP = 10
+# Порядок фаз в отчёте; вложенные фазы пишутся через '/'
+PHASES = ('import', 'cache load', 'walk', 'validate', 'osu!.db', 'parse', 'parse/read .osu', 'parse/stat',
+          'parse/hash', 'parse/probe', 'dedupe', 'sort', 'cache save')
+
+
+def walk(directories):
+    """directories, an iterator of (folder, ...) tuples, timed per item when a profile is active."""
+    if active is None:
+        return directories
+    return active.walk(directories)
+
+
+def phase(name, folder=None):
+    """Context manager timing name (and folder, a path inside the Songs folder) in the active profile."""
+    if active is None:
+        return _NULL
+    return active.phase(name, folder)
+
+
+def count(name, n=1):
+    if active is not None:
+        active.counts[name] = active.counts.get(name, 0) + n
+
+
+def failure(cause):
+    """Counts a .osu file or beatmap folder that could not be used, by cause."""
+    if active is not None:
+        active.failures[cause] = active.failures.get(cause, 0) + 1
+
+
+def _bytes_read():
+    """Bytes this process has read through read() calls so far (Linux); None elsewhere."""
+    try:
+        with open('/proc/self/io', 'rb') as f:
+            for line in f:
+                if line.startswith(b'rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class ScanProfile:
+    """Times and counts of one scan_songs() run, with per beatmap folder totals."""
+
+    def __init__(self, songs_dir, top=DEFAULT_TOP):
+        self.songs_dir = songs_dir
+        self.top = top
+        # Фаза: [стена, CPU, вызовы]
+        self.phases = {}
+        self.counts = {}
+        self.failures = {}
+        # Папка набора: {'walk': с, 'validate': с, 'parse': с}
+        self.folders = {}
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.bytes_read = None
+        self.songs = 0
+
+    def _set_folder(self, path):
+        relative = os.path.relpath(path, self.songs_dir)
+        return relative.split(os.sep, 1)[0]
+
+    def _folder(self, path):
+        folder = self.folders.get(self._set_folder(path))
+        if folder is None:
+            folder = self.folders[self._set_folder(path)] = {'walk': 0.0, 'validate': 0.0, 'parse': 0.0}
+        return folder
+
+    def _add(self, name, wall, cpu):
+        totals = self.phases.get(name)
+        if totals is None:
+            totals = self.phases[name] = [0.0, 0.0, 0]
+        totals[0] += wall
+        totals[1] += cpu
+        totals[2] += 1
+
+    @contextlib.contextmanager
+    def phase(self, name, folder=None):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._add(name, wall, cpu)
+            if folder is not None:
+                self._folder(folder)[name] += wall
+
+    def walk(self, directories):
+        # Время между выдачами — чтение каталогов; оно относится к папке набора
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            item = next(directories, None)
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._add('walk', wall, cpu)
+            if item is None:
+                return
+            if item[0] != self.songs_dir:
+                self._folder(item[0])['walk'] += wall
+            yield item
+
+    def run(self, scan):
+        """Calls scan() (a scan_songs call) with this profile active; returns its result."""
+        global active
+        active = self
+        started_read = _bytes_read()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            library = scan()
+        finally:
+            active = None
+            self.wall, self.cpu = time.perf_counter() - wall, time.process_time() - cpu
+            finished_read = _bytes_read()
+            if started_read is not None and finished_read is not None:
+                self.bytes_read = finished_read - started_read
+        self.songs = len(library)
+        return library
+
+    def slowest_folders(self):
+        return heapq.nlargest(self.top, ((sum(times.values()), folder, times)
+                                         for folder, times in self.folders.items()))
+
+    def report(self):
+        """JSON-ready report."""
+        names = [name for name in PHASES if name in self.phases] + sorted(self.phases.keys() - set(PHASES))
+        return {
+            'songs_dir': self.songs_dir,
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'songs': self.songs,
+            'wall_s': self.wall,
+            'cpu_s': self.cpu,
+            'bytes_read': self.bytes_read,
+            'phases': {name: {'wall_s': self.phases[name][0], 'cpu_s': self.phases[name][1],
+                              'calls': self.phases[name][2]} for name in names},
+            'counts': dict(sorted(self.counts.items())),
+            'failures': dict(sorted(self.failures.items(), key=lambda item: -item[1])),
+            'slowest_folders': [{'folder': folder, 'total_s': total, 'walk_s': times['walk'],
+                                 'validate_s': times['validate'], 'parse_s': times['parse']}
+                                for total, folder, times in self.slowest_folders()],
+        }
+
+
+def format_report(report):
+    """Human-readable summary of a report()."""
+    lines = [f"Scanned {report['songs_dir']}: {report['songs']} songs in {report['wall_s']:.3f} s "
+             f"({report['cpu_s']:.3f} s CPU)"]
+    if report['bytes_read'] is not None:
+        lines[0] += f", {report['bytes_read'] / 1024 / 1024:.1f} MB read"
+    lines.append("")
+    lines.append(f"{'phase':<20} {'wall, s':>9} {'CPU, s':>9} {'share':>6} {'calls':>9}")
+    for name, totals in report['phases'].items():
+        label = '  ' + name.split('/', 1)[1] if '/' in name else name
+        share = totals['wall_s'] / report['wall_s'] * 100 if report['wall_s'] else 0.0
+        lines.append(f"{label:<20} {totals['wall_s']:9.3f} {totals['cpu_s']:9.3f} {share:5.1f}% {totals['calls']:9}")
+    lines.append("")
+    for name, value in report['counts'].items():
+        lines.append(f"{name:<36} {value:>12}")
+    if report['failures']:
+        lines.append("")
+        lines.append("failures")
+        for cause, value in report['failures'].items():
+            lines.append(f"  {cause:<34} {value:>12}")
+    if report['slowest_folders']:
+        lines.append("")
+        lines.append("slowest folders, ms")
+        lines.append(f"{'total':>9} {'walk':>8} {'validate':>9} {'parse':>8}  folder")
+        for folder in report['slowest_folders']:
+            lines.append(f"{folder['total_s'] * 1000:9.1f} {folder['walk_s'] * 1000:8.1f} "
+                         f"{folder['validate_s'] * 1000:9.1f} {folder['parse_s'] * 1000:8.1f}  {folder['folder']}")
+    return '\n'.join(lines)
+
+
+def profile_scan(songs_dir, cache_path, cold=False, top=DEFAULT_TOP):
+    """
+    Runs scan_songs on songs_dir under a ScanProfile and returns its report.
+    cold scans with an empty library cache in a temporary file instead of
+    cache_path, so the user's cache is neither used nor rewritten.
+    """
+    from utils.scanner import scan_songs
+
+    def scan(cache_path):
+        # Сканер грузит libsndfile при разборе первой папки: это время показывается отдельно, а не в той папке
+        with phase('import'):
+            from utils import audio_probe
+        return scan_songs(songs_dir, workers=1, cache_path=cache_path)
+
+    profile = ScanProfile(songs_dir, top)
+    if not cold:
+        profile.run(lambda: scan(cache_path))
+        return profile.report()
+    with tempfile.TemporaryDirectory() as tmp:
+        profile.run(lambda: scan(os.path.join(tmp, os.path.basename(cache_path or 'song_cache.db'))))
+    return profile.report()
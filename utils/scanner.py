@@ -1,142 +1,847 @@
 import os
-import json
-import sys
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
-if sys.platform == 'win32':
-    import ctypes
+from utils import scan_profile
+from utils.file_hash import full_hash, partial_hash
+from utils.library_store import JsonLibraryStore, SqliteLibraryStore, open_library_store
+from utils.osu_db import OSU_DB_FILE, read_osu_db
+from utils.osu_parser import PARSER_VERSION, parse_osu_file, read_audio_filename, read_background
 
-CACHE_FILE = 'song_cache.json'
+CACHE_FILE = 'song_cache.db'
+LEGACY_CACHE_FILE = 'song_cache.json'
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', CACHE_FILE)
+CACHE_VERSION = 3
+# Версия кэша с одной песней на папку: переносится без потери песен и громкости
+SINGLE_SONG_CACHE_VERSION = 2
+# Увеличивается при изменении полей записи песни: старые записи показываются сразу, но разбираются заново
+ENTRY_VERSION = 3
+# Меньше папок проще разобрать в одном процессе, чем запускать пул
+MIN_FOLDERS_PER_WORKER = 16
+# Как часто (в секундах) отдавать найденные песни и прогресс при сканировании
+PROGRESS_INTERVAL = 0.25
+# Как часто (в секундах) результаты анализа громкости сохраняются в кэш
+LOUDNESS_SAVE_INTERVAL = 30
+# Как часто (в секундах) фоновый проход по песням из osu!.db сохраняет фоны и хэши и отдаёт их окну
+DETAILS_SAVE_INTERVAL = 5
+# На сколько уровней сканер спускается в папки без .osu (паки, распакованные в подпапку)
+MAX_CONTAINER_DEPTH = 3
+# osu!.db читается целиком: ради нескольких новых папок его чтение дольше разбора их .osu.
+# Он читается, когда разобрать нужно не меньше такой доли его карт (по размеру файла)
+OSU_DB_MIN_SHARE = 0.25
+OSU_DB_BYTES_PER_MAP = 500
+# Поля записи osu!.db и ключи parse_osu_file(), в которые они ложатся
+OSU_DB_FIELDS = (
+    ('audio_filename', 'AudioFilename'),
+    ('title', 'Title'),
+    ('artist', 'Artist'),
+    ('title_unicode', 'TitleUnicode'),
+    ('artist_unicode', 'ArtistUnicode'),
+    ('creator', 'Creator'),
+    ('source', 'Source'),
+    ('tags', 'Tags'),
+)
+# Поля песни из probe_audio(): у неизменившегося аудиофайла они берутся из старой записи
+AUDIO_INFO_FIELDS = ('duration', 'samplerate', 'channels', 'codec', 'file_size')
 
-def parse_osu_file(filepath):
-    metadata = {}
-    in_events_section = False
-    in_timing_section = False
+# Чтение-изменение-запись кэша из разных потоков (наблюдатель, анализ громкости) идут по очереди
+_cache_lock = threading.Lock()
+
+def _stat_signature(path):
+    """Returns [mtime, size] for a file or None if it cannot be stat'ed."""
+    scan_profile.count("files stat'ed")
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size]
 
-                if line == '[Events]':
-                    in_events_section = True
-                    in_timing_section = False
-                    continue
-                if line == '[TimingPoints]':
-                    in_timing_section = True
-                    in_events_section = False
-                    continue
-                if line.startswith('['):
-                    in_events_section = False
-                    in_timing_section = False
+def _entry_signature(entry):
+    """_stat_signature() of an os.DirEntry; free on Windows, where the listing carries the stat."""
+    scan_profile.count("files stat'ed")
+    try:
+        st = entry.stat()
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size]
+
+def _walk_sets(top, descend_top=False):
+    """
+    Yields (root, osu_stat, files) for every beatmapset folder at or under
+    top, i.e. a folder with .osu files. osu_stat is the signature of its
+    .osu files, taken from the directory entries; files maps the lowercased
+    names of the files in it to their names (see _resolve).
+
+    Only the set folder itself is listed: its subfolders (storyboards,
+    skins, hitsound packs) are never entered. Folders without .osu files,
+    like a pack extracted into a folder, are descended into up to
+    MAX_CONTAINER_DEPTH levels. descend_top descends into top even when it
+    has .osu files itself (the Songs folder). Symlinked folders are not
+    followed, as with os.walk.
+    """
+    pending = [(top, 0)]
+    while pending:
+        path, depth = pending.pop()
+        try:
+            with os.scandir(path) as listing:
+                entries = list(listing)
+        except OSError:
+            continue
+        scan_profile.count('dirs visited')
+        scan_profile.count('directory entries', len(entries))
+        files = {}
+        osu_entries = []
+        subfolders = []
+        for entry in entries:
+            try:
+                # Тип берётся из самого листинга, без stat
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.path)
                     continue
+            except OSError:
+                continue
+            files[entry.name.lower()] = entry.name
+            if entry.name.endswith('.osu'):
+                osu_entries.append(entry)
+        if osu_entries:
+            osu_entries.sort(key=lambda entry: entry.name)
+            yield path, [[entry.name] + (_entry_signature(entry) or []) for entry in osu_entries], files
+        if (not osu_entries or (depth == 0 and descend_top)) and depth < MAX_CONTAINER_DEPTH:
+            # Обратный порядок в стеке: папки обходятся в порядке листинга, как у os.walk
+            pending.extend((subfolder, depth + 1) for subfolder in reversed(subfolders))
 
-                if line.startswith('AudioFilename:'):
-                    metadata['AudioFilename'] = line.split(':', 1)[1].strip()
-                elif line.startswith('Title:'):
-                    metadata['Title'] = line.split(':', 1)[1].strip()
-                elif line.startswith('Artist:'):
-                    metadata['Artist'] = line.split(':', 1)[1].strip()
-                elif in_events_section and (line.startswith('0,0,') or line.startswith('Video,') or line.startswith('1,0,')):
-                    try:
-                        parts = line.split(',')
-                        filename = parts[2].strip('"')
-                        if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                             metadata['Background'] = filename
-                    except IndexError:
-                        continue
-                elif in_timing_section and 'BPM' not in metadata:
+def _resolve(root, files, name):
+    """
+    Path of the file a .osu file references as name in the folder root, or
+    None if it is not there. Plain names are looked up in files (from
+    _walk_sets) case-insensitively, as osu! does on Windows, without a
+    syscall; names with a subfolder are checked on disk as written.
+    """
+    name = name.replace('\\', '/')
+    if '/' not in name:
+        found = files.get(name.lower())
+        return os.path.join(root, found) if found else None
+    path = os.path.join(root, *name.split('/'))
+    scan_profile.count("files stat'ed")
+    return path if os.path.exists(path) else None
+
+def _load_osu_db(songs_dir, osu_files=None):
+    """
+    Reads the osu!.db next to songs_dir. Returns ({lowercased set folder
+    path: {lowercased .osu file name: metadata}}, time the database was last
+    written), with metadata under the keys of parse_osu_file(); there is no
+    Background, osu! does not keep it. Returns ({}, None) when there is no
+    readable osu!.db, or when osu_files, the number of .osu files to parse,
+    is too small a share of the database for reading it to pay off.
+    """
+    path = os.path.join(os.path.dirname(os.path.normpath(songs_dir)), OSU_DB_FILE)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {}, None
+    if osu_files is not None and osu_files < st.st_size / OSU_DB_BYTES_PER_MAP * OSU_DB_MIN_SHARE:
+        return {}, None
+    written = st.st_mtime
+    folders = {}
+    folder = beatmaps = None
+    count = 0
+    try:
+        for beatmap in read_osu_db(path):
+            if not beatmap['folder'] or not beatmap['osu_file']:
+                continue
+            if beatmap['folder'] != folder:
+                # Сложности одного сета идут в базе подряд
+                folder = beatmap['folder']
+                # Папки записаны относительно Songs и с обратной косой чертой
+                root = os.path.join(songs_dir, *folder.replace('\\', '/').split('/'))
+                beatmaps = folders.setdefault(root.lower(), {})
+            metadata = {key: beatmap[field] for field, key in OSU_DB_FIELDS if beatmap[field] is not None}
+            if beatmap['beat_length'] and beatmap['beat_length'] > 0:
+                metadata['BPM'] = round(60000 / beatmap['beat_length'])
+            beatmaps[beatmap['osu_file'].lower()] = metadata
+            count += 1
+    except (OSError, ValueError) as e:
+        print(f"Error reading {path}: {e}")
+        return {}, None
+    scan_profile.count('beatmaps in osu!.db', count)
+    return folders, written
+
+def _db_beatmaps(osu_db, root, osu_stat):
+    """
+    {.osu file name: metadata} of the difficulties of the set folder root
+    that osu_db (from _load_osu_db) knows, leaving out .osu files changed
+    after osu! last wrote the database; None when it knows none.
+    """
+    folders, written = osu_db
+    known = folders.get(root.lower())
+    if not known:
+        return None
+    beatmaps = {}
+    for osu_file, *signature in osu_stat:
+        metadata = known.get(osu_file.lower())
+        if metadata is not None and signature and signature[0] <= written:
+            beatmaps[osu_file] = metadata
+    return beatmaps or None
+
+def _scan_folder(root, osu_stat, files, old_record=None, db_beatmaps=None):
+    """
+    Parses one beatmapset folder and returns its cache record: the
+    signatures of its .osu files (osu_stat from _walk_sets) and one entry
+    per distinct AudioFilename used by its difficulties, with the song built
+    from the first difficulty that uses it. Referenced files are resolved
+    against files, the folder listing. Content hashes, stream parameters and
+    loudness measurements of audio files that did not change since
+    old_record are reused.
+
+    Difficulties in db_beatmaps (from _db_beatmaps) take their metadata
+    from osu!.db and none of their files is opened: a song built from one
+    gets no background, and its audio file is neither hashed nor probed
+    unless old_record has it. Its entry keeps the .osu file name in
+    'deferred' for complete_songs(), which fills the rest in later.
+    """
+    # libsndfile грузится только в процессах сканирования, а не при импорте модуля окном
+    from utils.audio_probe import probe_audio
+
+    record = {
+        'osu_stat': osu_stat,
+        'entries': [],
+        'error': None,
+    }
+    known = {entry['audio_path']: entry for entry in old_record.get('entries', [])} if old_record else {}
+    seen = set()
+    error = None
+
+    for osu_file, *_ in osu_stat:
+        osu_filepath = os.path.join(root, osu_file)
+        db_metadata = db_beatmaps.get(osu_file) if db_beatmaps else None
+        if seen:
+            # Остальные сложности нужны только ради AudioFilename
+            if db_metadata is not None:
+                audio_filename = db_metadata.get('AudioFilename')
+            else:
+                with scan_profile.phase('parse/read .osu'):
+                    audio_filename = read_audio_filename(osu_filepath)
+            if audio_filename is None or audio_filename.lower() in seen:
+                continue
+        if db_metadata is not None:
+            metadata = db_metadata
+            scan_profile.count('beatmaps taken from osu!.db')
+        else:
+            with scan_profile.phase('parse/read .osu'):
+                metadata = parse_osu_file(osu_filepath)
+        if metadata is None:
+            error = 'parse_failed'
+            continue
+        if 'AudioFilename' not in metadata:
+            scan_profile.failure('no AudioFilename')
+            error = error or 'no_audio_filename'
+            continue
+        # Имена файлов в osu! не зависят от регистра
+        if metadata['AudioFilename'].lower() in seen:
+            continue
+        seen.add(metadata['AudioFilename'].lower())
+
+        audio_path = _resolve(root, files, metadata['AudioFilename'])
+        if audio_path is None:
+            audio_path, audio_stat = os.path.join(root, metadata['AudioFilename']), None
+        else:
+            with scan_profile.phase('parse/stat'):
+                audio_stat = _stat_signature(audio_path)
+        entry = {
+            'audio_path': audio_path,
+            'audio_stat': audio_stat,
+            'hash': None,
+            'full_hash': None,
+            'duplicate_of': None,
+            'deferred': None,
+            'song': None,
+        }
+        record['entries'].append(entry)
+        if entry['audio_stat'] is None:
+            # Запись остаётся, чтобы появившийся позже файл сделал папку недействительной
+            scan_profile.failure('audio file missing')
+            error = 'audio_missing'
+            continue
+
+        old_entry = known.get(audio_path)
+        unchanged = old_entry is not None and old_entry['audio_stat'] == entry['audio_stat']
+        if unchanged:
+            entry['hash'] = old_entry.get('hash')
+            entry['full_hash'] = old_entry.get('full_hash')
+        old_song = old_entry.get('song') if unchanged else None
+        if db_metadata is not None:
+            # Библиотека строится по одной базе: фон, хэш и параметры потока дочитывает complete_songs()
+            entry['deferred'] = osu_file
+            scan_profile.count('songs completed in the background')
+        elif entry['hash'] is None:
+            try:
+                with scan_profile.phase('parse/hash'):
+                    entry['hash'] = partial_hash(audio_path)
+            except OSError:
+                pass
+
+        background_path = None
+        if db_metadata is None:
+            background = metadata.get('Background')
+            if background is not None:
+                background_path = _resolve(root, files, background)
+                if background_path is None:
+                    scan_profile.failure('background missing')
+            else:
+                scan_profile.count('songs without a background')
+
+        # Отложенная запись ещё не разобрана, если её аудиофайл не открывали
+        probed = old_song and all(field in old_song for field in AUDIO_INFO_FIELDS) and not (
+            old_entry.get('deferred') and old_song['samplerate'] is None)
+        if probed:
+            audio_info = {field: old_song[field] for field in AUDIO_INFO_FIELDS}
+            scan_profile.count('audio files reused from cache')
+        elif db_metadata is not None:
+            audio_info = {}
+        else:
+            # Параметры потока читаются из заголовков здесь, в пуле, а не при воспроизведении
+            with scan_profile.phase('parse/probe'):
+                audio_info = probe_audio(audio_path) or {}
+
+        entry['song'] = {
+            'artist': metadata.get('Artist', 'Unknown Artist'),
+            'title': metadata.get('Title', 'Unknown Title'),
+            'audio_path': audio_path,
+            'background_path': background_path,
+            'bpm': metadata.get('BPM'),
+            'display_text': f"{metadata.get('Artist', 'Unknown Artist')} - {metadata.get('Title', 'Unknown Title')}",
+            'artist_unicode': metadata.get('ArtistUnicode', ''),
+            'title_unicode': metadata.get('TitleUnicode', ''),
+            'creator': metadata.get('Creator', ''),
+            'source': metadata.get('Source', ''),
+            'tags': metadata.get('Tags', ''),
+            'duration': audio_info.get('duration'),
+            'samplerate': audio_info.get('samplerate'),
+            'channels': audio_info.get('channels'),
+            'codec': audio_info.get('codec'),
+            'file_size': audio_info.get('file_size'),
+        }
+        if old_song and 'loudness' in old_song:
+            # Громкость зависит только от аудиофайла
+            entry['song']['loudness'] = old_song['loudness']
+
+    if not any(entry['song'] for entry in record['entries']):
+        record['error'] = error or 'no_audio_filename'
+    return record
+
+def _is_record_valid(root, osu_stat, files, record):
+    """Checks a cached folder record against the current state of the folder (osu_stat and files from _walk_sets)."""
+    if not record or 'entries' not in record:
+        return False
+    # Любая сложность может сменить AudioFilename: сверяются все .osu
+    if osu_stat != record.get('osu_stat'):
+        return False
+    for entry in record['entries']:
+        # Пропавший или появившийся файл виден по листингу, stat нужен только существующему
+        if _resolve(root, files, os.path.relpath(entry['audio_path'], root)) is None:
+            if entry['audio_stat'] is not None:
+                return False
+        elif entry['audio_stat'] is None or _stat_signature(entry['audio_path']) != entry['audio_stat']:
+            return False
+    return True
+
+def _record_songs(record):
+    """Songs of a folder record that are not duplicates of songs in other folders."""
+    return [entry['song'] for entry in record.get('entries', ()) if entry['song'] and not entry.get('duplicate_of')]
+
+def _dedupe(folders):
+    """
+    Marks songs whose audio file has the same contents as a song in an
+    earlier folder (by folder path) with duplicate_of. Entries are grouped
+    by their partial hash; only groups with more than one file are read in
+    full, and the full hashes are kept in the entries. Returns True if any
+    entry changed.
+    """
+    groups = {}
+    for root in sorted(folders):
+        for entry in folders[root].get('entries', ()):
+            if entry['song'] and entry.get('hash'):
+                groups.setdefault(entry['hash'], []).append(entry)
+            elif entry.get('duplicate_of'):
+                entry['duplicate_of'] = None
+
+    changed = False
+    for entries in groups.values():
+        originals = {}
+        for entry in entries:
+            duplicate_of = None
+            if len(entries) > 1:
+                if entry.get('full_hash') is None:
                     try:
-                        parts = line.split(',')
-                        if len(parts) >= 8:
-                            beat_length_str = parts[1]
-                            uninherited = parts[6]
-                            if uninherited == '1' and float(beat_length_str) > 0:
-                                bpm = 60000 / float(beat_length_str)
-                                metadata['BPM'] = round(bpm)
-                    except (ValueError, IndexError, ZeroDivisionError):
-                        continue
-                
-                if 'AudioFilename' in metadata and 'Title' in metadata and 'Artist' in metadata and 'Background' in metadata and 'BPM' in metadata:
-                    break
+                        entry['full_hash'] = full_hash(entry['audio_path'])
+                    except OSError:
+                        entry['full_hash'] = entry['audio_path']
+                    changed = True
+                duplicate_of = originals.setdefault(entry['full_hash'], entry['audio_path'])
+                if duplicate_of == entry['audio_path']:
+                    duplicate_of = None
+            if entry.get('duplicate_of') != duplicate_of:
+                entry['duplicate_of'] = duplicate_of
+                changed = True
+    return changed
+
+def _upgrade_record(record):
+    """Converts a one-song folder record of cache version 2; the folder is re-parsed, its song shows meanwhile."""
+    entries = []
+    if record.get('audio_path'):
+        entries.append({
+            'audio_path': record['audio_path'],
+            'audio_stat': record.get('audio_stat'),
+            'hash': None,
+            'full_hash': None,
+            'duplicate_of': None,
+            'song': record.get('song'),
+        })
+    return {'osu_stat': None, 'entries': entries, 'error': record.get('error')}
+
+def _load_cache(store):
+    """
+    Returns (folders, stale). Stale records still carry displayable songs
+    but were built with older song fields and must be parsed again.
+    """
+    cache_data = store.load()
+    if not cache_data and isinstance(store, SqliteLibraryStore):
+        # Переход со старого JSON-кэша: записи папок переносятся без повторного разбора
+        legacy_store = JsonLibraryStore(os.path.join(os.path.dirname(store.path), LEGACY_CACHE_FILE))
+        if legacy_store.exists():
+            print("Migrating the JSON song cache to the new format.")
+            cache_data = legacy_store.load()
+            legacy_store.remove()
+    if not cache_data:
+        return {}, False
+    version = cache_data.get('version')
+    if version not in (SINGLE_SONG_CACHE_VERSION, CACHE_VERSION):
+        print("Cache format is outdated, folders will be re-parsed.")
+        return {}, False
+    folders = cache_data.get('folders')
+    if not isinstance(folders, dict):
+        return {}, False
+    stale = cache_data.get('entry_version', 1) != ENTRY_VERSION
+    if version == SINGLE_SONG_CACHE_VERSION:
+        # Песни из старого кэша показываются сразу, папки разбираются заново
+        folders = {root: _upgrade_record(record) for root, record in folders.items()}
+        stale = True
+    if cache_data.get('parser_version') != PARSER_VERSION:
+        # Новый парсер может справиться с папками, на которых падал старый
+        folders = {root: record for root, record in folders.items()
+                   if any(entry['song'] for entry in record.get('entries', ()))}
+    if stale and folders:
+        print("Cached songs are missing newer fields, folders will be re-parsed.")
+    return folders, stale
+
+def _save_cache(store, songs_dir, folders, entry_version=ENTRY_VERSION):
+    try:
+        store.save({
+            'version': CACHE_VERSION,
+            'parser_version': PARSER_VERSION,
+            'entry_version': entry_version,
+            'songs_dir': songs_dir,
+            'folders': folders,
+        })
     except Exception as e:
-        print(f"Error parsing file {filepath}: {e}")
-        return None
-    return metadata
+        print(f"Error saving cache file: {e}")
 
-def scan_songs(songs_dir):
-    cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', CACHE_FILE)
-    
-    # --- Проверка кэша ---
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-            cached_mtime = cache_data.get('mtime')
-            current_mtime = os.path.getmtime(songs_dir)
-            if cached_mtime == current_mtime:
-                library = cache_data.get('library', [])
-                if library:
-                    print("Loading songs from cache.")
-                    return library
-        except (json.JSONDecodeError, KeyError, TypeError, FileNotFoundError) as e:
-            print(f"Cache is invalid or not found, performing a full scan. Error: {e}")
-
-    # --- Полное сканирование ---
-    print("Performing a full scan of the songs directory...")
-    song_library = []
+def _scan_folder_task(task):
+    return _scan_folder(*task)
+
+def _iter_scanned_folders(tasks, workers):
+    """
+    Yields _scan_folder results for (root, osu_stat, files, old_record, db_beatmaps) tasks, from a process
+    pool when more than one worker is requested. Results keep the order of
+    the tasks, so the library comes out the same as with a serial scan.
+    Closing the generator early cancels the folders that have not started.
+    """
+    workers = min(workers, len(tasks) // MIN_FOLDERS_PER_WORKER)
+    if workers <= 1:
+        for task in tasks:
+            with scan_profile.phase('parse', task[0]):
+                record = _scan_folder(*task)
+            yield record
+        return
+
+    chunksize = max(1, min(64, len(tasks) // (workers * 8)))
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        yield from executor.map(_scan_folder_task, tasks, chunksize=chunksize)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def scan_songs(songs_dir, workers=1, cache_path=CACHE_PATH, on_songs=None, on_progress=None, cancel_event=None,
+               use_osu_db=True):
+    """
+    Scans songs_dir and returns the library sorted by display text.
+
+    workers > 1 parses new and changed folders in a process pool.
+    cache_path picks the library store by extension (.db or .json);
+    cache_path=None disables the per-folder cache. With use_osu_db, folders
+    to parse take the metadata of their difficulties from the osu!.db next
+    to songs_dir when osu! knows them, instead of parsing their .osu files;
+    the database is only read when many folders need parsing (see
+    _load_osu_db). Their songs have no background, duration or hash until
+    complete_songs() runs.
+
+    Every distinct audio file of a beatmapset becomes a song; songs whose
+    audio has the same contents as one in another set are left out (see
+    _dedupe).
+
+    For progressive loading, on_songs(songs) first receives every cached song
+    and then batches of newly parsed ones, and on_progress(done, total)
+    reports parsed folders. The returned library is the authoritative result:
+    it drops songs from folders that were removed or changed, and duplicates
+    that batches could not recognize yet. Setting cancel_event stops the
+    scan; folders parsed so far are still cached.
+    """
     if not songs_dir:
-        return song_library
+        return []
+    # Кэш читается в начале и записывается в конце: наблюдатель и анализ громкости ждут
+    with _cache_lock:
+        return _scan_songs(songs_dir, workers, cache_path, on_songs, on_progress, cancel_event, use_osu_db)
 
-    for root, dirs, files in os.walk(songs_dir):
-        osu_files = [f for f in files if f.endswith('.osu')]
-        if not osu_files:
-            continue
-            
-        for file in osu_files:
-            osu_filepath = os.path.join(root, file)
-            metadata = parse_osu_file(osu_filepath)
-            if metadata and 'AudioFilename' in metadata:
-                audio_path = os.path.join(root, metadata['AudioFilename'])
-                background_path = None
-                if 'Background' in metadata:
-                    bg_file = os.path.join(root, metadata['Background'])
-                    if os.path.exists(bg_file):
-                        background_path = bg_file
-
-                if os.path.exists(audio_path):
-                    song_info = {
-                        'artist': metadata.get('Artist', 'Unknown Artist'),
-                        'title': metadata.get('Title', 'Unknown Title'),
-                        'audio_path': audio_path,
-                        'background_path': background_path,
-                        'bpm': metadata.get('BPM'),
-                        'display_text': f"{metadata.get('Artist', 'Unknown Artist')} - {metadata.get('Title', 'Unknown Title')}"
-                    }
-                    song_library.append(song_info)
-                # Только один .osu на папку
-                break 
-
-    song_library = sorted(song_library, key=lambda x: x['display_text'])
+def _scan_songs(songs_dir, workers, cache_path, on_songs, on_progress, cancel_event, use_osu_db):
+    # --- Индекс по папкам из кэша ---
+    store = open_library_store(cache_path) if cache_path else None
+    with scan_profile.phase('cache load'):
+        cached_folders, stale = _load_cache(store) if store else ({}, False)
+    folders = {}
+    tasks = []
+    cancelled = False
 
-    # --- Сохранение в кэш ---
+    # Быстрые хэши уже отданных песен: копии из новых папок в партии не попадают
+    shown_hashes = set()
+    if on_songs:
+        cached_songs = []
+        # С разделителем в конце: папка Songs2 рядом с Songs не совпадает
+        prefix = os.path.join(songs_dir, '')
+        for root, record in cached_folders.items():
+            if root == songs_dir or root.startswith(prefix):
+                for entry in record.get('entries', ()):
+                    if entry['song'] and not entry.get('duplicate_of'):
+                        cached_songs.append(entry['song'])
+                        shown_hashes.add(entry.get('hash'))
+        if cached_songs:
+            on_songs(sorted(cached_songs, key=lambda x: x['display_text']))
+
+    for root, osu_stat, files in scan_profile.walk(_walk_sets(songs_dir, descend_top=True)):
+        if cancel_event and cancel_event.is_set():
+            cancelled = True
+            break
+        record = cached_folders.get(root)
+        with scan_profile.phase('validate', root):
+            valid = not stale and _is_record_valid(root, osu_stat, files, record)
+        if valid:
+            folders[root] = record
+        else:
+            # Место в словаре резервируется сразу, чтобы порядок папок не зависел от кэша
+            folders[root] = None
+            tasks.append((root, osu_stat, files, record))
+
+    if tasks and use_osu_db:
+        with scan_profile.phase('osu!.db'):
+            osu_db = _load_osu_db(songs_dir, sum(len(task[1]) for task in tasks))
+        if osu_db[0]:
+            tasks = [task + (_db_beatmaps(osu_db, task[0], task[1]),) for task in tasks]
+        del osu_db
+
+    if on_progress:
+        on_progress(0, len(tasks))
+    batch = []
+    parsed = 0
+    last_report = time.monotonic()
+    results = _iter_scanned_folders(tasks, workers or 1)
     try:
-        current_mtime = os.path.getmtime(songs_dir)
-        cache_data = {'mtime': current_mtime, 'library': song_library}
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=4)
+        for (root, *_), record in zip(tasks, results):
+            if cancel_event and cancel_event.is_set():
+                cancelled = True
+                break
+            folders[root] = record
+            parsed += 1
+            for entry in record['entries']:
+                if entry['song'] and (entry['hash'] is None or entry['hash'] not in shown_hashes):
+                    shown_hashes.add(entry['hash'])
+                    batch.append(entry['song'])
 
-        # --- Сделать файл кэша скрытым в Windows ---
-        if sys.platform == 'win32':
-            FILE_ATTRIBUTE_HIDDEN = 0x02
-            ctypes.windll.kernel32.SetFileAttributesW(cache_path, FILE_ATTRIBUTE_HIDDEN)
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                if on_songs and batch:
+                    on_songs(batch)
+                    batch = []
+                if on_progress:
+                    on_progress(parsed, len(tasks))
+    finally:
+        results.close()
+    if on_songs and batch:
+        on_songs(batch)
+    if on_progress:
+        on_progress(parsed, len(tasks))
 
-    except Exception as e:
-        print(f"Error saving or hiding cache file: {e}")
+    folders = {root: record for root, record in folders.items() if record is not None}
+    if cancelled:
+        # Непросмотренные папки остаются в кэше как были
+        for root, record in cached_folders.items():
+            folders.setdefault(root, record)
 
-    print(f"Scan complete. Found {len(song_library)} songs.")
+    reused = len(folders) - parsed
+    removed = len(cached_folders.keys() - folders.keys())
+    with scan_profile.phase('dedupe'):
+        deduped = _dedupe(folders)
+    song_library = [song for record in folders.values() for song in _record_songs(record)]
+    with scan_profile.phase('sort'):
+        song_library = sorted(song_library, key=lambda x: x['display_text'])
+    duplicates = sum(1 for record in folders.values() for entry in record['entries'] if entry.get('duplicate_of'))
+
+    # --- Сохранение в кэш ---
+    if store and (parsed or removed or deduped or not store.exists()):
+        # Прерванное сканирование оставляет часть старых записей: кэш остаётся устаревшим
+        with scan_profile.phase('cache save'):
+            _save_cache(store, songs_dir, folders, ENTRY_VERSION if not (stale and cancelled) else 1)
+
+    status = "Scan cancelled" if cancelled else "Scan complete"
+    print(f"{status}. Found {len(song_library)} songs "
+          f"({reused} folders from cache, {parsed} parsed, {removed} removed, {duplicates} duplicates hidden).")
     return song_library
 
+def _library_diff(old_songs, folders):
+    """The added/removed/updated diff (see rescan_folders) from {audio path: song} to the songs of folders."""
+    new_songs = {song['audio_path']: song for record in folders.values() for song in _record_songs(record)}
+    return {
+        'added': [song for path, song in new_songs.items() if path not in old_songs],
+        'removed': [path for path in old_songs if path not in new_songs],
+        'updated': [song for path, song in new_songs.items()
+                    if path in old_songs and old_songs[path] is not song and old_songs[path] != song],
+    }
+
+def rescan_folders(songs_dir, set_folders, cache_path=CACHE_PATH):
+    """
+    Re-checks only the given beatmapset folders (and the sets inside them,
+    for a folder holding a pack) and
+    updates the cache. Unchanged folders are reused from the cache, so this
+    never turns into a full rescan. Passing songs_dir itself re-checks every
+    folder against the cache, which also finds the folders that are gone.
+
+    Returns a diff of the whole library: {'added': [songs], 'removed':
+    [audio paths], 'updated': [songs]}; 'updated' songs keep their audio
+    path but have new metadata. A song can also be added or removed outside
+    the given folders, when the copy it duplicated comes or goes.
+    """
+    with _cache_lock:
+        return _rescan_folders(songs_dir, set_folders, cache_path)
+
+def _rescan_folders(songs_dir, set_folders, cache_path):
+    store = open_library_store(cache_path) if cache_path else None
+    cached_folders, stale = _load_cache(store) if store else ({}, False)
+    folders = dict(cached_folders)
+    old_songs = {song['audio_path']: song for record in folders.values() for song in _record_songs(record)}
+    changed = False
+    dropped = set()
+    if songs_dir in set_folders:
+        # Вся папка Songs: остальные папки войдут в её обход
+        set_folders = [songs_dir]
+
+    for set_folder in set_folders:
+        prefix = set_folder + os.sep
+        for root in [root for root in folders if root == set_folder or root.startswith(prefix)]:
+            del folders[root]
+            dropped.add(root)
+
+        for root, osu_stat, files in _walk_sets(set_folder, descend_top=set_folder == songs_dir):
+            record = cached_folders.get(root)
+            if stale or not _is_record_valid(root, osu_stat, files, record):
+                record = _scan_folder(root, osu_stat, files, record)
+                changed = True
+            folders[root] = record
+
+    if dropped - folders.keys():
+        changed = True
+    # Дубликаты пересчитываются по всей библиотеке: полные хэши уже в кэше
+    if _dedupe(folders):
+        changed = True
+    diff = _library_diff(old_songs, folders)
+    if store and (diff['added'] or diff['removed'] or diff['updated'] or changed):
+        _save_cache(store, songs_dir, folders, ENTRY_VERSION if not stale else 1)
+    return diff
+
+def update_loudness(songs_dir, results, cache_path=CACHE_PATH):
+    """Stores {audio_path: loudness} in the matching song entries of the library cache."""
+    store = open_library_store(cache_path)
+    with _cache_lock:
+        try:
+            store.update_songs({path: {'loudness': loudness} for path, loudness in results.items()})
+        except Exception as e:
+            print(f"Error saving cache file: {e}")
+
+def _complete_task(task):
+    """
+    Process-pool entry point of complete_songs: reads what the scan left out
+    of a song built from osu!.db. Returns (audio path, details) with the
+    background path, the partial hash and stream parameters when asked for.
+    """
+    from utils.audio_probe import probe_audio
+
+    root, osu_file, audio_path, need_hash, need_probe = task
+    details = {'background_path': None}
+    background = read_background(os.path.join(root, osu_file))
+    if background is not None:
+        try:
+            files = {name.lower(): name for name in os.listdir(root)}
+        except OSError:
+            files = {}
+        details['background_path'] = _resolve(root, files, background)
+    if need_hash:
+        try:
+            details['hash'] = partial_hash(audio_path)
+        except OSError:
+            details['hash'] = None
+    if need_probe:
+        audio_info = probe_audio(audio_path) or {}
+        details.update((field, audio_info.get(field)) for field in AUDIO_INFO_FIELDS)
+    return audio_path, details
+
+def update_details(songs_dir, results, cache_path=CACHE_PATH):
+    """
+    Stores {audio_path: details} from _complete_task in the deferred entries
+    of the library cache and hides the duplicates the new hashes reveal.
+    Returns the library diff (see rescan_folders).
+    """
+    store = open_library_store(cache_path)
+    with _cache_lock:
+        folders, _ = _load_cache(store)
+        old_songs = {song['audio_path']: song for record in folders.values() for song in _record_songs(record)}
+        entries = [entry for record in folders.values() for entry in record.get('entries', ())]
+        old_duplicates = [(entry.get('full_hash'), entry.get('duplicate_of')) for entry in entries]
+        changed = []
+        for entry in entries:
+            details = results.get(entry['audio_path'])
+            # Папку мог уже разобрать наблюдатель: его запись полная
+            if details is None or not entry.get('deferred') or not entry['song']:
+                continue
+            details = dict(details)
+            if 'hash' in details:
+                entry['hash'] = details.pop('hash')
+            entry['song'] = dict(entry['song'], **details)
+            entry['deferred'] = None
+            changed.append(entry)
+        _dedupe(folders)
+        # Новые хэши могли сделать дубликатами и песни вне results
+        changed_paths = {entry['audio_path'] for entry in changed}
+        changed += [entry for entry, old in zip(entries, old_duplicates)
+                    if old != (entry.get('full_hash'), entry.get('duplicate_of'))
+                    and entry['audio_path'] not in changed_paths]
+        diff = _library_diff(old_songs, folders)
+        try:
+            store.update_entries(changed)
+        except Exception as e:
+            print(f"Error saving cache file: {e}")
+    return diff
+
+def complete_songs(songs_dir, workers=1, cache_path=CACHE_PATH, on_diff=None, cancel_event=None):
+    """
+    Background pass over the songs scan_songs built from osu!.db alone:
+    reads their background from the .osu file and hashes and probes their
+    audio, in a pool of low-priority processes. Results are written to the
+    cache every DETAILS_SAVE_INTERVAL seconds and when the run stops;
+    on_diff(diff) receives the library changes of each saved batch, with the
+    completed songs as 'updated' and newly found duplicates as 'removed'.
+    Returns the number of songs completed.
+    """
+    from utils.loudness import lower_priority
+
+    if not cache_path:
+        return 0
+    store = open_library_store(cache_path)
+    with _cache_lock:
+        folders, _ = _load_cache(store)
+    tasks = []
+    for root, record in folders.items():
+        for entry in record.get('entries', ()):
+            song = entry['song']
+            if entry.get('deferred') and song:
+                tasks.append((root, entry['deferred'], entry['audio_path'], entry['hash'] is None,
+                              song.get('samplerate') is None))
+    del folders
+    if not tasks:
+        return 0
+
+    pending = {}
+    completed = 0
+
+    def flush():
+        if not pending:
+            return
+        diff = update_details(songs_dir, pending, cache_path)
+        if on_diff and (diff['added'] or diff['removed'] or diff['updated']):
+            on_diff(diff)
+        pending.clear()
+
+    chunksize = max(1, min(64, len(tasks) // (max(1, workers) * 8)))
+    executor = ProcessPoolExecutor(max_workers=max(1, workers), initializer=lower_priority)
+    last_save = time.monotonic()
+    try:
+        for path, details in executor.map(_complete_task, tasks, chunksize=chunksize):
+            pending[path] = details
+            completed += 1
+            if cancel_event and cancel_event.is_set():
+                break
+            if time.monotonic() - last_save >= DETAILS_SAVE_INTERVAL:
+                flush()
+                last_save = time.monotonic()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        flush()
+    print(f"Completing songs from osu!.db {'cancelled' if cancel_event and cancel_event.is_set() else 'complete'}: "
+          f"{completed} of {len(tasks)} songs.")
+    return completed
+
+def analyze_loudness(songs_dir, songs, workers=1, cache_path=CACHE_PATH, on_results=None, cancel_event=None):
+    """
+    Measures the loudness of the songs that have none yet in a pool of
+    low-priority processes. Results are written to the cache every
+    LOUDNESS_SAVE_INTERVAL seconds and when the run stops, so a cancelled
+    run resumes where it left off; on_results({audio_path: loudness})
+    receives each saved batch. Returns the number of tracks analyzed.
+    """
+    from utils.loudness import analyze_task, lower_priority
+
+    paths = list(dict.fromkeys(song['audio_path'] for song in songs if 'loudness' not in song))
+    if not paths:
+        return 0
+
+    pending = {}
+    analyzed = 0
+
+    def flush():
+        if not pending:
+            return
+        if cache_path:
+            update_loudness(songs_dir, pending, cache_path)
+        if on_results:
+            on_results(dict(pending))
+        pending.clear()
+
+    executor = ProcessPoolExecutor(max_workers=max(1, workers), initializer=lower_priority)
+    last_save = time.monotonic()
+    try:
+        for path, loudness in executor.map(analyze_task, paths):
+            pending[path] = loudness
+            analyzed += 1
+            if cancel_event and cancel_event.is_set():
+                break
+            if time.monotonic() - last_save >= LOUDNESS_SAVE_INTERVAL:
+                flush()
+                last_save = time.monotonic()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        flush()
+    print(f"Loudness analysis {'cancelled' if cancel_event and cancel_event.is_set() else 'complete'}: "
+          f"{analyzed} of {len(paths)} tracks.")
+    return analyzed
+
 def format_time(ms):
     if ms is None:
         return "00:00"
@@ -0,0 +1,203 @@
+import re
+import string
+from bisect import bisect_left
+
+# Поля песни, по которым идёт поиск
+SEARCH_FIELDS = ('artist', 'title', 'artist_unicode', 'title_unicode', 'creator', 'source', 'tags')
+# Объединения списков для коротких префиксов кэшируются: "a" совпадает с половиной словаря
+CACHED_PREFIX_LENGTH = 2
+# Нечёткий поиск перебирает варианты с одной правкой только для токенов не короче этого
+FUZZY_MIN_LENGTH = 4
+# Внутри слов токены ищутся по триграммам словаря, поэтому не короче трёх символов
+INFIX_MIN_LENGTH = 3
+
+TOKEN_RE = re.compile(r'\w+')
+FUZZY_ALPHABET = frozenset(string.ascii_lowercase + string.digits)
+
+
+def tokenize(text):
+    """Splits text into casefolded word tokens."""
+    return TOKEN_RE.findall(text.casefold())
+
+
+def song_search_text(song):
+    """All searchable fields of a song joined into one casefolded string."""
+    return ' '.join(str(song.get(field) or '') for field in SEARCH_FIELDS).casefold()
+
+
+def _edits1(word):
+    letters = FUZZY_ALPHABET | set(word)
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    deletes = [a + b[1:] for a, b in splits if b]
+    transposes = [a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1]
+    replaces = [a + c + b[1:] for a, b in splits if b for c in letters]
+    inserts = [a + c + b for a, b in splits for c in letters]
+    return set(deletes + transposes + replaces + inserts)
+
+
+def _trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def _search(tokens, lookup, fuzzy):
+    """
+    Songs matching every query token, sorted. lookup(kind, token) returns
+    the set of songs with a word that starts with token ('prefix'), has it
+    inside ('infix', only for tokens of INFIX_MIN_LENGTH or more) or starts
+    with one of its one-edit variants ('fuzzy').
+
+    A token is looked up by prefix; inside words if no word starts with
+    it; then, with fuzzy, by its variants. When every token matches
+    something but the matches have no song in common, the query is run
+    again with all tokens looked up inside words.
+    """
+    result = _match(tokens, lookup, fuzzy, infix=False)
+    if result is not None and not result:
+        # Префиксы всех токенов нашлись, но не в одних песнях: токен может стоять и внутри слова
+        result = _match(tokens, lookup, fuzzy, infix=True)
+    return sorted(result or ())
+
+
+def _match(tokens, lookup, fuzzy, infix):
+    """
+    Songs matching every token, as a set: empty if the matches do not
+    intersect, None if some token matches nothing at all.
+    """
+    result = None
+    # Сначала самые длинные токены: у них самые короткие списки
+    for token in sorted(tokens, key=len, reverse=True):
+        can_infix = len(token) >= INFIX_MIN_LENGTH
+        matches = lookup('infix', token) if infix and can_infix else lookup('prefix', token)
+        if not matches and not infix and can_infix:
+            matches = lookup('infix', token)
+        if not matches and fuzzy and len(token) >= FUZZY_MIN_LENGTH:
+            matches = lookup('fuzzy', token)
+        if not matches:
+            return None
+        result = matches if result is None else result & matches
+        if not result:
+            return set()
+    return result
+
+
+def linear_search(search_texts, query, fuzzy=False):
+    """
+    Search without an index over precomputed song_search_text strings,
+    with the same matching as SearchIndex.search, so the rows do not change
+    once the index is ready. Returns library indices.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return list(range(len(search_texts)))
+
+    def lookup(kind, token):
+        if kind == 'infix':
+            return {i for i, text in enumerate(search_texts) if token in text}
+        # Начало слова: перед токеном нет буквы или цифры, как у слов из tokenize()
+        if kind == 'prefix':
+            pattern = re.compile(r'\b' + re.escape(token))
+            # Поиск подстроки намного быстрее регулярного выражения, им отсеиваются почти все строки
+            return {i for i, text in enumerate(search_texts) if token in text and pattern.search(text)}
+        variants = _edits1(token)
+        lengths = {len(variant) for variant in variants}
+        # Одна правка портит только одну половину токена, перестановка на стыке половин
+        # даёт отдельный вариант: строки без них не проверяются
+        half = len(token) // 2
+        pieces = (token[:half], token[half:], token[:half - 1] + token[half] + token[half - 1] + token[half + 1:])
+        return {i for i, text in enumerate(search_texts)
+                if any(piece in text for piece in pieces)
+                and any(word[:n] in variants for word in TOKEN_RE.findall(text) for n in lengths)}
+
+    return _search(tokens, lookup, fuzzy)
+
+
+class SearchIndex:
+    """
+    Token/prefix index over the song library. Every word of the searchable
+    fields maps to the sorted library indices that contain it; a query
+    matches the songs that have, for each query token, some word starting
+    with it. Prefix lookups are a bisect into the sorted vocabulary. When
+    prefixes find nothing, tokens are looked up inside words ("yoru" finds
+    "tsukiyoru") through a trigram index of the vocabulary; see _search for
+    the exact rules, which linear_search follows too.
+    """
+
+    def __init__(self, songs):
+        self.songs = songs
+        postings = {}
+        for i, song in enumerate(songs):
+            for token in set(tokenize(song_search_text(song))):
+                postings.setdefault(token, []).append(i)
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+        # Триграмма -> номера слов словаря, в которых она есть
+        trigrams = {}
+        for word_id, word in enumerate(self.vocabulary):
+            for trigram in _trigrams(word):
+                trigrams.setdefault(trigram, []).append(word_id)
+        self.trigrams = trigrams
+        self._prefix_cache = {}
+        # Однобуквенные запросы самые медленные: считаем их заранее, пока индекс строится в фоне
+        for first_char in {token[0] for token in self.vocabulary}:
+            self._prefix_matches(first_char)
+
+    def _prefix_matches(self, prefix):
+        """Library indices of songs with a word starting with prefix, as a set."""
+        cached = self._prefix_cache.get(prefix)
+        if cached is not None:
+            return cached
+        matches = set()
+        vocabulary = self.vocabulary
+        i = bisect_left(vocabulary, prefix)
+        while i < len(vocabulary) and vocabulary[i].startswith(prefix):
+            matches.update(self.postings[vocabulary[i]])
+            i += 1
+        if len(prefix) <= CACHED_PREFIX_LENGTH:
+            self._prefix_cache[prefix] = matches
+        return matches
+
+    def _infix_matches(self, token):
+        """
+        Library indices of songs with a word containing token anywhere
+        ("yoru" in "tsukiyoru"): the words that have all of its trigrams,
+        rarest first, checked for the whole token.
+        """
+        words = None
+        for trigram in sorted(_trigrams(token), key=lambda trigram: len(self.trigrams.get(trigram, ()))):
+            word_ids = self.trigrams.get(trigram)
+            if not word_ids:
+                return set()
+            words = set(word_ids) if words is None else words.intersection(word_ids)
+            if not words:
+                return set()
+        matches = set()
+        for word_id in words:
+            word = self.vocabulary[word_id]
+            if token in word:
+                matches.update(self.postings[word])
+        return matches
+
+    def _fuzzy_matches(self, token):
+        matches = set()
+        for variant in _edits1(token):
+            if variant:
+                matches |= self._prefix_matches(variant)
+        return matches
+
+    def _lookup(self, kind, token):
+        if kind == 'prefix':
+            return self._prefix_matches(token)
+        if kind == 'infix':
+            return self._infix_matches(token)
+        return self._fuzzy_matches(token)
+
+    def search(self, query, fuzzy=False):
+        """
+        Returns the library indices matching query in ascending order. With
+        fuzzy=True a token that matches nothing is retried with every
+        variant one edit away (typos like "camellai").
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return list(range(len(self.songs)))
+        return _search(tokens, self._lookup, fuzzy)
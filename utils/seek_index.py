@@ -0,0 +1,325 @@
+import mmap
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+SEEK_INDEX_FILE = 'seek_index.db'
+# Хранится рядом с кэшем библиотеки
+SEEK_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', SEEK_INDEX_FILE)
+INDEXED_EXTENSIONS = ('.mp3',)
+# В таблицу попадает каждый N-й MP3-фрейм: ~0.2 с между точками входа
+STRIDE_FRAMES = 8
+# Сколько фреймов после точки входа сверяется с обычным декодированием при построении
+CALIBRATION_FRAMES = 24
+# Дальше этого MP3 по заголовкам фреймов не проходится: ~28 минут при 320 кбит/с
+MAX_SCAN_BYTES = 64 * 1024 * 1024
+
+_BITRATES = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLERATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def map_file(f):
+    """Read-only mmap of an open file: scanned through the page cache instead of read into memory."""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def scan_mp3_frames(data, limit=None):
+    """
+    Byte offsets of the Layer III frames in data (bytes or an mmap), and the
+    samples per frame. Frames are followed header to header; only headers
+    matching the first frame's version and sample rate count, so stray sync
+    bytes in tags are skipped. With limit, only the first limit bytes are
+    scanned.
+    """
+    position = 0
+    if data[:3] == b'ID3':
+        position = 10 + ((data[6] & 0x7f) << 21 | (data[7] & 0x7f) << 14 | (data[8] & 0x7f) << 7 | data[9] & 0x7f)
+    offsets = []
+    stream = None
+    end = (len(data) if limit is None else min(len(data), limit)) - 4
+    while position <= end:
+        if data[position] != 0xFF:
+            # До следующего байта синхронизации одним поиском, а не по байту
+            position = data.find(b'\xff', position + 1)
+            if position < 0:
+                break
+            continue
+        if data[position + 1] & 0xE0 != 0xE0:
+            position += 1
+            continue
+        b1, b2 = data[position + 1], data[position + 2]
+        version, layer, bitrate, rate = (b1 >> 3) & 3, (b1 >> 1) & 3, b2 >> 4, (b2 >> 2) & 3
+        if version == 1 or layer != 1 or bitrate in (0, 15) or rate == 3 or (stream and stream != (version, rate)):
+            position += 1
+            continue
+        stream = (version, rate)
+        samplerate = _SAMPLERATES[version][rate]
+        kbps = _BITRATES[3 if version == 3 else 2][bitrate]
+        offsets.append(position)
+        position += (144 if version == 3 else 72) * kbps * 1000 // samplerate + ((b2 >> 1) & 1)
+    samples_per_frame = 1152 if stream and stream[0] == 3 else 576
+    return offsets, samples_per_frame
+
+
+class _OffsetFile:
+    """Read-only file object that shows a file from `offset` on, for decoding from the middle of a stream."""
+
+    def __init__(self, path, offset):
+        self._file = open(path, 'rb')
+        self._offset = offset
+        self._file.seek(offset)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            position += self._offset
+        return self._file.seek(position, whence) - self._offset
+
+    def tell(self):
+        return self._file.tell() - self._offset
+
+    def close(self):
+        self._file.close()
+
+
+class _FrameAlignedReader:
+    """
+    Reads a SoundFile opened in the middle of an MP3 stream. libsndfile
+    mis-decodes such a stream once a read ends inside an MP3 frame, so the
+    file is only ever read in whole frames and the rest is kept for later.
+    """
+
+    def __init__(self, audio_file, samples_per_frame):
+        self.file = audio_file
+        self.samples_per_frame = samples_per_frame
+        self._pending = np.zeros((0, audio_file.channels), dtype=np.float32)
+
+    def read(self, frames, dtype='float32', always_2d=True):
+        while len(self._pending) < frames:
+            wanted = -(-(frames - len(self._pending)) // self.samples_per_frame) * self.samples_per_frame
+            chunk = self.file.read(wanted, dtype='float32', always_2d=True)
+            self._pending = np.concatenate((self._pending, chunk))
+            if len(chunk) < wanted:
+                break
+        chunk, self._pending = self._pending[:frames], self._pending[frames:]
+        return chunk
+
+    def close(self):
+        self.file.close()
+
+
+class SeekTable:
+    """
+    Entry points into one MP3 file. Decoding from frame i's byte offset
+    reproduces the normal decode from track frame i * samples_per_frame -
+    shift on, after prime_frames frames of decoder warm-up (the bit
+    reservoir and the synthesis filter need previous frames).
+    """
+    __slots__ = ('offsets', 'samples_per_frame', 'shift', 'prime_frames')
+
+    def __init__(self, offsets, samples_per_frame, shift, prime_frames):
+        self.offsets = offsets
+        self.samples_per_frame = samples_per_frame
+        self.shift = shift
+        self.prime_frames = prime_frames
+
+    def locate(self, frame):
+        """(byte offset, track frame of its first decoded sample) for the latest entry usable for frame, or None."""
+        span = STRIDE_FRAMES * self.samples_per_frame
+        entry = (frame + self.shift - self.prime_frames * self.samples_per_frame) // span
+        if entry < 1:
+            return None
+        entry = min(entry, len(self.offsets) - 1)
+        return int(self.offsets[entry]), entry * span - self.shift
+
+    def open_at(self, path, frame):
+        """
+        Opens path decoding from `frame` without scanning from the start of
+        the file. Returns a reader with SoundFile's read() and close(), or
+        None when frame is too close to the start for an entry point (a plain
+        seek is cheap there).
+        """
+        located = self.locate(frame)
+        if located is None:
+            return None
+        offset, first_frame = located
+        reader = _FrameAlignedReader(sf.SoundFile(_OffsetFile(path, offset)), self.samples_per_frame)
+        # Остаток до нужного кадра (и разогрев декодера) просто декодируется
+        skip = frame - first_frame
+        while skip > 0:
+            read = len(reader.read(min(skip, 65536)))
+            if not read:
+                break
+            skip -= read
+        return reader
+
+
+def _calibrate(path, offsets, samples_per_frame, entry):
+    """
+    Finds where decoding from the entry's offset lines up with the normal
+    decode: the constant shift (tag frame, encoder and decoder delay) and how
+    many frames of warm-up it takes. None if it never matches exactly.
+    """
+    frame_index = entry * STRIDE_FRAMES
+    check = CALIBRATION_FRAMES * samples_per_frame
+    with sf.SoundFile(_OffsetFile(path, int(offsets[entry]))) as partial:
+        decoded = partial.read(check, dtype='float32', always_2d=True)
+    nominal = frame_index * samples_per_frame
+    # Сдвиг не больше нескольких фреймов: тег Xing/Info плюс задержка кодера
+    search = 4 * samples_per_frame
+    with sf.SoundFile(path) as full:
+        full.seek(max(0, nominal - search))
+        reference = full.read(check + search, dtype='float32', always_2d=True)
+    base = max(0, nominal - search)
+    if len(decoded) < check or len(reference) < check:
+        return None
+
+    # Ищем сдвиг по последнему фрейму, где декодер уже точно прогрет
+    probe_start = check - samples_per_frame
+    probe = decoded[probe_start:]
+    for position in np.nonzero(reference[:, 0] == probe[0, 0])[0]:
+        start = position - probe_start
+        if start < 0 or not np.array_equal(reference[start + probe_start:start + check], probe):
+            continue
+        shift = int(nominal - (base + start))
+        mismatched = np.any(decoded != reference[start:start + check], axis=1)
+        last_bad = np.nonzero(mismatched)[0]
+        prime_frames = int(last_bad[-1]) // samples_per_frame + 1 if len(last_bad) else 0
+        return shift, prime_frames + 1
+    return None
+
+
+def build_seek_table(path):
+    """Scans and calibrates path; None if the file cannot be indexed reliably."""
+    size = os.path.getsize(path)
+    # Слишком длинный файл не индексируется: перемотка в нём идёт обычным декодированием
+    if not size or size > MAX_SCAN_BYTES:
+        return None
+    with open(path, 'rb') as f, map_file(f) as data:
+        offsets, samples_per_frame = scan_mp3_frames(data)
+    entries = np.array(offsets[::STRIDE_FRAMES], dtype=np.uint32)
+    if len(entries) < 8:
+        return None
+    # Калибровка в середине файла, проверка ближе к концу
+    calibrated = _calibrate(path, entries, samples_per_frame, len(entries) // 2)
+    if calibrated is None or calibrated[1] > CALIBRATION_FRAMES - 4:
+        return None
+    verified = _calibrate(path, entries, samples_per_frame, len(entries) * 7 // 8)
+    if verified is None or verified[0] != calibrated[0]:
+        return None
+    shift, prime_frames = calibrated[0], max(calibrated[1], verified[1])
+    return SeekTable(entries, samples_per_frame, shift, prime_frames)
+
+
+class SeekIndex:
+    """
+    Seek tables of the library's compressed tracks, kept in an SQLite file
+    next to the library cache and built on a background thread the first
+    time a track is played or queued. Files that cannot be indexed are
+    remembered too, so they are not rescanned on every play.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS seek_index (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER,
+            size INTEGER,
+            samples_per_frame INTEGER,
+            shift INTEGER,
+            prime_frames INTEGER,
+            offsets BLOB
+        );
+    """
+
+    def __init__(self, path=SEEK_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = set()
+        # База открывается при первом обращении: сеанс без MP3 её не трогает
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SeekIndex")
+
+    @staticmethod
+    def indexable(path):
+        return path.lower().endswith(INDEXED_EXTENSIONS)
+
+    def _connection(self):
+        # Вызывается под self._lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    def _row(self, path):
+        with self._lock:
+            return self._connection().execute(
+                "SELECT mtime_ns, size, samples_per_frame, shift, prime_frames, offsets FROM seek_index WHERE path = ?",
+                (path,)).fetchone()
+
+    def get(self, path):
+        """The SeekTable for path if one was built for the current file, else None."""
+        if not self.indexable(path):
+            return None
+        row = self._row(path)
+        try:
+            if row is None or (row[0], row[1]) != _file_stamp(path) or row[3] is None:
+                return None
+        except OSError:
+            return None
+        return SeekTable(np.frombuffer(row[5], dtype=np.uint32), row[2], row[3], row[4])
+
+    def ensure(self, path):
+        """Schedules building the table for path unless it is up to date."""
+        if not self.indexable(path):
+            return
+        row = self._row(path)
+        try:
+            if row is not None and (row[0], row[1]) == _file_stamp(path):
+                return
+        except OSError:
+            return
+        with self._lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+        self._executor.submit(self._build, path)
+
+    def _build(self, path):
+        try:
+            stamp = _file_stamp(path)
+            table = build_seek_table(path)
+            values = (None, None, None, b'') if table is None else (
+                table.samples_per_frame, table.shift, table.prime_frames, table.offsets.tobytes())
+            with self._lock:
+                with self._connection() as conn:
+                    conn.execute("INSERT OR REPLACE INTO seek_index VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                       (path, *stamp, *values))
+        except Exception as e:
+            print(f"Error building seek index for {path}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+
+    def wait(self):
+        """Blocks until the scheduled builds are done."""
+        self._executor.submit(lambda: None).result()
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
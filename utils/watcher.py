@@ -0,0 +1,290 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import threading
+
+from utils.scanner import MAX_CONTAINER_DEPTH
+
+# --- inotify (Linux) ---
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+SONGS_DIR_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+SET_DIR_MASK = IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _list_set_folders(songs_dir):
+    """Returns {folder path: mtime} for the beatmapset folders directly inside songs_dir."""
+    folders = {}
+    try:
+        with os.scandir(songs_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        folders[entry.path] = entry.stat().st_mtime
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return folders
+
+
+def _list_subfolders(path):
+    """Returns (has .osu files, [subfolder paths]) for a folder; symlinked folders are skipped, as by the scanner."""
+    has_osu = False
+    subfolders = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subfolders.append(entry.path)
+                    elif entry.name.endswith('.osu'):
+                        has_osu = True
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return has_osu, subfolders
+
+
+def _watch_dirs(path, depth):
+    """
+    Yields (folder, depth) for path and the folders under it that the scanner
+    enters (see scanner._walk_sets): the subfolders of folders without .osu
+    files, down to MAX_CONTAINER_DEPTH levels below the Songs directory.
+    """
+    pending = [(path, depth)]
+    while pending:
+        path, depth = pending.pop()
+        yield path, depth
+        if depth < MAX_CONTAINER_DEPTH:
+            has_osu, subfolders = _list_subfolders(path)
+            if depth == 0 or not has_osu:
+                pending.extend((subfolder, depth + 1) for subfolder in subfolders)
+
+
+def _set_folder(songs_dir, path):
+    """The folder directly inside songs_dir that holds path: the unit rescan_folders re-checks."""
+    relative = os.path.relpath(path, songs_dir)
+    return os.path.join(songs_dir, relative.split(os.sep, 1)[0])
+
+
+class _PollingBackend:
+    """
+    Compares the mtimes of the beatmapset folders, and of the folders under
+    the ones without .osu files (packs), on every poll. Only the folders
+    whose mtime changed are listed again. A folder's mtime changes when
+    files are added, removed or renamed in it; files rewritten in place are
+    only noticed by the inotify backend.
+    """
+
+    def __init__(self, songs_dir, poll_interval):
+        self.songs_dir = songs_dir
+        self.poll_interval = poll_interval
+        self.subfolders = {}
+        self.snapshot = self._snapshot({})
+        self.last_poll = time.monotonic()
+
+    def _snapshot(self, previous):
+        """{folder: mtime} for the watched folders; subfolders of unchanged folders come from the last listing."""
+        snapshot = {}
+        pending = [(path, mtime, 1) for path, mtime in _list_set_folders(self.songs_dir).items()]
+        while pending:
+            path, mtime, depth = pending.pop()
+            snapshot[path] = mtime
+            if depth >= MAX_CONTAINER_DEPTH:
+                continue
+            if previous.get(path) != mtime or path not in self.subfolders:
+                has_osu, subfolders = _list_subfolders(path)
+                self.subfolders[path] = [] if has_osu else subfolders
+            for subfolder in self.subfolders[path]:
+                try:
+                    pending.append((subfolder, os.stat(subfolder).st_mtime, depth + 1))
+                except OSError:
+                    continue
+        for path in self.subfolders.keys() - snapshot.keys():
+            del self.subfolders[path]
+        return snapshot
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        if time.monotonic() - self.last_poll < self.poll_interval:
+            return set()
+        self.last_poll = time.monotonic()
+        current = self._snapshot(self.snapshot)
+        changed = {path for path, mtime in current.items() if self.snapshot.get(path) != mtime}
+        changed |= self.snapshot.keys() - current.keys()
+        self.snapshot = current
+        return {_set_folder(self.songs_dir, path) for path in changed}
+
+    def close(self):
+        pass
+
+
+class _InotifyBackend:
+    """
+    Watches songs_dir and the folders the scanner enters under it (see
+    _watch_dirs) with inotify. When the event queue overflows, songs_dir
+    itself is reported: the whole library is then checked against the cache.
+    """
+
+    def __init__(self, songs_dir):
+        import ctypes
+        import ctypes.util
+
+        self.songs_dir = songs_dir
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._ctypes = ctypes
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        try:
+            self._add_watches(songs_dir, 0)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watches(self, path, depth):
+        # Повторный inotify_add_watch для уже наблюдаемой папки возвращает её прежний wd
+        for folder, folder_depth in _watch_dirs(path, depth):
+            self._add_watch(folder, SONGS_DIR_MASK if folder_depth == 0 else SET_DIR_MASK, folder_depth)
+
+    def _add_watch(self, path, mask, depth):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = self._ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            # ENOSPC: закончился лимит fs.inotify.max_user_watches
+            raise OSError(err, f"inotify_add_watch failed for {path}")
+        self.watches[wd] = (path, depth)
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + name_len].rstrip(b'\0')
+            offset += EVENT_HEADER.size + name_len
+
+            if mask & IN_Q_OVERFLOW:
+                # События потеряны: новые папки могли остаться без наблюдения, а удалённые — в библиотеке.
+                # Папка Songs целиком сверяется с кэшем (см. rescan_folders)
+                self._add_watches(self.songs_dir, 0)
+                changed.add(self.songs_dir)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            watched = self.watches.get(wd)
+            if watched is None:
+                continue
+            watched, depth = watched
+            if depth == 0 and not name:
+                continue
+            path = os.path.join(watched, os.fsdecode(name)) if name else watched
+            if (mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and depth < MAX_CONTAINER_DEPTH
+                    and (depth == 0 or not _list_subfolders(watched)[0])):
+                # Распаковка пака: папки внутри появляются раньше, чем на них встаёт наблюдение,
+                # их содержимое найдёт повторная проверка всей папки верхнего уровня
+                self._add_watches(path, depth + 1)
+            changed.add(_set_folder(self.songs_dir, path))
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class SongsWatcher:
+    """
+    Watches the osu! Songs directory in a background thread and reports which
+    beatmapset folders (the folders directly inside it) changed, or the Songs
+    directory itself when changes may have been missed. Bursts of events (e.g. extracting an .osz) are
+    debounced: on_change(folders) is called once the folders have been quiet
+    for `debounce` seconds, or after `max_delay` seconds of constant activity.
+    """
+
+    def __init__(self, songs_dir, on_change, debounce=1.5, max_delay=10.0, poll_interval=5.0):
+        self.songs_dir = songs_dir
+        self.on_change = on_change
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.backend = None
+
+    def start(self):
+        self.backend = self._create_backend()
+        self._thread = threading.Thread(target=self._run, name="SongsWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _create_backend(self):
+        if sys.platform.startswith('linux'):
+            try:
+                return _InotifyBackend(self.songs_dir)
+            except (OSError, AttributeError) as e:
+                print(f"inotify is unavailable, falling back to polling: {e}")
+        return _PollingBackend(self.songs_dir, self.poll_interval)
+
+    def _run(self):
+        pending = set()
+        first_event_at = last_event_at = 0.0
+        try:
+            while not self._stop_event.is_set():
+                timeout = self.debounce if pending else 0.5
+                try:
+                    changed = self.backend.wait(timeout)
+                except OSError as e:
+                    print(f"Songs watcher error, falling back to polling: {e}")
+                    self.backend.close()
+                    self.backend = _PollingBackend(self.songs_dir, self.poll_interval)
+                    continue
+
+                now = time.monotonic()
+                if changed:
+                    if not pending:
+                        first_event_at = now
+                    pending |= changed
+                    last_event_at = now
+
+                if pending and (now - last_event_at >= self.debounce or now - first_event_at >= self.max_delay):
+                    folders, pending = pending, set()
+                    try:
+                        self.on_change(folders)
+                    except Exception as e:
+                        print(f"Error handling library changes: {e}")
+        finally:
+            self.backend.close()